@@ -8,6 +8,7 @@ import shutil
 import click
 
 import splitgraph.commandline as cmd
+from splitgraph.commandline.cache import simulate_c, pin_c, unpin_c, prefetch_c, quota_c
 from splitgraph.commandline.cloud import (
     register_c,
     login_c,
@@ -34,7 +35,7 @@ from splitgraph.commandline.ingestion import csv_export, csv_import
 from splitgraph.config.keys import KEYS, KEY_DOCS, DEFAULTS
 
 STRUCTURE = [
-    ("Image management/creation", ["checkout", "commit", "tag", "import", "reindex"]),
+    ("Image management/creation", ["checkout", "commit", "tag", "import", "reindex", "compact"]),
     ("Image information", ["log", "diff", "object", "objects", "show", "table", "sql", "status"]),
     (
         "Engine management",
@@ -50,6 +51,10 @@ STRUCTURE = [
             "engine version",
         ],
     ),
+    (
+        "Object cache",
+        ["cache pin", "cache unpin", "cache prefetch", "cache quota", "cache simulate"],
+    ),
     ("Data import/export", ["csv export", "csv import", "mount"]),
     ("Miscellaneous", ["rm", "init", "cleanup", "prune", "config", "dump", "eval", "upgrade"]),
     ("Sharing images", ["clone", "push", "pull", "upstream"]),
@@ -81,6 +86,11 @@ STRUCTURE_CMD_OVERRIDE = {
     "engine log": log_engine_c,
     "engine configure": configure_engine_c,
     "engine version": version_engine_c,
+    "cache pin": pin_c,
+    "cache unpin": unpin_c,
+    "cache prefetch": prefetch_c,
+    "cache quota": quota_c,
+    "cache simulate": simulate_c,
     "cloud register": register_c,
     "cloud login": login_c,
     "cloud login-api": login_api_c,
@@ -12,10 +12,18 @@ import click_log
 from click_log import ColorFormatter
 
 from splitgraph.__version__ import __version__
+from splitgraph.commandline.cache import cache_c
 from splitgraph.commandline.cloud import cloud_c
 from splitgraph.commandline.engine import engine_c
 from splitgraph.commandline.example import example
-from splitgraph.commandline.image_creation import checkout_c, commit_c, tag_c, import_c, reindex_c
+from splitgraph.commandline.image_creation import (
+    checkout_c,
+    commit_c,
+    tag_c,
+    import_c,
+    reindex_c,
+    compact_c,
+)
 from splitgraph.commandline.image_info import (
     log_c,
     diff_c,
@@ -148,6 +156,7 @@ cli.add_command(commit_c)
 cli.add_command(tag_c)
 cli.add_command(import_c)
 cli.add_command(reindex_c)
+cli.add_command(compact_c)
 
 # Information
 cli.add_command(log_c)
@@ -162,6 +171,9 @@ cli.add_command(status_c)
 # Engine management
 cli.add_command(engine_c)
 
+# Object cache
+cli.add_command(cache_c)
+
 # Miscellaneous
 cli.add_command(mount_c)
 cli.add_command(rm_c)
@@ -0,0 +1,227 @@
+"""sgr commands related to managing the object cache"""
+
+import click
+
+from splitgraph.commandline.common import ImageType, SizeType
+from splitgraph.config import CONFIG
+
+
+@click.group(name="cache")
+def cache_c():
+    """Manage the object cache on the engine."""
+
+
+@click.command(name="simulate")
+@click.argument("access_log", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "-s",
+    "--cache-size",
+    type=int,
+    help="Cache size in MB (default SG_OBJECT_CACHE_SIZE)",
+    default=lambda: int(CONFIG["SG_OBJECT_CACHE_SIZE"]),
+)
+@click.option(
+    "-p",
+    "--policy",
+    multiple=True,
+    help="Fully qualified class name of an eviction policy to simulate. Can be passed "
+    "multiple times (default SG_EVICTION_POLICY).",
+)
+def simulate_c(access_log, cache_size, policy):
+    """
+    Compare object cache eviction policies.
+
+    This replays a log of accesses to cached objects (recorded by the engine if SG_CACHE_ACCESS_LOG
+    is set) against a simulated object cache for every eviction policy and outputs how many accesses
+    would have been served from the cache without downloading the object.
+
+    For example:
+
+        sgr cache simulate access.log --cache-size 1024 \\
+            -p splitgraph.core.eviction.DecayEvictionPolicy \\
+            -p splitgraph.core.eviction.GDSFEvictionPolicy
+    """
+    from tabulate import tabulate
+    from splitgraph.core.eviction import get_eviction_policy, read_access_log, simulate_eviction
+    from splitgraph.core.output import pretty_size
+
+    policies = policy or [CONFIG["SG_EVICTION_POLICY"]]
+    min_fraction = float(CONFIG["SG_EVICTION_MIN_FRACTION"])
+
+    rows = []
+    for class_name in policies:
+        result = simulate_eviction(
+            get_eviction_policy(class_name),
+            read_access_log(access_log),
+            cache_size * 1024 * 1024,
+            min_fraction,
+        )
+        rows.append(
+            (
+                class_name,
+                "%d/%d (%.2f%%)" % (result.hits, result.accesses, result.hit_ratio * 100),
+                "%s/%s (%.2f%%)"
+                % (
+                    pretty_size(result.bytes_hit),
+                    pretty_size(result.bytes_accessed),
+                    result.byte_hit_ratio * 100,
+                ),
+                result.evictions,
+            )
+        )
+
+    click.echo(tabulate(rows, headers=["Policy", "Hits", "Bytes hit", "Evictions"]))
+
+
+@click.command(name="pin")
+@click.argument("image_spec", type=ImageType(default="latest", get_image=True))
+@click.option(
+    "--download/--no-download",
+    default=True,
+    help="Download the objects required by the image straight away",
+)
+def pin_c(image_spec, download):
+    """
+    Pin an image in the object cache.
+
+    Objects required by tables in the pinned image will never get evicted from the cache,
+    so queries against the image won't have to download them again. This doesn't affect
+    objects that aren't stored externally.
+
+    Examples:
+
+        sgr cache pin noaa/climate:latest
+
+    Pin the image tagged `latest` and download all of its objects.
+
+        sgr cache pin --no-download noaa/climate:latest
+
+    Pin the image without downloading its objects: they will still never get evicted
+    once a query downloads them.
+    """
+    repository, image = image_spec
+    object_manager = repository.objects
+    object_manager.pin_image(image)
+    repository.commit_engines()
+
+    if download:
+        for table_name in image.get_tables():
+            with object_manager.ensure_objects(image.get_table(table_name)):
+                pass
+    click.echo("Pinned %s:%s." % (repository.to_schema(), image.image_hash))
+
+
+@click.command(name="unpin")
+@click.argument("image_spec", type=ImageType(default="latest", get_image=True))
+def unpin_c(image_spec):
+    """
+    Unpin an image from the object cache.
+
+    This doesn't delete the image's objects: they will get evicted when the cache needs space.
+    """
+    repository, image = image_spec
+    repository.objects.unpin_image(image)
+    repository.commit_engines()
+    click.echo("Unpinned %s:%s." % (repository.to_schema(), image.image_hash))
+
+
+@click.command(name="prefetch")
+@click.argument("image_spec", type=ImageType(default="latest", get_image=True))
+@click.argument("table_name", required=False)
+def prefetch_c(image_spec, table_name):
+    """
+    Download objects required by an image into the object cache ahead of time.
+
+    This is useful for warming up the cache before running scheduled queries against a new image.
+    Unlike queries, prefetching never evicts objects from the cache: objects that don't fit into
+    the free space in the cache (or in the repository's quota, see `sgr cache quota`) are skipped.
+    Prefetched objects can be evicted as soon as the cache needs space, unless the image
+    is pinned (see `sgr cache pin`).
+
+    Examples:
+
+        sgr cache prefetch noaa/climate:latest
+
+    Prefetch objects for all tables in the image tagged `latest`.
+
+        sgr cache prefetch noaa/climate:latest rainfall
+
+    Prefetch objects for the `rainfall` table.
+    """
+    from splitgraph.core.output import pluralise
+
+    repository, image = image_spec
+    table_names = [table_name] if table_name else image.get_tables()
+
+    prefetched = []
+    for table_name in table_names:
+        prefetched.extend(repository.objects.prefetch(image.get_table(table_name)))
+    click.echo("Prefetched %s." % pluralise("object", len(prefetched)))
+
+
+@click.command(name="quota")
+@click.argument("repository", required=False)
+@click.argument("quota", type=SizeType(), required=False)
+@click.option("-r", "--remove", is_flag=True, default=False, help="Remove the quota")
+def quota_c(repository, quota, remove):
+    """
+    Manage object cache quotas.
+
+    A quota limits how much space in the object cache can be taken up by objects required by
+    a repository (or all repositories in a namespace). When downloading objects for a repository
+    would exceed its quota, the repository's own objects get evicted instead of objects required
+    by other repositories.
+
+    Examples:
+
+        sgr cache quota
+
+    List all quotas.
+
+        sgr cache quota noaa/climate 10GB
+
+    Limit objects required by noaa/climate to 10GB.
+
+        sgr cache quota noaa 50GB
+
+    Limit objects required by all repositories in the noaa namespace to 50GB.
+
+        sgr cache quota --remove noaa/climate
+
+    Remove the quota on noaa/climate.
+    """
+    from tabulate import tabulate
+    from splitgraph.core.object_manager import ObjectManager
+    from splitgraph.core.output import pretty_size
+    from splitgraph.engine import get_engine
+
+    engine = get_engine()
+    object_manager = ObjectManager(engine)
+
+    if not repository:
+        quotas = object_manager.get_cache_quotas()
+        if quotas:
+            click.echo(
+                tabulate(
+                    [
+                        (namespace + "/" + repository if repository else namespace, pretty_size(q))
+                        for namespace, repository, q in quotas
+                    ],
+                    headers=["Repository", "Quota"],
+                )
+            )
+        return
+
+    if (quota is None) != remove:
+        raise click.UsageError("Either QUOTA or --remove must be specified!")
+
+    namespace, _, repository = repository.partition("/")
+    object_manager.set_cache_quota(namespace, repository, quota)
+    engine.commit()
+
+
+cache_c.add_command(simulate_c)
+cache_c.add_command(pin_c)
+cache_c.add_command(unpin_c)
+cache_c.add_command(prefetch_c)
+cache_c.add_command(quota_c)
@@ -9,6 +9,7 @@ import click
 from click.core import Context, Parameter
 
 from splitgraph.config import REMOTES
+from splitgraph.core.output import parse_size
 from splitgraph.exceptions import RepositoryNotFoundError
 
 if TYPE_CHECKING:
@@ -104,6 +105,20 @@ class JsonType(click.ParamType):
         return load_json_param(value, param, ctx)
 
 
+class SizeType(click.ParamType):
+    """Parser for sizes in bytes that also accepts units (e.g. 64MB)."""
+
+    name = "Size"
+
+    def convert(self, value: str, param: Optional[Parameter], ctx: Optional[Context]) -> int:
+        if isinstance(value, int):
+            return value
+        try:
+            return parse_size(value)
+        except ValueError as e:
+            self.fail(str(e), param, ctx)
+
+
 class Color:
     """
     An enumeration of console colors
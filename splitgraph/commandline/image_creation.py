@@ -6,7 +6,13 @@ from collections import defaultdict
 
 import click
 
-from splitgraph.commandline.common import ImageType, RepositoryType, JsonType, remote_switch_option
+from splitgraph.commandline.common import (
+    ImageType,
+    RepositoryType,
+    JsonType,
+    SizeType,
+    remote_switch_option,
+)
 from splitgraph.config import get_singleton, CONFIG
 from splitgraph.exceptions import TableNotFoundError
 
@@ -26,7 +32,14 @@ from splitgraph.exceptions import TableNotFoundError
     is_flag=True,
     default=False,
 )
-def checkout_c(image_spec, force, uncheckout, layered):
+@click.option(
+    "-w",
+    "--workers",
+    default=1,
+    type=int,
+    help="Number of engine connections to use to materialize each table.",
+)
+def checkout_c(image_spec, force, uncheckout, layered, workers):
     """
     Check out a Splitgraph image into a Postgres schema.
 
@@ -48,6 +61,10 @@ def checkout_c(image_spec, force, uncheckout, layered):
     changes) and removes the HEAD pointer.
 
     If ``--force`` isn't passed and the schema has pending changes, this will fail.
+
+    If ``--workers`` is greater than 1, parts of tables that don't overlap each other are
+    materialized in parallel, each on its own engine connection (up to the size of the
+    connection pool, set by SG_ENGINE_POOL).
     """
     repository, image = image_spec
 
@@ -55,7 +72,7 @@ def checkout_c(image_spec, force, uncheckout, layered):
         repository.uncheckout(force=force)
         click.echo("Unchecked out %s." % (str(repository),))
     else:
-        image.checkout(force=force, layered=layered)
+        image.checkout(force=force, layered=layered, workers=workers)
         click.echo("Checked out %s:%s." % (str(repository), image.image_hash[:12]))
 
 
@@ -77,6 +94,14 @@ def checkout_c(image_spec, force, uncheckout, layered):
     help="Split new tables into chunks of this many rows (by primary key). The default "
     "value is governed by the SG_COMMIT_CHUNK_SIZE configuration parameter.",
 )
+@click.option(
+    "-b",
+    "--chunk-bytes",
+    default=None,
+    type=SizeType(),
+    help="Split new tables into chunks of approximately this size (e.g. 64MB), "
+    "estimated from a sample of the table's rows. Overrides --chunk-size.",
+)
 @click.option(
     "-k",
     "--chunk-sort-keys",
@@ -101,15 +126,24 @@ def checkout_c(image_spec, force, uncheckout, layered):
 @click.option(
     "-o", "--overwrite", is_flag=True, help="Overwrite physical objects that already exist"
 )
+@click.option(
+    "-w",
+    "--workers",
+    default=1,
+    type=int,
+    help="Number of engine connections to use to store chunks of new tables in parallel.",
+)
 def commit_c(
     repository,
     snap,
     chunk_size,
+    chunk_bytes,
     chunk_sort_keys,
     split_changesets,
     index_options,
     message,
     overwrite,
+    workers,
 ):
     """
     Commit changes to a checked-out Splitgraph repository.
@@ -122,12 +156,23 @@ def commit_c(
     that the table will be split into (default is no splitting). The splitting is done by the
     table's primary key.
 
+    Alternatively, `--chunk-bytes` sets the approximate size of the fragments instead. The number of rows
+    per fragment is then chosen for every table based on the average size of a seeded sample of its rows
+    (so the same data always gets split the same way) and is logged at the INFO level, so that it can also
+    be passed to `--chunk-size` to reproduce the commit.
+
     If `--split-changesets` is passed, delta-compressed changes will also be split up according to the original
     table chunk boundaries. For example, if there's a change to the first and the 20000th row of a table that was
     originally committed with `--chunk-size=10000`, this will create 2 fragments: one based on the first chunk
     and one on the second chunk of the table.
 
+    If `--workers` is greater than 1, chunks of tables that are stored as full snapshots are
+    hashed, stored and indexed in parallel, each on its own engine connection (up to the
+    size of the connection pool, set by SG_ENGINE_POOL).
+
     If `--chunk-sort-keys` is passed, data inside the chunk is sorted by this key (or multiple keys).
+    By default, it's sorted by the table's primary key, which costs a sort of every chunk on commit
+    but lets layered queries return rows in the primary key order without sorting them.
     This helps speed up queries on those keys for storage layers than can leverage that (e.g. CStore). The expected format is JSON, e.g. `{table_1: [col_1, col_2]}`
 
     `--index-options` expects a JSON-serialized dictionary of `{table: index_type: column: index_specific_kwargs}`.
@@ -166,6 +211,8 @@ def commit_c(
         extra_indexes=index_options,
         in_fragment_order=chunk_sort_keys,
         overwrite=overwrite,
+        workers=workers,
+        chunk_bytes=chunk_bytes,
     ).image_hash
     click.echo("Committed %s as %s." % (str(repository), new_hash[:12]))
 
@@ -365,3 +412,81 @@ def reindex_c(image_spec, table_name, index_options, ignore_patch_objects):
         extra_indexes=index_options, raise_on_patch_objects=not ignore_patch_objects
     )
     click.echo("Reindexed %s" % pluralise("object", len(reindexed)))
+
+
+@click.command(name="compact")
+@click.argument("image_spec", type=ImageType(default="HEAD", get_image=True))
+@click.argument("table_name", type=str)
+@click.option(
+    "-c",
+    "--chunk-size",
+    default=int(get_singleton(CONFIG, "SG_COMMIT_CHUNK_SIZE")),
+    type=int,
+    help="Split the table into chunks of this many rows (by primary key). The default "
+    "value is governed by the SG_COMMIT_CHUNK_SIZE configuration parameter.",
+)
+@click.option(
+    "-b",
+    "--chunk-bytes",
+    default=None,
+    type=SizeType(),
+    help="Split the table into chunks of approximately this size (e.g. 64MB). "
+    "Overrides --chunk-size.",
+)
+@click.option(
+    "-k",
+    "--chunk-sort-keys",
+    default=None,
+    type=JsonType(),
+    help="Sort the data inside each chunk by this/these key(s), e.g. '[\"col_1\"]'",
+)
+@click.option(
+    "-i",
+    "--index-options",
+    type=JsonType(),
+    help="JSON dictionary of extra indexes to calculate on the new objects.",
+)
+@click.option(
+    "-w",
+    "--workers",
+    default=1,
+    type=int,
+    help="Number of engine connections to use to store the new chunks in parallel.",
+)
+def compact_c(
+    image_spec, table_name, chunk_size, chunk_bytes, chunk_sort_keys, index_options, workers
+):
+    """
+    Rewrite a table as a set of new non-overlapping objects.
+
+    Tables that have had many changes committed to them consist of long chains of objects
+    that overwrite each other's rows. Querying them requires downloading and applying these
+    objects to each other. This command materializes the table and splits it into new
+    objects in the same way as `sgr commit` does for new tables, replacing the objects the
+    table is linked to in the image. The image's hash and contents stay the same.
+
+    The old objects aren't deleted, since other images can still be using them. Run
+    `sgr cleanup` to delete the objects that aren't needed anymore.
+
+    For the explanation of `--chunk-sort-keys` and `--index-options`, see the documentation
+    for `sgr commit` (options here only apply to the single table being compacted).
+
+    Image spec must be of the format ``[NAMESPACE/]REPOSITORY[:HASH_OR_TAG]``. If no tag is specified, ``HEAD`` is used.
+    """
+    from splitgraph.core.output import pluralise
+
+    repository, image = image_spec
+    table = image.get_table(table_name)
+    old_objects = table.objects
+    click.echo("Compacting table %s:%s/%s" % (repository.to_schema(), image.image_hash, table_name))
+    new_objects = table.compact(
+        chunk_size=chunk_size,
+        extra_indexes=index_options,
+        in_fragment_order=chunk_sort_keys,
+        workers=workers,
+        chunk_bytes=chunk_bytes,
+    )
+    click.echo(
+        "Compacted %s into %s"
+        % (pluralise("object", len(old_objects)), pluralise("object", len(new_objects)))
+    )
@@ -288,6 +288,8 @@ def object_c(object_id):
     click.echo("Insertion hash: %s" % sg_object.insertion_hash)
     click.echo("Rows deleted: %s" % sg_object.rows_deleted)
     click.echo("Deletion hash: %s" % sg_object.deletion_hash)
+    if "chunk_size" in sg_object.object_index:
+        click.echo("Chunk size: %d row(s)" % sg_object.object_index["chunk_size"])
     click.echo("Column index:")
     for col_name, col_range in sg_object.object_index["range"].items():
         click.echo("  %s: [%r, %r]" % (col_name, col_range[0], col_range[1]))
@@ -295,6 +297,18 @@ def object_c(object_id):
         click.echo("Bloom index: ")
         for col_name, col_bloom in sg_object.object_index["bloom"].items():
             click.echo("  %s: %s" % (col_name, describe(col_bloom)))
+    if "stats" in sg_object.object_index:
+        click.echo("Column statistics: ")
+        for col_name, col_stats in sg_object.object_index["stats"].items():
+            click.echo(
+                "  %s: %d distinct value(s), %.1f%% NULL, average width %d B"
+                % (
+                    col_name,
+                    col_stats["distinct"],
+                    col_stats["null_frac"] * 100,
+                    col_stats["width"],
+                )
+            )
 
     if object_manager.object_engine.registry:
         # Don't try to figure out the object's location if we're talking
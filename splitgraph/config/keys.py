@@ -29,6 +29,8 @@ DEFAULTS: ConfigDict = {
     # US election dataset build by about 30% (82s -> 56s) for the version that uses FROM IMPORT and
     # by about 50% (101s -> 53s) for the version that runs a single big join against multiple images.
     "SG_LQ_TUNING": "SET enable_sort=off; SET enable_hashagg=on;",
+    "SG_LQ_FETCH_BATCH": "64",
+    "SG_QUERY_PLAN_CACHE_SIZE": "1000",
     "SG_COMMIT_CHUNK_SIZE": "10000",
     "SG_ENGINE_POOL": "16",
     "SG_CONFIG_FILE": "",
@@ -47,6 +49,8 @@ DEFAULTS: ConfigDict = {
     "SG_EVICTION_DECAY": "0.002",
     "SG_EVICTION_FLOOR": "1",
     "SG_EVICTION_MIN_FRACTION": "0.05",
+    "SG_EVICTION_POLICY": "splitgraph.core.eviction.DecayEvictionPolicy",
+    "SG_CACHE_ACCESS_LOG": "",
     "SG_FDW_CLASS": "splitgraph.core.fdw_checkout.QueryingForeignDataWrapper",
     "SG_CMD_ASCII": "false",
     # Some default sections: these can't be overridden via envvars.
@@ -98,6 +102,8 @@ ARGUMENT_KEY_MAP = {
     "--eviction-decay": "SG_EVICTION_DECAY",
     "--eviction-floor": "SG_EVICTION_FLOOR",
     "--eviction-fraction": "SG_EVICTION_MIN_FRACTION",
+    "--eviction-policy": "SG_EVICTION_POLICY",
+    "--cache-access-log": "SG_CACHE_ACCESS_LOG",
     "--fdw-class": "SG_FDW_CLASS",
 }
 
@@ -134,6 +140,8 @@ This can also be changed by passing `--verbosity` to `sgr`, e.g. `sgr --verbosit
     "SG_ENGINE_POSTGRES_DB_NAME": "Name of the default database that the superuser connects to to initialize Splitgraph.",
     "SG_ENGINE_OBJECT_PATH": "Path on the engine's filesystem where Splitgraph physical object files are stored.",
     "SG_LQ_TUNING": "Postgres query planner configuration for Splitfile execution and table imports. This is run before a layered query is executed and allows to tune query planning in case of LQ performance issues. For possible values, see the [PostgreSQL documentation](https://www.postgresql.org/docs/12/runtime-config-query.html).",
+    "SG_LQ_FETCH_BATCH": "Maximum number of objects that layered querying downloads at a time. Objects are downloaded as the query consumes them, starting with one object and doubling the batch size up to this value, so that queries that stop early (e.g. with a `LIMIT`) don't download the whole table. Set to 0 to download all objects a query needs before it starts.",
+    "SG_QUERY_PLAN_CACHE_SIZE": "Maximum number of layered query plans kept in the plan cache shared between all sessions on the engine. Older plans get dropped first. Queries that look up rows by their primary key are never cached. Set to 0 to disable the cache.",
     "SG_COMMIT_CHUNK_SIZE": "Default chunk size when `sgr commit` is run. Can be overriden in the command line client by passing `--chunk-size`",
     "SG_ENGINE_POOL": "Size of the connection pool used to download/upload objects. Note that in the case of layered querying with joins on multiple tables, each table will use this many parallel threads to download objects, which can overwhelm the engine. Decrease this value in that case.",
     "SG_CONFIG_FILE": "Location of the Splitgraph configuration file. By default, Splitgraph looks for the configuration in `~/.splitgraph/.sgconfig` and then the current directory.",
@@ -149,9 +157,11 @@ This can also be changed by passing `--verbosity` to `sgr`, e.g. `sgr --verbosit
     "SG_S3_KEY": "S3 access key.",
     "SG_S3_PWD": "S3 secure key.",
     "SG_OBJECT_CACHE_SIZE": "Object cache size, in megabytes. This only concerns objects downloaded from an external location or a remote engine. When there is no space in the object cache, an eviction is run and objects that haven't been used recently or that are small enough to be easily redownloaded are deleted to free up space.",
-    "SG_EVICTION_DECAY": "Significance of recent usage time and object size in cache eviction. See documentation for splitgraph.core.object_manager for an explanation.",
-    "SG_EVICTION_FLOOR": "Significance of recent usage time and object size in cache eviction. See documentation for splitgraph.core.object_manager for an explanation.",
+    "SG_EVICTION_DECAY": "Significance of recent usage time and object size in cache eviction. See documentation for splitgraph.core.eviction for an explanation.",
+    "SG_EVICTION_FLOOR": "Significance of recent usage time and object size in cache eviction. See documentation for splitgraph.core.eviction for an explanation.",
     "SG_EVICTION_MIN_FRACTION": "Minimum fraction of the total cache size that has to get freed when an eviction is run. This is to avoid frequent evictions.",
+    "SG_EVICTION_POLICY": "Fully qualified name of the class that decides which objects get evicted from the object cache first. `splitgraph.core.eviction.DecayEvictionPolicy` prefers evicting objects that haven't been used recently and that are cheap to redownload. `splitgraph.core.eviction.GDSFEvictionPolicy` (GreedyDual-Size-Frequency) also takes into account how often objects get used, which keeps frequently used objects in the cache when large scans go through it.",
+    "SG_CACHE_ACCESS_LOG": "If set, path to a file that the engine appends accesses to cached objects to. Use `sgr cache simulate` to replay it against different eviction policies.",
     "SG_FDW_CLASS": "Name of the class used by the layered querying foreign data wrapper on the engine. Internal.",
     "SG_CMD_ASCII": "Set to `true` to disable Unicode output in sgr. Note that `sgr sql` will still output Unicode data.",
 }
@@ -36,10 +36,21 @@ META_TABLES = [
     "object_locations",
     "object_cache_status",
     "object_cache_occupancy",
+    "query_plan_cache",
+    "object_cache_pins",
+    "object_cache_quotas",
+    "object_catalog",
     "info",
     "version",
 ]
-OBJECT_MANAGER_TABLES = ["object_cache_status", "object_cache_occupancy"]
+OBJECT_MANAGER_TABLES = [
+    "object_cache_status",
+    "object_cache_occupancy",
+    "query_plan_cache",
+    "object_cache_pins",
+    "object_cache_quotas",
+    "object_catalog",
+]
 _SPLITGRAPH_META_DIR = "resources/splitgraph_meta"
 
 
@@ -365,6 +376,20 @@ def adapt(value: Any, pg_type: str) -> Any:
     return value
 
 
+def get_adapter(pg_type: str) -> Callable[[Any], Any]:
+    """
+    Get a function that coerces values with a PG type into their Python equivalent, for
+    when many values of the same type need to be adapted (see `adapt`).
+
+    :param pg_type: Postgres datatype
+    :return: Function that takes a value and returns the coerced value.
+    """
+    coerce = _TYPE_MAP.get(pg_type)
+    if coerce is None:
+        return lambda value: value
+    return lambda value: None if value is None else coerce(value)
+
+
 class Tracer:
     """
     Accumulates events and returns the times between them.
@@ -0,0 +1,273 @@
+"""
+Object cache eviction policies and a simulator that replays recorded cache accesses
+to compare them offline.
+
+An eviction policy assigns a priority to every object in the cache that can be evicted
+(objects with the smallest priority get evicted first). Policies that need to age objects
+out can use the cache clock: a value stored with the cache that gets recorded for every
+object when it's used and that the policy can advance when objects are evicted.
+
+The policy is set by SG_EVICTION_POLICY.
+"""
+import heapq
+import json
+import math
+from datetime import datetime
+from importlib import import_module
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple, Dict
+
+from splitgraph.config import CONFIG, get_singleton
+from splitgraph.exceptions import ObjectCacheError
+
+
+class CacheEntry(NamedTuple):
+    """Object in the cache as seen by the eviction policy."""
+
+    object_id: str
+    size: int
+    last_used: datetime
+    access_count: int
+    clock: float
+
+
+class CacheAccess(NamedTuple):
+    """Single access to an object recorded in the cache access log."""
+
+    time: datetime
+    object_id: str
+    size: int
+
+
+class EvictionPolicy:
+    """Base class for object cache eviction policies."""
+
+    def get_priority(self, entry: CacheEntry, now: datetime) -> float:
+        """
+        Get the eviction priority of an object. Objects with the lowest priority get evicted first.
+
+        :param entry: Cache entry
+        :param now: Current time
+        """
+        raise NotImplementedError()
+
+    def advance_clock(self, clock: float, evicted_priorities: List[float]) -> float:
+        """
+        Get the new value of the cache clock after some objects have been evicted.
+
+        :param clock: Current value of the clock
+        :param evicted_priorities: Priorities of the evicted objects
+        """
+        return clock
+
+    def choose_evicted(
+        self, entries: Iterable[CacheEntry], required_space: int, now: datetime, clock: float
+    ) -> Tuple[List[str], int, float]:
+        """
+        Choose objects to evict in order to free at least `required_space` (or as much as
+        possible if that's not achievable).
+
+        :param entries: Candidate cache entries
+        :param required_space: Space to free, in bytes
+        :param now: Current time
+        :param clock: Current value of the cache clock
+        :return: List of objects to evict, space they take up and the new value of the clock.
+        """
+        # Only pop as many candidates as we need instead of sorting all of them.
+        heap = [(self.get_priority(e, now), e.object_id, e.size) for e in entries]
+        heapq.heapify(heap)
+
+        to_delete: List[str] = []
+        priorities: List[float] = []
+        freed_space = 0
+        while heap and freed_space < required_space:
+            priority, object_id, size = heapq.heappop(heap)
+            to_delete.append(object_id)
+            priorities.append(priority)
+            freed_space += size
+        return to_delete, freed_space, self.advance_clock(clock, priorities)
+
+
+class DecayEvictionPolicy(EvictionPolicy):
+    """
+    Evict objects so as to minimize P(object is requested again) * (cost of redownloading the object).
+
+    To approximate the probability, this uses an exponential decay function (1 if last_used = now, dropping down
+    to 0 as time since the object's last usage time passes, see SG_EVICTION_DECAY). To approximate the cost,
+    this uses the object's size, floored to a constant (so if the object has size <= floor, the floor value is
+    used instead -- this is to simulate the latency of re-fetching the object, as opposed to the bandwidth).
+    """
+
+    def __init__(self) -> None:
+        self.decay_constant = float(get_singleton(CONFIG, "SG_EVICTION_DECAY"))
+        self.floor = float(get_singleton(CONFIG, "SG_EVICTION_FLOOR")) * 1024 * 1024
+
+    def get_priority(self, entry: CacheEntry, now: datetime) -> float:
+        time_since_used = (now - entry.last_used).total_seconds()
+        time_factor = math.exp(-self.decay_constant * time_since_used)
+        return time_factor * max(entry.size, self.floor)
+
+
+class GDSFEvictionPolicy(EvictionPolicy):
+    """
+    GreedyDual-Size-Frequency: the priority of an object is L + access_count * cost / size,
+    where the cost is the object's size floored to SG_EVICTION_FLOOR and L is the value of
+    the cache clock when the object was last used. When objects are evicted, the clock is
+    advanced to the largest priority among them.
+
+    Objects that get used often stay in the cache even when large scans go through a lot
+    of objects that are only used once. Since the clock only goes up, objects that
+    stop getting used still age out eventually.
+    """
+
+    def __init__(self) -> None:
+        self.floor = float(get_singleton(CONFIG, "SG_EVICTION_FLOOR")) * 1024 * 1024
+
+    def get_priority(self, entry: CacheEntry, now: datetime) -> float:
+        size = max(entry.size, 1)
+        return entry.clock + entry.access_count * max(size, self.floor) / size
+
+    def advance_clock(self, clock: float, evicted_priorities: List[float]) -> float:
+        return max([clock] + evicted_priorities)
+
+
+def get_eviction_policy(class_name: Optional[str] = None) -> EvictionPolicy:
+    """
+    Load and initialize an eviction policy.
+
+    :param class_name: Fully qualified name of the policy class. Default is SG_EVICTION_POLICY.
+    """
+    class_name = class_name or get_singleton(CONFIG, "SG_EVICTION_POLICY")
+    try:
+        index = class_name.rindex(".")
+        policy_class = getattr(import_module(class_name[:index]), class_name[index + 1 :])
+    except (ValueError, AttributeError, ImportError) as e:
+        raise ObjectCacheError("Error loading eviction policy %s" % class_name) from e
+    return policy_class()
+
+
+def read_access_log(path: str) -> Iterator[CacheAccess]:
+    """
+    Read the cache access log written by the object manager (see SG_CACHE_ACCESS_LOG).
+
+    :param path: Path to the log
+    :return: Generator of cache accesses
+    """
+    with open(path, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            access = json.loads(line)
+            yield CacheAccess(
+                time=datetime.strptime(access["time"], "%Y-%m-%dT%H:%M:%S.%f"),
+                object_id=access["object_id"],
+                size=int(access["size"]),
+            )
+
+
+def write_access_log(path: str, accesses: List[CacheAccess]) -> None:
+    """
+    Append cache accesses to the log.
+
+    :param path: Path to the log
+    :param accesses: List of cache accesses
+    """
+    with open(path, "a") as f:
+        for access in accesses:
+            f.write(
+                json.dumps(
+                    {
+                        "time": access.time.strftime("%Y-%m-%dT%H:%M:%S.%f"),
+                        "object_id": access.object_id,
+                        "size": access.size,
+                    }
+                )
+                + "\n"
+            )
+
+
+class SimulationResult(NamedTuple):
+    """Statistics of a simulated cache."""
+
+    accesses: int
+    hits: int
+    bytes_accessed: int
+    bytes_hit: int
+    evictions: int
+
+    @property
+    def hit_ratio(self) -> float:
+        return self.hits / self.accesses if self.accesses else 0.0
+
+    @property
+    def byte_hit_ratio(self) -> float:
+        return self.bytes_hit / self.bytes_accessed if self.bytes_accessed else 0.0
+
+
+def simulate_eviction(
+    policy: EvictionPolicy,
+    accesses: Iterable[CacheAccess],
+    cache_size: int,
+    min_fraction: float = 0.0,
+) -> SimulationResult:
+    """
+    Replay cache accesses against a cache that uses a given eviction policy.
+
+    Objects are assumed to be released as soon as they've been accessed, so every
+    object in the cache can be evicted.
+
+    :param policy: Eviction policy
+    :param accesses: Cache accesses, in chronological order
+    :param cache_size: Cache size, in bytes
+    :param min_fraction: Minimum fraction of the cache to free on every eviction
+        (see SG_EVICTION_MIN_FRACTION)
+    :return: Simulation statistics
+    """
+    entries: Dict[str, CacheEntry] = {}
+    occupancy = 0
+    clock = 0.0
+
+    total = hits = bytes_accessed = bytes_hit = evictions = 0
+    for access in accesses:
+        total += 1
+        bytes_accessed += access.size
+        entry = entries.get(access.object_id)
+        if entry:
+            hits += 1
+            bytes_hit += entry.size
+            entries[access.object_id] = entry._replace(
+                last_used=access.time, access_count=entry.access_count + 1, clock=clock
+            )
+            continue
+
+        if access.size > cache_size:
+            # Same as the object manager, which would fail the query.
+            continue
+
+        if occupancy + access.size > cache_size:
+            required_space = max(
+                occupancy + access.size - cache_size, int(min_fraction * cache_size)
+            )
+            to_delete, freed_space, clock = policy.choose_evicted(
+                entries.values(), required_space, access.time, clock
+            )
+            for object_id in to_delete:
+                del entries[object_id]
+            occupancy -= freed_space
+            evictions += len(to_delete)
+
+        entries[access.object_id] = CacheEntry(
+            object_id=access.object_id,
+            size=access.size,
+            last_used=access.time,
+            access_count=1,
+            clock=clock,
+        )
+        occupancy += access.size
+
+    return SimulationResult(
+        accesses=total,
+        hits=hits,
+        bytes_accessed=bytes_accessed,
+        bytes_hit=bytes_hit,
+        evictions=evictions,
+    )
@@ -63,12 +63,34 @@ class QueryingForeignDataWrapper(ForeignDataWrapper):
 
         # Estimate the number of rows -- several precision levels here:
         #   * Number of rows in the actual fragments (using metadata -- no need to download
-        #   anything) <- you are here
+        #   anything)
+        #   * Number of rows in the fragments multiplied by the selectivity of the qualifiers,
+        #   estimated from per-column statistics in the object index <- you are here
         #   * calling EXPLAIN on all fragments in filtered_objects (might be pretty expensive
         #     and requires the actual fragments to be present)
         #   * reading binary cstore files?
 
-        return plan.estimated_rows, len(columns) * 10
+        return plan.estimated_rows, plan.get_estimated_row_width()
+
+    def can_sort(self, sortkeys):
+        """
+        Method called from the planner to find out which sort keys the FDW can return
+        rows already sorted by (so that the planner doesn't add a Sort node on top of the scan).
+
+        We can do this for a prefix of the primary key if all fragments are stored sorted by it
+        (see Table.get_scan_order).
+
+        :param sortkeys: List of SortKey
+        :return: List of SortKey the FDW can sort on
+        """
+        scan_order = self.table.get_scan_order()
+        supported = []
+        for key, column in zip(sortkeys, scan_order):
+            # Primary keys can't be NULL, so we don't have to care about where NULLs go.
+            if key.attname != column or key.is_reversed:
+                break
+            supported.append(key)
+        return supported
 
     def explain(self, quals, columns, sortkeys=None, verbose=False):
         cnf_quals = self._quals_to_cnf(quals)
@@ -80,10 +102,13 @@ class QueryingForeignDataWrapper(ForeignDataWrapper):
             o.size for o in self.table.repository.objects.get_object_meta(filtered_objects).values()
         )
 
-        return [
+        result = [
             "Objects removed by filter: %d" % (len(all_objects) - len(filtered_objects)),
             "Scan through %d object(s) (%s)" % (len(filtered_objects), pretty_size(total_size)),
         ]
+        if sortkeys:
+            result.append("Objects scanned in order of %s" % ", ".join(k.attname for k in sortkeys))
+        return result
 
     def get_path_keys(self):
         # Return the PK of the table (unique path something)
@@ -108,7 +133,10 @@ class QueryingForeignDataWrapper(ForeignDataWrapper):
 
         log_to_postgres("CNF quals: %r" % (cnf_quals,), _PG_LOGLEVEL)
 
-        queries, self.end_scan_callback, self.plan = self.table.query_indirect(columns, cnf_quals)
+        # If Postgres wants the rows sorted, it will only pass the sort keys that can_sort accepted.
+        queries, self.end_scan_callback, self.plan = self.table.query_indirect(
+            columns, cnf_quals, ordered=bool(sortkeys)
+        )
         yield from queries
 
     def end_scan(self):
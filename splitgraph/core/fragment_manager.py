@@ -7,30 +7,65 @@ import itertools
 import json
 import logging
 import math
-import operator
 import struct
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from functools import reduce
 from hashlib import sha256
+from io import StringIO
 from random import getrandbits
-from typing import Any, Dict, List, Optional, Set, Tuple, Union, TYPE_CHECKING, cast
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+    TYPE_CHECKING,
+    cast,
+)
 
 from psycopg2.errors import UniqueViolation
-from psycopg2.sql import SQL, Identifier
+from psycopg2.sql import SQL, Composable, Identifier
 from tqdm import tqdm
 
-from splitgraph.config import SPLITGRAPH_API_SCHEMA, SG_CMD_ASCII
-from splitgraph.core.indexing.bloom import generate_bloom_index, filter_bloom_index
+from splitgraph.config import SPLITGRAPH_API_SCHEMA, SG_CMD_ASCII, CONFIG, get_singleton
+from splitgraph.core.indexing.bloom import (
+    generate_bloom_index,
+    filter_bloom_index,
+    generate_bloom_index_from_values,
+)
 from splitgraph.core.indexing.range import (
     generate_range_index,
     filter_range_index,
+    filter_range_index_meta,
+    get_range_index_columns,
+    range_index_aggregates,
+    pk_bounds_aggregates,
+    finalize_range_index,
+    _strip_type_mod,
+    SCAN_ORDER_TYPES,
+)
+from splitgraph.core.indexing.stats import (
+    generate_column_stats,
+    column_stats_aggregates,
+    finalize_column_stats,
 )
 from splitgraph.core.metadata_manager import MetadataManager, Object
+from splitgraph.core.output import pretty_size
 from splitgraph.core.types import Changeset, TableSchema
 from splitgraph.engine import ResultShape
-from splitgraph.engine.postgres.engine import SG_UD_FLAG, add_ud_flag_column, get_change_key
+from splitgraph.engine.postgres.engine import (
+    SG_UD_FLAG,
+    add_ud_flag_column,
+    chunk,
+    get_change_key,
+)
 from splitgraph.exceptions import SplitGraphError
-from .common import adapt, SPLITGRAPH_META_SCHEMA
+from .common import adapt, coerce_val_to_json, get_adapter, SPLITGRAPH_META_SCHEMA
 from .sql import select
 
 if TYPE_CHECKING:
@@ -47,9 +82,11 @@ def _split_changeset(
     changesets_by_segment: List[Changeset] = [{} for _ in range(len(min_max))]
     before_changesets = {}
     after_changesets = {}
+    # Look up the coercion functions for the PK columns once instead of for every value.
+    adapters = [get_adapter(p[1]) for p in table_pks]
     for pk, data in changeset.items():
-        pk = tuple(adapt(v, p[1]) for v, p in zip(pk, table_pks))
-        if min_max[0][0] is None or pk < min_max[0][0]:
+        pk = tuple(a(v) for v, a in zip(pk, adapters))
+        if not min_max or min_max[0][0] is None or pk < min_max[0][0]:
             before_changesets[pk] = data
             continue
         if pk > min_max[-1][1]:
@@ -60,6 +97,44 @@ def _split_changeset(
     return changesets_by_segment, before_changesets, after_changesets
 
 
+def get_pk_lookup_keys(quals: Any, table_pks: List[Tuple[str, str]]) -> Optional[List[Tuple]]:
+    """
+    If the qualifiers (in CNF) restrict every PK column to a list of values (with clauses like
+    `pk = 1` or `pk = 1 OR pk = 2`, e.g. from `pk IN (1, 2)`), return the PKs that the query
+    can match.
+
+    :param quals: List of qualifiers in CNF.
+    :param table_pks: List of tuples (column, type) that form the table's PK.
+    :return: List of PKs or None if the query isn't a lookup of a limited number of PKs.
+    """
+    if not quals or not table_pks:
+        return None
+    values: Dict[str, List[Any]] = {}
+    for or_quals in quals:
+        if or_quals and all(q[1] == "=" and q[0] == or_quals[0][0] for q in or_quals):
+            values.setdefault(or_quals[0][0], [q[2] for q in or_quals])
+
+    column_values: List[List[Any]] = []
+    total_keys = 1
+    for column, _ in table_pks:
+        if column not in values or None in values[column]:
+            return None
+        column_values.append(values[column])
+        total_keys *= len(values[column])
+    if total_keys > _MAX_PK_LOOKUP_KEYS:
+        return None
+
+    try:
+        keys = [
+            tuple(adapt(v, t) for v, (_, t) in zip(key, table_pks))
+            for key in itertools.product(*column_values)
+        ]
+    except (TypeError, ValueError, ArithmeticError):
+        return None
+    # Deduplicate the keys but keep them in order
+    return list(dict.fromkeys(keys))
+
+
 def _log_commit_progress(table_size, no_chunks):
     """Shim to avoid sgr spamming output with commit progress for small images"""
     return table_size > 500000 or no_chunks > 100
@@ -126,6 +201,109 @@ def get_chunk_groups(chunks: List[Tuple[str, Any, Any]],) -> List[List[Tuple[str
     return [[c[1:] for c in sorted(chunks)] for chunks in groups]
 
 
+class PKIntervalIndex:
+    """
+    In-memory index of the primary key ranges of a table's fragments that can find fragments
+    and groups of fragments that overlap a given range of primary keys without scanning
+    through all fragment boundaries.
+
+    Fragments are split into non-overlapping groups (see `get_chunk_groups`) once, when the
+    index is built. Since the groups are disjoint, they're ordered both by their minimum
+    and their maximum PK and can be bisected.
+    """
+
+    def __init__(
+        self,
+        fragments: Sequence[str],
+        min_max: Sequence[Tuple[Any, Any]],
+        table_pks: Optional[List[Tuple[str, str]]] = None,
+    ) -> None:
+        """
+        :param fragments: List of object IDs
+        :param min_max: List of (min, max) PKs of every object, as returned by `get_min_max_pks`
+        :param table_pks: List of tuples (column, type) that form the object PK.
+        """
+        self.table_pks = table_pks or []
+        self.boundaries: Dict[str, Tuple[Any, Any]] = {
+            f: (mm[0], mm[1]) for f, mm in zip(fragments, min_max)
+        }
+        self.groups: List[List[Tuple[str, Any, Any]]] = (
+            get_chunk_groups([(f, mm[0], mm[1]) for f, mm in zip(fragments, min_max)])
+            if fragments
+            else []
+        )
+        self.group_boundaries: List[Tuple[Any, Any]] = [
+            (min(start for _, start, _ in group), max(end for _, _, end in group))
+            for group in self.groups
+        ]
+        self._group_mins = [b[0] for b in self.group_boundaries]
+        self._group_maxs = [b[1] for b in self.group_boundaries]
+        self._fragment_groups = {
+            fragment: group_id
+            for group_id, group in enumerate(self.groups)
+            for fragment, _, _ in group
+        }
+
+    def get_overlapping_groups(self, start: Any, end: Any) -> range:
+        """
+        Get indices of groups that overlap the closed PK interval [start, end].
+        """
+        return range(
+            bisect.bisect_left(self._group_maxs, start), bisect.bisect_right(self._group_mins, end)
+        )
+
+    def get_fragments(self, start: Any, end: Any) -> List[str]:
+        """
+        Get all fragments whose PK ranges overlap the closed interval [start, end].
+        """
+        return [
+            fragment
+            for group_id in self.get_overlapping_groups(start, end)
+            for fragment, fragment_start, fragment_end in self.groups[group_id]
+            if fragment_start <= end and fragment_end >= start
+        ]
+
+    def group_fragments(self, fragments: Sequence[str]) -> List[List[Tuple[str, Any, Any]]]:
+        """
+        Combine a subset of the indexed fragments into independent groups. This gives
+        the same result as `get_chunk_groups` but only has to regroup fragments from
+        the same precomputed group.
+
+        :param fragments: List of object IDs (must be in the index)
+        :return: List of lists of (chunk_id, start, end)
+        """
+        fragments_by_group: Dict[int, List[Tuple[str, Any, Any]]] = {}
+        for fragment in fragments:
+            start, end = self.boundaries[fragment]
+            fragments_by_group.setdefault(self._fragment_groups[fragment], []).append(
+                (fragment, start, end)
+            )
+
+        result: List[List[Tuple[str, Any, Any]]] = []
+        for group_id in sorted(fragments_by_group):
+            group = fragments_by_group[group_id]
+            if len(group) == 1:
+                result.append(group)
+            else:
+                # Dropping fragments from a group can split it into several groups.
+                result.extend(get_chunk_groups(group))
+        return result
+
+
+# Maximum number of PKs a query can look up for us to resolve it through the PK interval index.
+_MAX_PK_LOOKUP_KEYS = 1000
+
+# Number of row digests to unpack at a time when summing them up in bulk.
+_DIGEST_BATCH_SIZE = 65536
+
+# Changesets with more pending changes than this get processed in batches of this many
+# primary keys, each one stored as a separate fragment.
+_CHANGESET_BATCH_SIZE = 100000
+
+# Number of rows to sample to estimate the average row width when choosing the chunk size.
+_CHUNK_SIZE_SAMPLE_ROWS = 10000
+
+
 class Digest:
     """
     Homomorphic hashing similar to LtHash (but limited to being backed by 256-bit hashes). The main property is that
@@ -161,6 +339,27 @@ class Digest:
         # Unpack the buffer as 16 signed big-endian shortints.
         return cls(struct.unpack(">16H", memory))
 
+    @classmethod
+    def from_memoryviews(cls, memories: Iterable[Union[bytes, memoryview]]) -> "Digest":
+        """
+        Create a Digest that's the sum of multiple 256-bit memoryviews/bytearrays.
+
+        This is equivalent to adding up `Digest.from_memoryview` of each one of them but doesn't
+        create an intermediate Digest for every row: digests are concatenated into a contiguous
+        buffer in batches, unpacked in one go and every component is summed up separately.
+        """
+        shorts = [0] * 16
+        memories = iter(memories)
+        while True:
+            buffer = b"".join(itertools.islice(memories, _DIGEST_BATCH_SIZE))
+            if not buffer:
+                break
+            assert len(buffer) % 32 == 0
+            values = struct.unpack(">%dH" % (len(buffer) // 2), buffer)
+            for i in range(16):
+                shorts[i] += sum(values[i::16])
+        return cls(tuple(s & 0xFFFF for s in shorts))
+
     @classmethod
     def from_hex(cls, hex_string: str) -> "Digest":
         """Create a Digest from a 64-characters (256-bit) hexadecimal string"""
@@ -187,6 +386,39 @@ class Digest:
 ExtraIndexInfo = Dict[str, Union[List[str], Dict[str, Dict[str, Any]]]]
 
 
+def _get_index_options(
+    extra_indexes: Optional[ExtraIndexInfo],
+) -> Tuple[Optional[List[str]], Dict[str, Dict[str, Any]]]:
+    """
+    Validate the extra index options.
+
+    :return: List of columns to run the range index on (None meaning all columns)
+        and a dictionary of {column: bloom index kwargs}.
+    """
+    extra_indexes = extra_indexes or {}
+
+    # Default None, meaning run range index on all columns.
+    range_index_columns: Optional[List[str]]
+    try:
+        range_index_columns = list(extra_indexes["range"])
+    except KeyError:
+        range_index_columns = None
+
+    bloom_indexes: Dict[str, Dict[str, Any]] = {}
+    for index_name, index_cols in extra_indexes.items():
+        if index_name == "range":
+            continue
+        if index_name != "bloom":
+            raise ValueError("Unsupported index type %s!" % index_name)
+        if isinstance(index_cols, list):
+            raise ValueError(
+                "Unexpected options for index 'bloom': "
+                "got list, expected dictionary {column: {probability/size: ...}}!"
+            )
+        bloom_indexes = index_cols
+    return range_index_columns, bloom_indexes
+
+
 class FragmentManager(MetadataManager):
     """
     A storage engine for Splitgraph tables. Each table can be stored as one or more immutable fragments that can
@@ -207,6 +439,49 @@ class FragmentManager(MetadataManager):
         super().__init__(metadata_engine)
         self.object_engine = object_engine
 
+        # Whether the object engine can sum up row digests itself (lazily checked).
+        self._engine_hashing: Optional[bool] = None
+
+    def _supports_engine_hashing(self) -> bool:
+        if self._engine_hashing is None:
+            self._engine_hashing = cast(
+                bool,
+                self.object_engine.run_sql(
+                    "SELECT to_regprocedure(%s) IS NOT NULL",
+                    (SPLITGRAPH_API_SCHEMA + ".lthash_sum(bytea)",),
+                    return_shape=ResultShape.ONE_ONE,
+                ),
+            )
+        return self._engine_hashing
+
+    def _sum_row_digests(
+        self, digest_query: Composable, args: Optional[Sequence[Any]] = None
+    ) -> Tuple[Digest, int]:
+        """
+        Sum up the row digests returned by a query.
+
+        :param digest_query: Query returning one sha256 digest per row
+        :param args: Arguments to the query
+        :return: `Digest` object and the number of rows.
+        """
+        if self._supports_engine_hashing():
+            # Aggregate the digests on the engine and only get the final hash back.
+            content_hash, row_count = self.object_engine.run_sql(
+                SQL("SELECT {}.lthash_sum(d), count(d) FROM (").format(
+                    Identifier(SPLITGRAPH_API_SCHEMA)
+                )
+                + digest_query
+                + SQL(") q(d)"),
+                args,
+                return_shape=ResultShape.ONE_MANY,
+            )
+            return Digest.from_hex(content_hash), row_count
+
+        row_digests = self.object_engine.run_sql(
+            digest_query, args, return_shape=ResultShape.MANY_ONE
+        )
+        return Digest.from_memoryviews(row_digests), len(row_digests)
+
     def generate_object_index(
         self,
         object_id: str,
@@ -215,7 +490,8 @@ class FragmentManager(MetadataManager):
         extra_indexes: Optional[ExtraIndexInfo] = None,
     ) -> Dict[str, Any]:
         """
-        Queries the max/min values of a given fragment for each column, used to speed up querying.
+        Queries the max/min values of a given fragment for each column, used to speed up querying,
+        and calculates statistics on the same columns, used to estimate the selectivity of queries.
 
         :param object_id: ID of an object
         :param table_schema: Schema of the table the object belongs to.
@@ -223,43 +499,27 @@ class FragmentManager(MetadataManager):
         :param extra_indexes: Dictionary of {index_type: column: index_specific_kwargs}.
         :return: Dict containing the object index.
         """
-        extra_indexes: ExtraIndexInfo = extra_indexes or {}
-
-        # Default None, meaning run range index on all columns.
-        range_index_columns: Optional[List[str]]
-        try:
-            range_index_columns = list(extra_indexes["range"])
-        except KeyError:
-            range_index_columns = None
+        range_index_columns, bloom_indexes = _get_index_options(extra_indexes)
         range_index: Dict[str, Any] = generate_range_index(
             self.object_engine, object_id, table_schema, changeset, columns=range_index_columns
         )
-        indexes = {"range": range_index}
-
-        # Process extra indexes
-        for index_name, index_cols in extra_indexes.items():
-            if index_name == "range":
-                continue
-            if index_name != "bloom":
-                raise ValueError("Unsupported index type %s!" % index_name)
-            if isinstance(index_cols, list):
-                raise ValueError(
-                    "Unexpected options for index 'bloom': "
-                    "got list, expected dictionary {column: {probability/size: ...}}!"
-                )
+        indexes = {
+            "range": range_index,
+            "stats": generate_column_stats(
+                self.object_engine, object_id, table_schema, columns=range_index_columns
+            ),
+        }
 
+        if bloom_indexes:
             index_dict = {}
-            for index_col, index_kwargs in index_cols.items():
+            for index_col, index_kwargs in bloom_indexes.items():
                 logging.debug(
-                    "Running index %s on column %s with parameters %r",
-                    index_name,
-                    index_col,
-                    index_kwargs,
+                    "Running index bloom on column %s with parameters %r", index_col, index_kwargs,
                 )
                 index_dict[index_col] = generate_bloom_index(
                     self.object_engine, object_id, changeset, index_col, **index_kwargs
                 )
-            indexes[index_name] = index_dict
+            indexes["bloom"] = index_dict
 
         return indexes
 
@@ -274,6 +534,7 @@ class FragmentManager(MetadataManager):
         rows_deleted: int,
         changeset: Optional[Changeset] = None,
         extra_indexes: Optional[ExtraIndexInfo] = None,
+        object_index: Optional[Dict[str, Any]] = None,
     ) -> None:
         """
         Registers a Splitgraph object in the object tree and indexes it
@@ -290,9 +551,14 @@ class FragmentManager(MetadataManager):
             are used to generate the min/max index for an object to know if it removes/updates some rows
             that might be pertinent to a query.
         :param extra_indexes: Dictionary of {index_type: column: index_specific_kwargs}.
+        :param object_index: Object index, if it's already been calculated (in which case
+            `changeset` and `extra_indexes` are ignored).
         """
         object_size = self.object_engine.get_object_size(object_id)
-        object_index = self.generate_object_index(object_id, table_schema, changeset, extra_indexes)
+        if object_index is None:
+            object_index = self.generate_object_index(
+                object_id, table_schema, changeset, extra_indexes
+            )
         self.register_objects(
             [
                 Object(
@@ -349,23 +615,46 @@ class FragmentManager(MetadataManager):
 
         # Horror alert: we hash newly created tables by essentially calling digest(row::text) in Postgres and
         # we don't really know how it turns some types to strings. So instead we give Postgres all of its deleted
-        # rows back and ask it to hash them for us in the same way.
-        inner_tuple = "(" + ",".join("%s::" + c.pg_type for c in table_schema) + ")"
-        query = (
-            "SELECT digest(o::text, 'sha256') FROM (VALUES "
-            + ",".join(itertools.repeat(inner_tuple, len(rows)))
-            + ") o"
+        # rows back and ask it to hash them for us in the same way. To keep the size of the query bounded,
+        # the rows are streamed into a temporary table as JSON through COPY and turned back into records
+        # of the table's type on the engine.
+        # Build both the values and the record type from the same column order (by ordinal
+        # position) so that the record text matches what Postgres hashes for stored rows.
+        ordered_schema = sorted(table_schema)
+        column_names = [c.name for c in ordered_schema]
+        tmp_table = get_temporary_table_id()
+        self.object_engine.run_sql(
+            SQL("CREATE TEMPORARY TABLE {} (row_data jsonb)").format(Identifier(tmp_table))
         )
+        for batch in chunk(rows, _DIGEST_BATCH_SIZE):
+            self.object_engine.copy_from_stream(
+                StringIO(
+                    "".join(
+                        # Escape backslashes for COPY's text format (json.dumps already
+                        # escapes all other control characters).
+                        json.dumps(coerce_val_to_json(dict(zip(column_names, row)))).replace(
+                            "\\", "\\\\"
+                        )
+                        + "\n"
+                        for row in batch
+                    )
+                ),
+                "pg_temp",
+                tmp_table,
+            )
 
-        # By default (e.g. for changesets where nothing was deleted) we use a 0 hash (since adding it to any other
-        # hash has no effect).
-        digests = self.object_engine.run_sql(
-            query, [o for row in rows for o in row], return_shape=ResultShape.MANY_ONE
+        record_spec = SQL(",").join(
+            Identifier(c.name) + SQL(" " + c.pg_type) for c in ordered_schema
         )
-        return (
-            reduce(operator.add, map(Digest.from_memoryview, digests), Digest.empty()),
-            len(digests),
+        result = self._sum_row_digests(
+            SQL(
+                "SELECT digest(o::text, 'sha256') FROM pg_temp.{}, jsonb_to_record(row_data) AS o("
+            ).format(Identifier(tmp_table))
+            + record_spec
+            + SQL(")")
         )
+        self.object_engine.delete_table("pg_temp", tmp_table)
+        return result
 
     def _store_changesets(
         self,
@@ -387,6 +676,7 @@ class FragmentManager(MetadataManager):
         :return: List of created object IDs.
         """
         object_ids = []
+        fragment_order = self._get_fragment_order(in_fragment_order, table.table_schema)
         logging.info("Storing and indexing table %s", table.table_name)
         for sub_changeset in tqdm(
             changesets, unit="objs", ascii=SG_CMD_ASCII, disable=len(changesets) < 3
@@ -415,9 +705,9 @@ class FragmentManager(MetadataManager):
                     Identifier("pg_temp"), Identifier(tmp_object_id)
                 )
 
-                if in_fragment_order:
+                if fragment_order:
                     source_query += SQL(" ") + self._get_order_by_clause(
-                        in_fragment_order, table.table_schema
+                        fragment_order, table.table_schema
                     )
 
                 self.object_engine.store_object(
@@ -432,6 +722,12 @@ class FragmentManager(MetadataManager):
                 # actually registering it. Hence, we still want to proceed trying to register
                 # it no matter what.
 
+            object_index = self.generate_object_index(
+                object_id, table.table_schema, sub_changeset, extra_indexes
+            )
+            if fragment_order:
+                object_index["order"] = fragment_order
+
             # Same here: if we are being called as part of a commit and an object
             # already exists, we'll roll back everything that the caller has done
             # (e.g. registering the new image) if we don't have a savepoint.
@@ -443,10 +739,9 @@ class FragmentManager(MetadataManager):
                         insertion_hash=insertion_hash.hex(),
                         deletion_hash=deletion_hash.hex(),
                         table_schema=table.table_schema,
-                        changeset=sub_changeset,
-                        extra_indexes=extra_indexes,
                         rows_inserted=rows_inserted,
                         rows_deleted=rows_deleted,
+                        object_index=object_index,
                     )
                 except UniqueViolation:
                     logging.info(
@@ -503,11 +798,7 @@ class FragmentManager(MetadataManager):
             )
             + SQL(" WHERE o.{} = true").format(Identifier(SG_UD_FLAG))
         )
-        row_digests = self.object_engine.run_sql(digest_query, return_shape=ResultShape.MANY_ONE)
-        insertion_hash = reduce(
-            operator.add, (Digest.from_memoryview(r) for r in row_digests), Digest.empty()
-        )
-        return insertion_hash, len(row_digests)
+        return self._sum_row_digests(digest_query)
 
     def record_table_as_patch(
         self,
@@ -538,75 +829,121 @@ class FragmentManager(MetadataManager):
         # this will help (for a query pk=5000 we don't need to fetch a 2000-row fragment) but maybe at that point
         # it's time to rewrite the table altogether?
 
-        # Accumulate the diff in-memory. This might become a bottleneck in the future.
-        changeset: Changeset = {}
-        _conflate_changes(
-            changeset,
-            cast(
-                List[Tuple[Tuple[str, ...], bool, Dict[str, Any], Dict[str, Any]]],
-                self.object_engine.get_pending_changes(schema, old_table.table_name),
-            ),
-        )
-        self.object_engine.discard_pending_changes(schema, old_table.table_name)
         current_objects = old_table.objects
-
         new_schema_spec = new_schema_spec or old_table.table_schema
-        if changeset:
-            if split_changeset:
+
+        group_boundaries: List[Tuple[Any, Any]] = []
+        table_pks: List[Tuple[str, str]] = []
+
+        def _split(changeset: Changeset) -> List[Changeset]:
+            if not split_changeset:
+                return [changeset]
+            if not group_boundaries:
                 logging.debug("Splitting changesets")
                 # Reorganize the current table's fragments into non-overlapping groups
                 # and split the changeset to make sure it doesn't span (and hence merge) them.
-                table_pks = self.object_engine.get_change_key(schema, old_table.table_name)
-                min_max = self.get_min_max_pks(current_objects, table_pks)
-
-                groups = get_chunk_groups(
-                    [(o, mm[0], mm[1]) for o, mm in zip(current_objects, min_max)]
-                )
-                group_boundaries = [
-                    (min(min_pk for _, min_pk, _ in group), max(max_pk for _, _, max_pk in group))
-                    for group in groups
-                ]
+                table_pks.extend(self.object_engine.get_change_key(schema, old_table.table_name))
+                pk_intervals = old_table.get_pk_intervals()
+                if pk_intervals.table_pks != table_pks:
+                    # The checked out table's PK is different from the one we've indexed
+                    # the old table by.
+                    pk_intervals = PKIntervalIndex(
+                        current_objects,
+                        self.get_min_max_pks(current_objects, table_pks),
+                        table_pks,
+                    )
+                group_boundaries.extend(pk_intervals.group_boundaries)
+            matched, before, after = _split_changeset(changeset, group_boundaries, table_pks)
+            return [before] + matched + [after]
 
-                matched, before, after = _split_changeset(changeset, group_boundaries, table_pks)
-                changesets = [before] + matched + [after]
-            else:
-                changesets = [changeset]
+        pending_changes = sum(
+            c
+            for _, c in self.object_engine.get_pending_changes(
+                schema, old_table.table_name, aggregate=True
+            )
+        )
 
-            # Store the changesets and find out their object IDs.
-            object_ids = self._store_changesets(
-                old_table,
-                changesets,
-                schema,
-                extra_indexes,
-                in_fragment_order=in_fragment_order,
-                overwrite=overwrite,
+        object_ids: List[str] = []
+        if pending_changes > _CHANGESET_BATCH_SIZE:
+            # Large changesets: stream the changes ordered by PK, conflating them as we go,
+            # and store them in batches so that the client doesn't have to hold the whole
+            # changeset in memory.
+            logging.info(
+                "Processing %d pending changes to %s in batches",
+                pending_changes,
+                old_table.table_name,
             )
-            # Finally, link the table to the new set of objects.
-            self.register_tables(
-                old_table.repository,
-                [
-                    (
-                        image_hash,
-                        old_table.table_name,
-                        new_schema_spec,
-                        old_table.objects + object_ids,
+            for changeset in self._stream_changesets(schema, old_table.table_name):
+                object_ids.extend(
+                    self._store_changesets(
+                        old_table,
+                        _split(changeset),
+                        schema,
+                        extra_indexes,
+                        in_fragment_order=in_fragment_order,
+                        overwrite=overwrite,
                     )
-                ],
-            )
+                )
         else:
-            # Changes in the audit log cancelled each other out. Point the image to the same old objects.
-            self.register_tables(
-                old_table.repository,
-                [(image_hash, old_table.table_name, new_schema_spec, old_table.objects)],
+            changeset: Changeset = {}
+            _conflate_changes(
+                changeset,
+                cast(
+                    List[Tuple[Tuple[str, ...], bool, Dict[str, Any], Dict[str, Any]]],
+                    self.object_engine.get_pending_changes(schema, old_table.table_name),
+                ),
             )
+            if changeset:
+                # Store the changesets and find out their object IDs.
+                object_ids = self._store_changesets(
+                    old_table,
+                    _split(changeset),
+                    schema,
+                    extra_indexes,
+                    in_fragment_order=in_fragment_order,
+                    overwrite=overwrite,
+                )
+        self.object_engine.discard_pending_changes(schema, old_table.table_name)
+
+        # Finally, link the table to the new set of objects. If the changes in the audit log
+        # cancelled each other out, this points the image to the same old objects.
+        self.register_tables(
+            old_table.repository,
+            [(image_hash, old_table.table_name, new_schema_spec, current_objects + object_ids)],
+        )
+
+    def _stream_changesets(self, schema: str, table: str) -> Iterator[Changeset]:
+        """
+        Conflate pending changes to a table in batches of at most `_CHANGESET_BATCH_SIZE` primary keys.
+        Since the engine returns all changes to a given primary key together, each batch is
+        fully conflated (no later batch can change the same key).
+        """
+        changeset: Changeset = {}
+        for _, changes in itertools.groupby(
+            self.object_engine.get_pending_changes_by_pk(
+                schema, table, batch_size=_CHANGESET_BATCH_SIZE
+            ),
+            key=lambda c: c[0],
+        ):
+            if len(changeset) >= _CHANGESET_BATCH_SIZE:
+                yield changeset
+                changeset = {}
+            _conflate_changes(changeset, list(changes))
+        if changeset:
+            yield changeset
 
     def get_min_max_pks(
-        self, fragments: List[str], table_pks: List[Tuple[str, str]]
+        self,
+        fragments: List[str],
+        table_pks: List[Tuple[str, str]],
+        object_meta: Optional[Dict[str, Object]] = None,
     ) -> List[Tuple[Tuple, Tuple]]:
         """Get PK ranges for given fragments using the index (without reading the fragments).
 
         :param fragments: List of object IDs (must be registered and with the same schema)
         :param table_pks: List of tuples (column, type) that form the object PK.
+        :param object_meta: Previously loaded metadata for the fragments. If not specified,
+            the ranges are fetched from the metadata engine.
 
         :return: List of (min, max) PK for every fragment where PK is a tuple.
             If a fragment doesn't exist or doesn't have a corresponding index entry,
@@ -615,23 +952,33 @@ class FragmentManager(MetadataManager):
         # If the PK isn't composite, we can read the range for the corresponding column
         # from the index, otherwise, the indexer stored the min/max tuple under $pk.
         pk = table_pks[0][0] if len(table_pks) == 1 else "$pk"
-        fields = SQL("object_id, index #>> '{{range,{0},0}}', index #>> '{{range,{0},1}}'").format(
-            Identifier(pk)
-        )
 
-        result = {
-            r[0]: (r[1], r[2])
-            for r in self.metadata_engine.run_chunked_sql(
-                select(
-                    "get_object_meta",
-                    fields.as_string(self.metadata_engine.connection),
-                    table_args="(%s)",
-                    schema=SPLITGRAPH_API_SCHEMA,
-                ),
-                (fragments,),
-                chunk_position=0,
-            )
-        }
+        result: Dict[str, Tuple[Any, Any]]
+        if object_meta is not None:
+            result = {}
+            for fragment in fragments:
+                if fragment not in object_meta:
+                    continue
+                pk_range = object_meta[fragment].object_index.get("range", {}).get(pk)
+                result[fragment] = tuple(pk_range) if pk_range else (None, None)
+        else:
+            fields = SQL(
+                "object_id, index #>> '{{range,{0},0}}', index #>> '{{range,{0},1}}'"
+            ).format(Identifier(pk))
+
+            result = {
+                r[0]: (r[1], r[2])
+                for r in self.metadata_engine.run_chunked_sql(
+                    select(
+                        "get_object_meta",
+                        fields.as_string(self.metadata_engine.connection),
+                        table_args="(%s)",
+                        schema=SPLITGRAPH_API_SCHEMA,
+                    ),
+                    (fragments,),
+                    chunk_position=0,
+                )
+            }
 
         # Since the PK can't contain a NULL, if we do get one here, it's from the JSON query
         # (column doesn't exist in the index).
@@ -645,8 +992,8 @@ class FragmentManager(MetadataManager):
                 raise SplitGraphError("No index found for object %s!" % fragment)
             if pk == "$pk":
                 # For composite PKs, we're given back a JSON array and need to load it.
-                min_pk = tuple(json.loads(min_pk))
-                max_pk = tuple(json.loads(max_pk))
+                min_pk = tuple(json.loads(min_pk) if isinstance(min_pk, str) else min_pk)
+                max_pk = tuple(json.loads(max_pk) if isinstance(max_pk, str) else max_pk)
             else:
                 # Single-column PKs still need to be returned as tuples.
                 min_pk = (min_pk,)
@@ -691,14 +1038,100 @@ class FragmentManager(MetadataManager):
             digest_query += SQL(" WHERE {} = %s").format(Identifier(chunk_id_col))
             args = [chunk_id]
 
-        row_digests = self.object_engine.run_sql(
-            digest_query, args, return_shape=ResultShape.MANY_ONE
+        content_hash, row_count = self._sum_row_digests(digest_query, args)
+        return content_hash.hex(), row_count
+
+    def calculate_fragment_stats(
+        self,
+        schema: str,
+        table: str,
+        table_schema: TableSchema,
+        chunk_id_col: Optional[str] = None,
+        chunk_id: Optional[int] = None,
+        extra_indexes: Optional[ExtraIndexInfo] = None,
+    ) -> Tuple[str, int, Dict[str, Any]]:
+        """
+        Calculates the homomorphic hash, the number of rows and the index of table contents
+        in a single scan. This is equivalent to calling `calculate_content_hash` on the table
+        and `generate_object_index` on an object storing it (which would read the data
+        once for the hash, once for the range index, twice more for composite primary keys,
+        once for every bloom-indexed column and once for column statistics).
+
+        :param schema: Schema the table belongs to
+        :param table: Name of the table
+        :param table_schema: Schema of the table
+        :param chunk_id_col: Column the table is partitioned on
+        :param chunk_id: Column value to get rows from
+        :param extra_indexes: Dictionary of {index_type: column: index_specific_kwargs}.
+        :return: A 64-character (256-bit) hexadecimal string with the content hash of the table,
+            the number of rows in the hash and the object index.
+        """
+        range_index_columns, bloom_indexes = _get_index_options(extra_indexes)
+        object_pk, columns_to_index, column_types = get_range_index_columns(
+            table_schema, range_index_columns
         )
+        composite_pk = len(object_pk) > 1
 
-        return (
-            reduce(operator.add, (Digest.from_memoryview(r) for r in row_digests)).hex(),
-            len(row_digests),
+        row_digest = (
+            SQL("digest((")
+            + SQL(",").join(Identifier(c.name) for c in table_schema)
+            + SQL(")::text, 'sha256'::text)")
         )
+        engine_hashing = self._supports_engine_hashing()
+        if engine_hashing:
+            hash_sql = SQL("{}.lthash_sum(").format(Identifier(SPLITGRAPH_API_SCHEMA))
+        else:
+            hash_sql = SQL("array_agg(")
+
+        query = SQL("SELECT COUNT(*),") + hash_sql + row_digest + SQL(")")
+        if columns_to_index:
+            query += SQL(",") + range_index_aggregates(columns_to_index, column_types)
+        if composite_pk:
+            query += SQL(",") + pk_bounds_aggregates(object_pk, column_types)
+        for bloom_col in bloom_indexes:
+            query += SQL(",array_agg(DISTINCT coalesce({}::text, 'NULL'))").format(
+                Identifier(bloom_col)
+            )
+        if columns_to_index:
+            query += SQL(",") + column_stats_aggregates(columns_to_index, column_types)
+        query += SQL(" FROM {}.{} o").format(Identifier(schema), Identifier(table))
+
+        args = None
+        if chunk_id_col:
+            query += SQL(" WHERE {} = %s").format(Identifier(chunk_id_col))
+            args = [chunk_id]
+
+        result = list(self.object_engine.run_sql(query, args, return_shape=ResultShape.ONE_MANY))
+
+        row_count = result.pop(0)
+        content_hash = result.pop(0)
+        if engine_hashing:
+            content_hash = content_hash or Digest.empty().hex()
+        else:
+            content_hash = Digest.from_memoryviews(content_hash or []).hex()
+
+        index: Dict[str, Any] = {}
+        for column in columns_to_index:
+            index[column] = (result.pop(0), result.pop(0))
+        if composite_pk:
+            index["$pk"] = (
+                tuple(result.pop(0) for _ in object_pk),
+                tuple(result.pop(0) for _ in object_pk),
+            )
+        object_index: Dict[str, Any] = {
+            "range": finalize_range_index(index, None, columns_to_index, column_types)
+        }
+
+        if bloom_indexes:
+            object_index["bloom"] = {
+                column: generate_bloom_index_from_values(
+                    result.pop(0) or [], None, column, **index_kwargs
+                )
+                for column, index_kwargs in bloom_indexes.items()
+            }
+        object_index["stats"] = finalize_column_stats(result, row_count, columns_to_index)
+
+        return content_hash, row_count, object_index
 
     def create_base_fragment(
         self,
@@ -711,7 +1144,42 @@ class FragmentManager(MetadataManager):
         in_fragment_order: Optional[List[str]] = None,
         overwrite: bool = False,
         table_schema: Optional[TableSchema] = None,
+        chunk_size: Optional[int] = None,
     ) -> str:
+        object_id, object_meta = self._store_base_fragment(
+            source_schema,
+            source_table,
+            chunk_id_col=chunk_id_col,
+            chunk_id=chunk_id,
+            extra_indexes=extra_indexes,
+            in_fragment_order=in_fragment_order,
+            overwrite=overwrite,
+            table_schema=table_schema,
+            chunk_size=chunk_size,
+        )
+        self._register_base_fragment(object_id, namespace, object_meta)
+        return object_id
+
+    def _store_base_fragment(
+        self,
+        source_schema: str,
+        source_table: str,
+        chunk_id_col: Optional[str] = None,
+        chunk_id: Optional[int] = None,
+        extra_indexes: Optional[ExtraIndexInfo] = None,
+        in_fragment_order: Optional[List[str]] = None,
+        overwrite: bool = False,
+        table_schema: Optional[TableSchema] = None,
+        chunk_size: Optional[int] = None,
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Store a base fragment on the object engine without registering it.
+
+        :param chunk_size: Number of rows per chunk the table was split into, recorded
+            in the object index so that the split can be reproduced.
+        :return: Object ID and the arguments to `_register_object` for it
+            (apart from the namespace).
+        """
         if source_schema == "pg_temp" and not table_schema:
             raise ValueError(
                 "Cannot infer the schema of temporary tables, " "pass in table_schema!"
@@ -728,9 +1196,15 @@ class FragmentManager(MetadataManager):
         ]
 
         schema_hash = self._calculate_schema_hash(table_schema)
-        # Get content hash for this chunk.
-        content_hash, rows_inserted = self.calculate_content_hash(
-            source_schema, source_table, table_schema, chunk_id_col=chunk_id_col, chunk_id=chunk_id
+        # Get content hash for this chunk. Since the object will store the same rows,
+        # also calculate its index in the same pass rather than reading the object back.
+        content_hash, rows_inserted, object_index = self.calculate_fragment_stats(
+            source_schema,
+            source_table,
+            table_schema,
+            chunk_id_col=chunk_id_col,
+            chunk_id=chunk_id,
+            extra_indexes=extra_indexes,
         )
 
         # Object IDs are also used to key tables in Postgres so they can't be more than 63 characters.
@@ -755,10 +1229,12 @@ class FragmentManager(MetadataManager):
                 source_query += SQL("WHERE {} = %s").format(Identifier(chunk_id_col))
                 source_query_args = [chunk_id]
 
-            if in_fragment_order:
-                source_query += SQL(" ") + self._get_order_by_clause(
-                    in_fragment_order, table_schema
-                )
+            fragment_order = self._get_fragment_order(in_fragment_order, table_schema)
+            if fragment_order:
+                source_query += SQL(" ") + self._get_order_by_clause(fragment_order, table_schema)
+                object_index["order"] = fragment_order
+            if chunk_size:
+                object_index["chunk_size"] = chunk_size
             self.object_engine.store_object(
                 object_id=object_id,
                 source_query=source_query,
@@ -766,28 +1242,38 @@ class FragmentManager(MetadataManager):
                 source_query_args=source_query_args,
                 overwrite=overwrite,
             )
+        return (
+            object_id,
+            dict(
+                insertion_hash=content_hash,
+                deletion_hash="0" * 64,
+                table_schema=table_schema,
+                rows_inserted=rows_inserted,
+                rows_deleted=0,
+                object_index=object_index,
+            ),
+        )
+
+    def _register_base_fragment(
+        self, object_id: str, namespace: str, object_meta: Dict[str, Any]
+    ) -> None:
         with self.metadata_engine.savepoint("object_register"):
             try:
-                self._register_object(
-                    object_id,
-                    namespace=namespace,
-                    insertion_hash=content_hash,
-                    deletion_hash="0" * 64,
-                    table_schema=table_schema,
-                    extra_indexes=extra_indexes,
-                    rows_inserted=rows_inserted,
-                    rows_deleted=0,
-                )
+                self._register_object(object_id, namespace=namespace, **object_meta)
             except UniqueViolation:
                 # Someone registered this object (perhaps a concurrent pull) already.
-                logging.info(
-                    "Object %s for table %s/%s already exists, continuing...",
-                    object_id,
-                    source_schema,
-                    source_table,
-                )
+                logging.info("Object %s already exists, continuing...", object_id)
 
-        return object_id
+    @staticmethod
+    def _get_fragment_order(
+        in_fragment_order: Optional[List[str]], table_schema: TableSchema
+    ) -> List[str]:
+        # Unless asked otherwise, store rows inside fragments sorted by the primary key
+        # (so that the LQ FDW can return them in this order without sorting them).
+        # The order is recorded in the object index. This costs a sort of every fragment
+        # when it's stored: fragments are small enough for it to usually run in memory,
+        # and tables without a primary key skip it.
+        return in_fragment_order or [c.name for c in table_schema if c.is_pk]
 
     @staticmethod
     def _get_order_by_clause(in_fragment_order, table_schema):
@@ -816,6 +1302,8 @@ class FragmentManager(MetadataManager):
         extra_indexes: Optional[ExtraIndexInfo] = None,
         in_fragment_order: Optional[List[str]] = None,
         overwrite: bool = False,
+        workers: int = 1,
+        chunk_bytes: Optional[int] = None,
     ) -> List[str]:
         """
         Copies the full table verbatim into one or more new base fragments and registers them.
@@ -829,6 +1317,15 @@ class FragmentManager(MetadataManager):
         :param extra_indexes: Dictionary of {index_type: column: index_specific_kwargs}.
         :param in_fragment_order: Key to sort data inside each chunk by.
         :param overwrite: Overwrite physical objects that already exist.
+        :param workers: If greater than 1 and the table is split into multiple chunks, store
+            and index the chunks in parallel using this many pooled connections (at most
+            SG_ENGINE_POOL - 1). Since the
+            workers run in their own transactions, the source table must be visible
+            to other sessions.
+        :param chunk_bytes: If specified, overrides `chunk_size` with a number of rows
+            that would make each chunk approximately this many bytes large, estimated
+            from a sample of the table. The resulting number of rows is recorded in the
+            index of every chunk (as `chunk_size`), so that the split can be reproduced.
         """
         source_schema = source_schema or repository.to_schema()
         source_table = source_table or table_name
@@ -840,6 +1337,17 @@ class FragmentManager(MetadataManager):
             return_shape=ResultShape.ONE_ONE,
         )
 
+        if chunk_bytes and table_size:
+            chunk_size = self.estimate_chunk_size(
+                source_schema, source_table, table_size, chunk_bytes
+            )
+            logging.info(
+                "Using a chunk size of %d row(s) for table %s (target %s per chunk)",
+                chunk_size,
+                table_name,
+                pretty_size(chunk_bytes),
+            )
+
         table_schema = self.object_engine.get_full_table_schema(source_schema, source_table)
         if chunk_size and table_size:
             object_ids = self._chunk_table(
@@ -851,6 +1359,8 @@ class FragmentManager(MetadataManager):
                 extra_indexes,
                 in_fragment_order=in_fragment_order,
                 overwrite=overwrite,
+                workers=workers,
+                record_chunk_size=bool(chunk_bytes),
             )
 
         elif table_size:
@@ -871,6 +1381,35 @@ class FragmentManager(MetadataManager):
         self.register_tables(repository, [(image_hash, table_name, table_schema, object_ids)])
         return object_ids
 
+    def estimate_chunk_size(
+        self, source_schema: str, source_table: str, table_size: int, chunk_bytes: int
+    ) -> int:
+        """
+        Estimate how many rows of a table fit into a chunk of a given size. This samples
+        the table and uses the average size of sampled rows as returned by pg_column_size
+        (so this doesn't take cstore compression into account).
+
+        The sample is seeded, so the same table contents always result in the same chunk size.
+
+        :param source_schema: Schema the table is in
+        :param source_table: Table name
+        :param table_size: Number of rows in the table
+        :param chunk_bytes: Target chunk size, in bytes
+        :return: Number of rows per chunk
+        """
+        query = SQL("SELECT avg(pg_column_size(t.*)) FROM {}.{} t").format(
+            Identifier(source_schema), Identifier(source_table)
+        )
+        args: List[Any] = []
+        if table_size > _CHUNK_SIZE_SAMPLE_ROWS:
+            query += SQL(" TABLESAMPLE BERNOULLI (%s) REPEATABLE (0)")
+            args.append(100.0 * _CHUNK_SIZE_SAMPLE_ROWS / table_size)
+
+        row_size = self.object_engine.run_sql(query, args, return_shape=ResultShape.ONE_ONE)
+        if not row_size:
+            return table_size
+        return max(int(chunk_bytes // float(row_size)), 1)
+
     def _chunk_table(
         self,
         repository: "Repository",
@@ -882,12 +1421,13 @@ class FragmentManager(MetadataManager):
         table_schema: Optional[TableSchema] = None,
         in_fragment_order: Optional[List[str]] = None,
         overwrite: bool = False,
+        workers: int = 1,
+        record_chunk_size: bool = False,
     ) -> List[str]:
         table_pk = [p[0] for p in self.object_engine.get_change_key(source_schema, source_table)]
         table_schema = table_schema or self.object_engine.get_full_table_schema(
             source_schema, source_table
         )
-        object_ids = []
 
         # We need to do multiple things here in a specific way to not tank the performance:
         #  * Chunk the table up ordering by PK (or potentially another chunk key in the future)
@@ -917,10 +1457,8 @@ class FragmentManager(MetadataManager):
         # out of it into CStore. The first part takes 50 seconds, the second takes 16 seconds
         # and after that extracting a chunk takes a few seconds.
 
-        temp_table = "sg_tmp_partition_" + source_table
         chunk_id_col = "sg_tmp_partition_id"
 
-        pk_sql = SQL(",").join(Identifier(p) for p in table_pk)
         # Example query: CREATE TEMPORARY TABLE sg_tmp_partition_table AS SELECT *,
         # RANK () OVER (ORDER BY pk) / chunk_size sg_tmp_partition_id FROM source_schema.table
         logging.info("Processing table %s", source_table)
@@ -929,37 +1467,9 @@ class FragmentManager(MetadataManager):
         log_progress = _log_commit_progress(table_size, no_chunks)
         log_func = logging.info if log_progress else logging.debug
 
-        log_func("Computing table partitions")
-        tmp_table_query = (
-            SQL("CREATE TEMPORARY TABLE {} AS SELECT *, (ROW_NUMBER() OVER (ORDER BY ").format(
-                Identifier(temp_table)
-            )
-            + pk_sql
-            + SQL(") - 1) / %s {} FROM {}.{}").format(
-                Identifier(chunk_id_col), Identifier(source_schema), Identifier(source_table)
-            )
-        )
-        self.object_engine.run_sql(tmp_table_query, (chunk_size,))
-
-        log_func("Indexing the partition key")
-        self.object_engine.run_sql(
-            SQL("CREATE INDEX {} ON {}({})").format(
-                Identifier("idx_" + temp_table), Identifier(temp_table), Identifier(chunk_id_col)
-            )
-        )
-
-        log_func("Storing and indexing the table")
-        pbar = tqdm(
-            range(0, no_chunks),
-            unit="objs",
-            total=no_chunks,
-            ascii=SG_CMD_ASCII,
-            disable=not log_progress,
-        )
-
-        for chunk_id in pbar:
-            new_fragment = self.create_base_fragment(
-                "pg_temp",
+        def _create_chunk(temp_schema: str, temp_table: str, chunk_id: int) -> str:
+            return self.create_base_fragment(
+                temp_schema,
                 temp_table,
                 repository.namespace,
                 chunk_id_col=chunk_id_col,
@@ -968,14 +1478,150 @@ class FragmentManager(MetadataManager):
                 table_schema=table_schema,
                 in_fragment_order=in_fragment_order,
                 overwrite=overwrite,
+                chunk_size=chunk_size if record_chunk_size else None,
+            )
+
+        def _progress(iterable):
+            return tqdm(
+                iterable,
+                unit="objs",
+                total=no_chunks,
+                ascii=SG_CMD_ASCII,
+                disable=not log_progress,
             )
-            object_ids.append(new_fragment)
+
+        # Leave one pooled connection for the main thread.
+        workers = min(workers, int(get_singleton(CONFIG, "SG_ENGINE_POOL")) - 1)
+        if workers > 1 and no_chunks > 1 and source_schema != "pg_temp":
+            # Parallel mode: other connections can't see our temporary tables (or anything
+            # that we haven't committed yet), so the staging table is an unlogged table in
+            # splitgraph_meta that's created and dropped in its own transactions. Every chunk
+            # is then hashed and stored on a separate pooled connection.
+            # Object IDs only depend on the chunk contents and tpe.map returns results
+            # in order, so this produces the same objects as the sequential path.
+            # The workers only commit the physical objects: they get registered in the main
+            # transaction, so a failed commit doesn't leave registered objects behind (unregistered
+            # ones get deleted by `sgr cleanup`) and workers don't wait on objects that the main
+            # transaction has registered but not committed.
+            temp_table = get_temporary_table_id()
+
+            def _in_own_transaction(func, *args):
+                try:
+                    result = func(*args)
+                    self.object_engine.commit()
+                    return result
+                except Exception:
+                    self.object_engine.rollback()
+                    raise
+
+            def _store_chunk(chunk_id: int) -> Tuple[str, Dict[str, Any]]:
+                return self._store_base_fragment(
+                    SPLITGRAPH_META_SCHEMA,
+                    temp_table,
+                    chunk_id_col=chunk_id_col,
+                    chunk_id=chunk_id,
+                    extra_indexes=extra_indexes,
+                    table_schema=table_schema,
+                    in_fragment_order=in_fragment_order,
+                    overwrite=overwrite,
+                    chunk_size=chunk_size if record_chunk_size else None,
+                )
+
+            try:
+                with ThreadPoolExecutor(max_workers=workers) as tpe:
+                    log_func("Computing table partitions")
+                    tpe.submit(
+                        _in_own_transaction,
+                        self._create_partition_table,
+                        source_schema,
+                        source_table,
+                        SPLITGRAPH_META_SCHEMA,
+                        temp_table,
+                        table_pk,
+                        chunk_id_col,
+                        chunk_size,
+                    ).result()
+
+                    try:
+                        log_func("Storing and indexing the table using %d workers", workers)
+                        stored = list(
+                            _progress(
+                                tpe.map(
+                                    lambda c: _in_own_transaction(_store_chunk, c),
+                                    range(no_chunks),
+                                )
+                            )
+                        )
+                    finally:
+                        tpe.submit(
+                            _in_own_transaction,
+                            self.object_engine.delete_table,
+                            SPLITGRAPH_META_SCHEMA,
+                            temp_table,
+                        ).result()
+            finally:
+                self.object_engine.close_others()
+
+            for object_id, object_meta in stored:
+                self._register_base_fragment(object_id, repository.namespace, object_meta)
+            return [object_id for object_id, _ in stored]
+
+        temp_table = "sg_tmp_partition_" + source_table
+        log_func("Computing table partitions")
+        self._create_partition_table(
+            source_schema, source_table, "pg_temp", temp_table, table_pk, chunk_id_col, chunk_size,
+        )
+
+        log_func("Storing and indexing the table")
+        object_ids = [_create_chunk("pg_temp", temp_table, c) for c in _progress(range(no_chunks))]
 
         # Temporary tables get deleted at the end of tx but sometimes we might run
         # multiple sg operations in the same transaction and clash.
         self.object_engine.delete_table("pg_temp", temp_table)
         return object_ids
 
+    def _create_partition_table(
+        self,
+        source_schema: str,
+        source_table: str,
+        target_schema: str,
+        target_table: str,
+        table_pk: List[str],
+        chunk_id_col: str,
+        chunk_size: int,
+    ) -> None:
+        """
+        Copy a table into a staging table, numbering its chunks by the primary key
+        in `chunk_id_col` and indexing on that column. If `target_schema` is `pg_temp`,
+        the staging table is created as a TEMPORARY table, otherwise as an UNLOGGED one.
+        """
+        pk_sql = SQL(",").join(Identifier(p) for p in table_pk)
+        if target_schema == "pg_temp":
+            create_sql = SQL("CREATE TEMPORARY TABLE {}").format(Identifier(target_table))
+        else:
+            create_sql = SQL("CREATE UNLOGGED TABLE {}.{}").format(
+                Identifier(target_schema), Identifier(target_table)
+            )
+
+        tmp_table_query = (
+            create_sql
+            + SQL(" AS SELECT *, (ROW_NUMBER() OVER (ORDER BY ")
+            + pk_sql
+            + SQL(") - 1) / %s {} FROM {}.{}").format(
+                Identifier(chunk_id_col), Identifier(source_schema), Identifier(source_table)
+            )
+        )
+        self.object_engine.run_sql(tmp_table_query, (chunk_size,))
+
+        self.object_engine.run_sql(
+            SQL("CREATE INDEX {} ON {}.{}({})").format(
+                Identifier("idx_" + target_table),
+                Identifier(target_schema),
+                Identifier(target_table),
+                Identifier(chunk_id_col),
+            )
+        )
+
     def filter_fragments(self, object_ids: List[str], table: "Table", quals: Any) -> List[str]:
         """
         Performs fuzzy filtering on the given object IDs using the index and a set of qualifiers, discarding
@@ -1000,10 +1646,38 @@ class FragmentManager(MetadataManager):
 
         column_types = {c[1]: c[2] for c in table.table_schema}
 
+        # If the query is a lookup of a few PKs, we can find the fragments
+        # that might contain it without checking every fragment's index.
+        # The fragments' PK ranges are compared with the keys in Python, so this only works
+        # for PKs whose types are ordered the same way in Python as on the engine.
+        table_pks = get_change_key(table.table_schema)
+        pk_keys = (
+            get_pk_lookup_keys(quals, table_pks)
+            if all(_strip_type_mod(t) in SCAN_ORDER_TYPES for _, t in table_pks)
+            else None
+        )
+        if pk_keys is not None:
+            pk_intervals = table.get_pk_intervals()
+            pk_candidates = {o for k in pk_keys for o in pk_intervals.get_fragments(k, k)}
+            logging.info("PK lookup matched %d/%d fragment(s)", len(pk_candidates), len(object_ids))
+            object_ids = [o for o in object_ids if o in pk_candidates]
+
+        # Use the indexes the table has already loaded (in one query) where possible
+        # and only go to the engine for qualifiers we can't check ourselves.
+        object_meta = table.get_object_meta()
+        missing = [o for o in object_ids if o not in object_meta]
+        if missing:
+            object_meta = {**object_meta, **self.get_object_meta(missing)}
+        object_indexes = {o: object_meta[o].object_index for o in object_ids if o in object_meta}
+
         # Run the range filter
-        range_filter_result = filter_range_index(
-            self.metadata_engine, object_ids, quals, column_types
+        range_filter_result, incomplete = filter_range_index_meta(
+            object_indexes, object_ids, quals, column_types
         )
+        if incomplete and range_filter_result:
+            range_filter_result = filter_range_index(
+                self.metadata_engine, range_filter_result, quals, column_types
+            )
         if len(range_filter_result) < len(object_ids):
             logging.info(
                 "Range filter discarded %d/%d fragment(s)",
@@ -1013,7 +1687,9 @@ class FragmentManager(MetadataManager):
 
         # Run other filters: currently we can attempt to run the bloom filter
         # if the fragment metadata has bloom fingerprints.
-        bloom_filter_result = filter_bloom_index(self.metadata_engine, range_filter_result, quals)
+        bloom_filter_result = filter_bloom_index(
+            self.metadata_engine, range_filter_result, quals, object_indexes
+        )
         if len(bloom_filter_result) < len(range_filter_result):
             logging.info(
                 "Bloom filter discarded %d/%d fragment(s)",
@@ -1022,7 +1698,8 @@ class FragmentManager(MetadataManager):
             )
 
         # Preserve original object order.
-        return [r for r in object_ids if r in bloom_filter_result]
+        bloom_filter_set = set(bloom_filter_result)
+        return [r for r in object_ids if r in bloom_filter_set]
 
     def delete_objects(self, objects: Union[Set[str], List[str]]) -> None:
         """
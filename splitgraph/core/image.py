@@ -123,7 +123,7 @@ class Image(NamedTuple):
         )
 
     @manage_audit
-    def checkout(self, force: bool = False, layered: bool = False) -> None:
+    def checkout(self, force: bool = False, layered: bool = False, workers: int = 1) -> None:
         """
         Checks the image out, changing the current HEAD pointer. Raises an error
         if there are pending changes to its checkout.
@@ -131,6 +131,8 @@ class Image(NamedTuple):
         :param force: Discards all pending changes to the schema.
         :param layered: If True, uses layered querying to check out the image (doesn't materialize tables
             inside of it).
+        :param workers: Number of engine connections to materialize every table on. See
+            `Table.materialize` for reference.
         """
         target_schema = self.repository.to_schema()
         if len(target_schema) > POSTGRES_MAX_IDENTIFIER:
@@ -163,7 +165,7 @@ class Image(NamedTuple):
             self._lq_checkout()
         else:
             for table in self.get_tables():
-                self.get_table(table).materialize(table)
+                self.get_table(table).materialize(table, workers=workers)
         set_head(self.repository, self.image_hash)
 
     def _lq_checkout(
@@ -84,7 +84,45 @@ def generate_bloom_index(
     )
 
     digests = engine.run_sql(digest_query)
+    return _make_bloom_filter(digests, changeset, column, probability, size)
 
+
+def generate_bloom_index_from_values(
+    values: List[Optional[str]],
+    changeset: Optional[Changeset],
+    column: str,
+    probability: Optional[float] = None,
+    size: Optional[int] = None,
+) -> Tuple[int, str]:
+    """
+    Generates a bloom filter signature for a given column from the text representations of its
+    distinct values (for example, when they've already been fetched from the engine together
+    with other fragment statistics). Produces the same filter as `generate_bloom_index`.
+
+    :param values: List of distinct values of the column, cast to text.
+    :param changeset: Optional, if specified, the old column values are included in the index.
+    :param column: Column name to generate the index on.
+    :param probability: Probability of a false positive.
+    :param size: Size of the filter, in bytes.
+    :return: Dictionary to be inserted into the index.
+    """
+    if not (probability is None) ^ (size is None):
+        raise ValueError("One of probability or size must be specified, but not both!")
+
+    # Hashing the text representation of the value here is equivalent to calling digest() on it
+    # in Postgres.
+    digests = [_hash_value(v) for v in values]
+    return _make_bloom_filter(digests, changeset, column, probability, size)
+
+
+def _make_bloom_filter(
+    digests: List[Tuple[bytes, bytes]],
+    changeset: Optional[Changeset],
+    column: str,
+    probability: Optional[float] = None,
+    size: Optional[int] = None,
+) -> Tuple[int, str]:
+    """Build a bloom filter from a list of pairs of value digests (see `generate_bloom_index`)."""
     # Add digests of the old values in the changeset for this column.
     if changeset:
         for _, old_row, _ in changeset.values():
@@ -236,7 +274,12 @@ def _match(qual: Tuple[str, int, int], bloom_index: Dict[str, Tuple[int, bytes]]
     return True
 
 
-def filter_bloom_index(engine: "PsycopgEngine", object_ids: List[str], quals: Any) -> List[str]:
+def filter_bloom_index(
+    engine: "PsycopgEngine",
+    object_ids: List[str],
+    quals: Any,
+    object_indexes: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> List[str]:
     """
     Runs a bloom filter on given qualifiers using the given objects' previously-generated
     fingerprints.
@@ -244,6 +287,8 @@ def filter_bloom_index(engine: "PsycopgEngine", object_ids: List[str], quals: An
     :param engine: Object engine
     :param object_ids: Object IDs
     :param quals: List of qualifiers
+    :param object_indexes: Dictionary of object ID -> object index. If not specified,
+        the indexes are loaded from the engine.
     :return: List of object IDs that might match the qualifiers in `quals` (including
         IDs that don't have a bloom index).
     """
@@ -258,14 +303,17 @@ def filter_bloom_index(engine: "PsycopgEngine", object_ids: List[str], quals: An
 
     # Load the index: my SQLfu isn't strong enough to create a query that takes
     # care of varying values of K and varying signature sizes.
-    bloom_index = engine.run_sql(
-        SQL(
-            "SELECT object_id, index -> 'bloom' FROM {}.{} WHERE object_id IN ("
-            + ",".join(itertools.repeat("%s", len(object_ids)))
-            + ")"
-        ).format(Identifier(SPLITGRAPH_META_SCHEMA), Identifier("objects")),
-        object_ids,
-    )
+    if object_indexes is not None:
+        bloom_index = [(o, object_indexes.get(o, {}).get("bloom")) for o in object_ids]
+    else:
+        bloom_index = engine.run_sql(
+            SQL(
+                "SELECT object_id, index -> 'bloom' FROM {}.{} WHERE object_id IN ("
+                + ",".join(itertools.repeat("%s", len(object_ids)))
+                + ")"
+            ).format(Identifier(SPLITGRAPH_META_SCHEMA), Identifier("objects")),
+            object_ids,
+        )
 
     bloom_index = {
         o: {col: (i[0], base64.b64decode(i[1])) for col, i in index.items()}
@@ -1,4 +1,6 @@
 import logging
+from datetime import date, datetime
+from decimal import Decimal
 from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar, cast, TYPE_CHECKING
 
 from psycopg2.sql import Composed, SQL, Composable
@@ -6,6 +8,7 @@ from psycopg2.sql import Identifier
 
 from splitgraph.config import SPLITGRAPH_META_SCHEMA, SPLITGRAPH_API_SCHEMA
 from splitgraph.core.common import adapt, coerce_val_to_json
+from splitgraph.core.output import parse_dt, parse_date
 from splitgraph.core.sql import select
 from splitgraph.core.types import Quals, Changeset, TableSchema
 from splitgraph.engine import ResultShape
@@ -200,22 +203,15 @@ def extract_min_max_pks(
     return min_max
 
 
-def generate_range_index(
-    object_engine: "PsycopgEngine",
-    object_id: str,
-    table_schema: "TableSchema",
-    changeset: Optional[Changeset],
-    columns: Optional[List[str]] = None,
-) -> Dict[str, Tuple[T, T]]:
+def get_range_index_columns(
+    table_schema: "TableSchema", columns: Optional[List[str]] = None
+) -> Tuple[List[str], List[str], Dict[str, str]]:
     """
-    Calculate the minimum/maximum values of every column in the object (including deleted values).
+    Get the columns that the range index for an object with a given schema is calculated on.
 
-    :param object_engine: Engine the object is located on
-    :param object_id: ID of the object.
     :param table_schema: Schema of the table
-    :param changeset: Changeset (old values will be included in the index)
     :param columns: Columns to run the index on (default all)
-    :return: Dictionary of {column: [min, max]}
+    :return: Object primary key, list of columns to index and a dictionary of column types.
     """
     columns = columns or [c.name for c in table_schema]
 
@@ -228,9 +224,12 @@ def generate_range_index(
         for c in table_schema
         if _strip_type_mod(c.pg_type) in PG_INDEXABLE_TYPES and (c.is_pk or c.name in columns)
     ]
+    return object_pk, columns_to_index, column_types
 
-    logging.debug("Running range index on columns %s", columns_to_index)
-    query = SQL("SELECT ") + SQL(",").join(
+
+def range_index_aggregates(columns_to_index: List[str], column_types: Dict[str, str]) -> Composable:
+    """Get a list of MIN/MAX aggregates for every indexed column."""
+    return SQL(",").join(
         SQL(
             _inject_collation("MIN({0}", column_types[c])
             + "), "
@@ -239,19 +238,43 @@ def generate_range_index(
         ).format(Identifier(c))
         for c in columns_to_index
     )
-    query += SQL(" FROM {}.{}").format(Identifier(SPLITGRAPH_META_SCHEMA), Identifier(object_id))
-    result = object_engine.run_sql(query, return_shape=ResultShape.ONE_MANY)
-    index = {
-        col: (cmin, cmax) for col, cmin, cmax in zip(columns_to_index, result[0::2], result[1::2])
-    }
-    # Also explicitly store the ranges of composite PKs (since they won't be included
-    # in the columns list) to be used for faster chunking/querying.
-    if len(object_pk) > 1:
-        # Add the PK to the same index dict but prefix it with a dollar sign so that
-        # it explicitly doesn't clash with any other columns.
-        index["$pk"] = extract_min_max_pks(
-            object_engine, [object_id], object_pk, [column_types[c] for c in object_pk]
-        )[0]
+
+
+def pk_bounds_aggregates(object_pk: List[str], column_types: Dict[str, str]) -> Composable:
+    """
+    Get a list of aggregates that return every part of the minimum and then the maximum composite
+    primary key in the same scan (see `extract_min_max_pks` for why these can't be calculated
+    from the ranges of the individual columns).
+    """
+    orders = [
+        SQL(",").join(
+            Identifier(p) + SQL(_inject_collation("", column_types[p]) + direction)
+            for p in object_pk
+        )
+        for direction in ("", " DESC")
+    ]
+    return SQL(",").join(
+        SQL("(array_agg({} ORDER BY ").format(Identifier(p)) + order + SQL("))[1]")
+        for order in orders
+        for p in object_pk
+    )
+
+
+def finalize_range_index(
+    index: Dict[str, Tuple[Any, Any]],
+    changeset: Optional[Changeset],
+    columns_to_index: List[str],
+    column_types: Dict[str, str],
+) -> Dict[str, Tuple[T, T]]:
+    """
+    Expand the range index with the old values from a changeset and coerce it into JSON.
+
+    :param index: Dictionary of {column: (min, max)}
+    :param changeset: Changeset (old values will be included in the index)
+    :param columns_to_index: Columns the index was calculated on
+    :param column_types: Dictionary of column types
+    :return: Dictionary of {column: [min, max]}
+    """
     if changeset:
         # Expand the index ranges to include the old row values in this chunk.
         # Why is this necessary? Say we have a table of (key (PK), value) and a
@@ -290,6 +313,43 @@ def generate_range_index(
     return range_index
 
 
+def generate_range_index(
+    object_engine: "PsycopgEngine",
+    object_id: str,
+    table_schema: "TableSchema",
+    changeset: Optional[Changeset],
+    columns: Optional[List[str]] = None,
+) -> Dict[str, Tuple[T, T]]:
+    """
+    Calculate the minimum/maximum values of every column in the object (including deleted values).
+
+    :param object_engine: Engine the object is located on
+    :param object_id: ID of the object.
+    :param table_schema: Schema of the table
+    :param changeset: Changeset (old values will be included in the index)
+    :param columns: Columns to run the index on (default all)
+    :return: Dictionary of {column: [min, max]}
+    """
+    object_pk, columns_to_index, column_types = get_range_index_columns(table_schema, columns)
+
+    logging.debug("Running range index on columns %s", columns_to_index)
+    query = SQL("SELECT ") + range_index_aggregates(columns_to_index, column_types)
+    query += SQL(" FROM {}.{}").format(Identifier(SPLITGRAPH_META_SCHEMA), Identifier(object_id))
+    result = object_engine.run_sql(query, return_shape=ResultShape.ONE_MANY)
+    index = {
+        col: (cmin, cmax) for col, cmin, cmax in zip(columns_to_index, result[0::2], result[1::2])
+    }
+    # Also explicitly store the ranges of composite PKs (since they won't be included
+    # in the columns list) to be used for faster chunking/querying.
+    if len(object_pk) > 1:
+        # Add the PK to the same index dict but prefix it with a dollar sign so that
+        # it explicitly doesn't clash with any other columns.
+        index["$pk"] = extract_min_max_pks(
+            object_engine, [object_id], object_pk, [column_types[c] for c in object_pk]
+        )[0]
+    return finalize_range_index(index, changeset, columns_to_index, column_types)
+
+
 def filter_range_index(
     metadata_engine: "PsycopgEngine",
     object_ids: List[str],
@@ -309,3 +369,143 @@ def filter_range_index(
             query, [object_ids] + list(args), return_shape=ResultShape.MANY_ONE, chunk_position=0
         ),
     )
+
+
+def _to_decimal(value: Any) -> Decimal:
+    return Decimal(str(value))
+
+
+def _to_date(value: Any) -> date:
+    if isinstance(value, str):
+        return parse_date(value)
+    if isinstance(value, datetime) or not isinstance(value, date):
+        raise TypeError("Can't compare %r to a date" % value)
+    return value
+
+
+def _to_timestamp(value: Any) -> datetime:
+    if isinstance(value, str):
+        return parse_dt(value)
+    if not isinstance(value, datetime) or value.tzinfo:
+        raise TypeError("Can't compare %r to a timestamp" % value)
+    return value
+
+
+def _to_str(value: Any) -> str:
+    if not isinstance(value, str):
+        raise TypeError("Can't compare %r to a string" % value)
+    return value
+
+
+# Types whose index entries we can compare with qualifiers in Python without changing
+# the result of the comparison from what the engine would give us. Strings are compared
+# by codepoint, same as the "C" collation used by the index. Floating point types aren't
+# included: their text representation can round differently from the engine's comparison.
+_RANGE_COERCERS: Dict[str, Callable[[Any], Any]] = {
+    **{
+        t: _to_decimal
+        for t in ["bigint", "bigserial", "integer", "serial", "smallint", "smallserial", "numeric",]
+    },
+    "date": _to_date,
+    "timestamp": _to_timestamp,
+    "timestamp without time zone": _to_timestamp,
+    "text": _to_str,
+    "character varying": _to_str,
+}
+
+# Types whose primary key ranges are ordered the same way in Python as they are on the engine.
+SCAN_ORDER_TYPES = [
+    "bigint",
+    "bigserial",
+    "date",
+    "integer",
+    "numeric",
+    "serial",
+    "smallint",
+    "smallserial",
+    "timestamp",
+    "timestamp without time zone",
+]
+
+_RANGE_OPERATORS = (">", ">=", "<", "<=", "=")
+
+
+def _qual_matches_range(
+    qual: Tuple[str, str, Any], ctype: str, range_index: Dict[str, Any]
+) -> bool:
+    """Python equivalent of _qual_to_index_clause for types in _RANGE_COERCERS."""
+    column_name, qual_op, value = qual
+    if column_name not in range_index or qual_op not in _RANGE_OPERATORS:
+        return True
+
+    index_min, index_max = range_index[column_name]
+    # The column only has NULLs in this object: they can't match a comparison.
+    if index_min is None or index_max is None:
+        return False
+
+    coerce = _RANGE_COERCERS[ctype]
+    try:
+        value = coerce(value)
+        index_min = coerce(index_min)
+        index_max = coerce(index_max)
+
+        if qual_op == ">":
+            return bool(index_max > value)
+        if qual_op == ">=":
+            return bool(index_max >= value)
+        if qual_op == "<":
+            return bool(index_min < value)
+        if qual_op == "<=":
+            return bool(index_min <= value)
+        return bool(index_min <= value <= index_max)
+    except (TypeError, ValueError, ArithmeticError):
+        # If we can't compare the values, the object might match the qual.
+        return True
+
+
+def filter_range_index_meta(
+    object_indexes: Dict[str, Dict[str, Any]],
+    object_ids: List[str],
+    quals: Any,
+    column_types: Dict[str, str],
+) -> Tuple[List[str], bool]:
+    """
+    Run the range filter on previously loaded object indexes instead of on the engine.
+
+    Only columns with types that can be compared in Python are filtered on, since for other
+    types (e.g. timestamps with time zones or network addresses) the results could be different.
+
+    :param object_indexes: Dictionary of object ID -> object index.
+    :param object_ids: List of object IDs to filter.
+    :param quals: List of qualifiers in CNF.
+    :param column_types: Dictionary of column names and their types.
+    :return: List of object IDs that might match the qualifiers and a flag that's True
+        if some qualifiers couldn't be checked (so `filter_range_index` can be used
+        to refine the result further).
+    """
+    if not quals:
+        return object_ids, False
+
+    column_types = {c: _strip_type_mod(t) for c, t in column_types.items()}
+
+    incomplete = False
+    checked_quals = []
+    for or_quals in quals:
+        if any(
+            q[1] in _RANGE_OPERATORS and column_types[q[0]] not in _RANGE_COERCERS for q in or_quals
+        ):
+            # We can't check one of the qualifiers in the OR clause, so the whole
+            # clause might match any object.
+            incomplete = True
+            continue
+        checked_quals.append(or_quals)
+
+    result = []
+    for object_id in object_ids:
+        range_index = object_indexes.get(object_id, {}).get("range", {})
+        if all(
+            any(_qual_matches_range(q, column_types[q[0]], range_index) for q in or_quals)
+            for or_quals in checked_quals
+        ):
+            result.append(object_id)
+    return result, incomplete
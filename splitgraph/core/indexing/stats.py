@@ -0,0 +1,239 @@
+"""Per-column statistics on fragments, used to estimate the selectivity of queries."""
+import bisect
+import logging
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING
+
+from psycopg2.sql import SQL, Composable, Identifier
+
+from splitgraph.config import SPLITGRAPH_META_SCHEMA
+from splitgraph.core.common import coerce_val_to_json
+from splitgraph.core.indexing.range import (
+    _RANGE_COERCERS,
+    _inject_collation,
+    _strip_type_mod,
+    get_range_index_columns,
+)
+from splitgraph.core.types import TableSchema, Quals
+from splitgraph.engine import ResultShape
+from splitgraph.engine.postgres.engine import SG_UD_FLAG
+
+if TYPE_CHECKING:
+    from splitgraph.engine.postgres.engine import PsycopgEngine
+
+# Number of equal-depth buckets in the histogram. Fragments with fewer distinct values
+# than that don't get a histogram (the range index is used instead).
+HISTOGRAM_BUCKETS = 10
+
+# Selectivities to use when there are no statistics for a column (same as the defaults
+# used by the PostgreSQL planner).
+DEFAULT_EQ_SEL = 0.005
+DEFAULT_INEQ_SEL = 1.0 / 3
+DEFAULT_SEL = 0.5
+
+# Width (in bytes) to assume for columns without statistics.
+DEFAULT_COLUMN_WIDTH = 10
+
+# Types whose histogram bounds can be compared with qualifiers in Python. Unlike object
+# filtering, estimates don't have to agree with the engine exactly, so floats are included.
+_HISTOGRAM_COERCERS = {
+    **_RANGE_COERCERS,
+    "real": float,
+    "double precision": float,
+}
+
+
+def column_stats_aggregates(columns: List[str], column_types: Dict[str, str]) -> Composable:
+    """
+    Get a list of aggregates that calculate the number of non-NULL values, the number
+    of distinct values, the average width and the histogram bounds for every column.
+    """
+    fractions = ",".join(str(i / HISTOGRAM_BUCKETS) for i in range(HISTOGRAM_BUCKETS + 1))
+    return SQL(",").join(
+        SQL(
+            "count({0}), count(DISTINCT {0}), round(avg(octet_length({0}::text)))::integer, "
+            "percentile_disc(ARRAY[" + fractions + "]) WITHIN GROUP (ORDER BY "
+        ).format(Identifier(c))
+        + SQL(_inject_collation("{}", column_types[c]) + ")").format(Identifier(c))
+        for c in columns
+    )
+
+
+def finalize_column_stats(
+    result: List[Any], row_count: int, columns: List[str]
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Turn the results of `column_stats_aggregates` into the statistics stored in the object index.
+
+    :param result: List of results of the aggregates (consumed by this function)
+    :param row_count: Number of rows the aggregates were calculated on
+    :param columns: Columns the aggregates were calculated on
+    :return: Dictionary of {column: {null_frac, distinct, width, histogram (optional)}}
+    """
+    stats: Dict[str, Dict[str, Any]] = {}
+    for column in columns:
+        non_null = result.pop(0)
+        distinct = result.pop(0)
+        width = result.pop(0)
+        histogram = result.pop(0)
+
+        column_stats = {
+            "null_frac": round(1 - non_null / row_count, 4) if row_count else 0,
+            "distinct": distinct,
+            "width": width or 0,
+        }
+        if distinct > HISTOGRAM_BUCKETS:
+            column_stats["histogram"] = coerce_val_to_json(histogram)
+        stats[column] = column_stats
+    return stats
+
+
+def generate_column_stats(
+    object_engine: "PsycopgEngine",
+    object_id: str,
+    table_schema: TableSchema,
+    columns: Optional[List[str]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Calculate statistics on the rows that an object inserts for the columns that
+    the range index is calculated on.
+
+    :param object_engine: Engine the object is located on
+    :param object_id: ID of the object.
+    :param table_schema: Schema of the table
+    :param columns: Columns to calculate statistics on (default all)
+    :return: Dictionary of {column: {null_frac, distinct, width, histogram (optional)}}
+    """
+    _, columns_to_index, column_types = get_range_index_columns(table_schema, columns)
+    if not columns_to_index:
+        return {}
+
+    logging.debug("Calculating statistics on columns %s", columns_to_index)
+    query = (
+        SQL("SELECT COUNT(*),")
+        + column_stats_aggregates(columns_to_index, column_types)
+        + SQL(" FROM {}.{} WHERE {} = true").format(
+            Identifier(SPLITGRAPH_META_SCHEMA), Identifier(object_id), Identifier(SG_UD_FLAG)
+        )
+    )
+    result = list(object_engine.run_sql(query, return_shape=ResultShape.ONE_MANY))
+    row_count = result.pop(0)
+    return finalize_column_stats(result, row_count, columns_to_index)
+
+
+def _fraction_below(value: Any, bounds: Sequence[Any]) -> float:
+    """Estimate the fraction of values smaller than `value` given equal-depth histogram bounds."""
+    if len(bounds) < 2:
+        return 0.5
+    position = bisect.bisect_left(bounds, value)
+    if position == 0:
+        return 0.0
+    if position == len(bounds):
+        return 1.0
+    lower, upper = bounds[position - 1], bounds[position]
+    within = 0.5
+    if isinstance(value, Decimal) and upper > lower:
+        # Assume values are uniformly distributed inside of a bucket.
+        within = float((value - lower) / (upper - lower))
+    return (position - 1 + within) / (len(bounds) - 1)
+
+
+def _qual_selectivity(
+    qual: Tuple[str, str, Any],
+    ctype: str,
+    column_stats: Dict[str, Any],
+    range_index: Optional[Tuple[Any, Any]],
+) -> float:
+    column_name, qual_op, value = qual
+    if not column_stats:
+        if qual_op in ("=", "~~"):
+            return DEFAULT_EQ_SEL
+        if qual_op == "<>":
+            return 1 - DEFAULT_EQ_SEL
+        if qual_op in (">", ">=", "<", "<="):
+            return DEFAULT_INEQ_SEL
+        return DEFAULT_SEL
+
+    non_null_frac = 1 - column_stats["null_frac"]
+    distinct = column_stats["distinct"]
+    eq_sel = non_null_frac / distinct if distinct else 0.0
+
+    if qual_op == "<>":
+        return non_null_frac - eq_sel
+    if qual_op not in ("=", ">", ">=", "<", "<="):
+        return DEFAULT_SEL
+
+    bounds = column_stats.get("histogram")
+    if bounds is None and range_index is not None and None not in range_index:
+        # Few distinct values: use the range index as a histogram with a single bucket.
+        bounds = list(range_index)
+    coerce = _HISTOGRAM_COERCERS.get(ctype)
+    if not bounds or not coerce:
+        return eq_sel if qual_op == "=" else DEFAULT_INEQ_SEL * non_null_frac
+
+    try:
+        value = coerce(value)
+        bounds = [coerce(b) for b in bounds]
+        if qual_op == "=":
+            return eq_sel if bounds[0] <= value <= bounds[-1] else 0.0
+        below = _fraction_below(value, bounds)
+    except (TypeError, ValueError, ArithmeticError):
+        return eq_sel if qual_op == "=" else DEFAULT_INEQ_SEL * non_null_frac
+
+    if qual_op in (">", ">="):
+        selectivity = 1 - below - (eq_sel if qual_op == ">" else 0)
+    else:
+        selectivity = below + (eq_sel if qual_op == "<=" else 0)
+    return min(max(selectivity, 0.0), 1.0) * non_null_frac
+
+
+def estimate_selectivity(
+    quals: Optional[Quals], object_index: Dict[str, Any], column_types: Dict[str, str]
+) -> float:
+    """
+    Estimate the fraction of rows in an object that match the qualifiers using the
+    statistics and the range index stored in the object's index.
+
+    :param quals: List of qualifiers in CNF
+    :param object_index: Object index
+    :param column_types: Dictionary of column names and their types
+    :return: Estimated selectivity between 0 and 1
+    """
+    stats = object_index.get("stats", {})
+    range_index = object_index.get("range", {})
+
+    selectivity = 1.0
+    for or_quals in quals or []:
+        # Assume that the clauses are independent.
+        not_matching = 1.0
+        for qual in or_quals:
+            not_matching *= 1 - _qual_selectivity(
+                qual,
+                _strip_type_mod(column_types[qual[0]]),
+                stats.get(qual[0], {}),
+                range_index.get(qual[0]),
+            )
+        selectivity *= 1 - not_matching
+    return selectivity
+
+
+def estimate_row_width(object_indexes: List[Tuple[int, Dict[str, Any]]], columns: List[str]) -> int:
+    """
+    Estimate the average width of rows returned by a query, weighting the average width
+    of every column in a fragment by the number of rows it has.
+
+    :param object_indexes: List of (number of rows, object index)
+    :param columns: Columns returned by the query
+    :return: Estimated row width in bytes
+    """
+    width = 0.0
+    for column in columns:
+        total_rows = 0
+        total_width = 0.0
+        for rows, object_index in object_indexes:
+            column_stats = object_index.get("stats", {}).get(column)
+            if column_stats and rows > 0:
+                total_rows += rows
+                total_width += rows * column_stats["width"]
+        width += total_width / total_rows if total_rows else DEFAULT_COLUMN_WIDTH
+    return int(round(width))
@@ -117,6 +117,23 @@ class MetadataManager:
             rechunked_meta,
         )
 
+    def delete_table_meta(self, repository: "Repository", image_hash: str, table_name: str) -> None:
+        """
+        Unlinks a table in an image from the objects it's stored as. This doesn't delete
+        the objects themselves.
+
+        :param repository: Repository that the table belongs to.
+        :param image_hash: Hash of the image.
+        :param table_name: Name of the table.
+        """
+        self.metadata_engine.run_sql(
+            SQL(
+                "DELETE FROM {}.tables WHERE namespace = %s AND repository = %s "
+                "AND image_hash = %s AND table_name = %s"
+            ).format(Identifier(SPLITGRAPH_META_SCHEMA)),
+            (repository.namespace, repository.repository, image_hash, table_name),
+        )
+
     def register_object_locations(self, object_locations: List[Tuple[str, str, str]]) -> None:
         """
         Registers external locations (e.g. HTTP or S3) for Splitgraph objects.
@@ -1,7 +1,7 @@
 """Functions related to creating, deleting and keeping track of physical Splitgraph objects."""
 import itertools
 import logging
-import math
+import threading
 from collections import defaultdict
 from contextlib import contextmanager
 from datetime import datetime as dt
@@ -22,11 +22,16 @@ from typing import (
 from psycopg2.sql import SQL, Identifier
 
 from splitgraph.config import SPLITGRAPH_META_SCHEMA, CONFIG, get_singleton
+from splitgraph.core.eviction import (
+    get_eviction_policy,
+    CacheEntry,
+    CacheAccess,
+    write_access_log,
+)
 from splitgraph.core.fragment_manager import FragmentManager
 from splitgraph.core.types import Quals
 from splitgraph.engine import ResultShape, switch_engine
 from splitgraph.exceptions import (
-    SplitGraphError,
     ObjectCacheError,
     IncompleteObjectUploadError,
     IncompleteObjectDownloadError,
@@ -37,9 +42,18 @@ from .output import pretty_size, pluralise, truncate_list
 from .sql import select, insert
 
 if TYPE_CHECKING:
+    from splitgraph.core.image import Image
     from splitgraph.core.table import Table
     from splitgraph.engine.postgres.engine import PsycopgEngine, PostgresEngine
 
+# Advisory lock classes (first key of the two-key form). Downloads are coordinated by
+# per-object locks (second key is the hash of the object ID) and changes to the cache
+# occupancy that might need an eviction take out a single lock. Sessions caching a query
+# plan lock its ID so that they don't wait on each other's uncommitted plans.
+_OBJECT_DOWNLOAD_LOCK_CLASS = 0x5347444C
+_CACHE_ACCOUNTING_LOCK_CLASS = 0x53474341
+_QUERY_PLAN_LOCK_CLASS = 0x5347514C
+
 
 class ObjectManager(FragmentManager):
     """Brings the multiple manager classes together and manages the object cache (downloading and uploading
@@ -59,15 +73,8 @@ class ObjectManager(FragmentManager):
         # Cache size in bytes
         self.cache_size = int(get_singleton(CONFIG, "SG_OBJECT_CACHE_SIZE")) * 1024 * 1024
 
-        # 0 to infinity; higher means objects with smaller sizes are more likely to
-        # get evicted than objects that haven't been used for a while.
-        # Currently calculated so that an object that hasn't been accessed for 5 minutes has the same
-        # removal priority as an object twice its size that's just been accessed.
-        self.eviction_decay_constant = float(get_singleton(CONFIG, "SG_EVICTION_DECAY"))
-
-        # Objects smaller than this size are assumed to have this size (to simulate the latency of
-        # downloading them).
-        self.eviction_floor = float(get_singleton(CONFIG, "SG_EVICTION_FLOOR")) * 1024 * 1024
+        # Decides which objects get evicted first (see splitgraph.core.eviction)
+        self.eviction_policy = get_eviction_policy()
 
         # Fraction of the cache size to free when eviction is run (the greater value of this amount and the
         # amount needed to download required objects is actually freed). Eviction is an expensive operation
@@ -75,6 +82,10 @@ class ObjectManager(FragmentManager):
         # of more possible cache misses.
         self.eviction_min_fraction = float(get_singleton(CONFIG, "SG_EVICTION_MIN_FRACTION"))
 
+        # If set, accesses to cached objects get appended to this file so that they can be replayed
+        # against different eviction policies (see `sgr cache simulate`).
+        self.access_log = get_singleton(CONFIG, "SG_CACHE_ACCESS_LOG")
+
     def get_downloaded_objects(self, limit_to: Optional[List[str]] = None) -> List[str]:
         """
         Gets a list of objects currently in the Splitgraph cache (i.e. not only existing externally.)
@@ -82,11 +93,7 @@ class ObjectManager(FragmentManager):
         :param limit_to: If specified, only the objects in this list will be returned.
         :return: Set of object IDs.
         """
-        objects: List[str]
-        objects = self.object_engine.run_api_call("list_objects")
-        if not limit_to:
-            return objects
-        return [o for o in objects if o in limit_to]
+        return self.object_engine.list_objects(limit_to=limit_to or None)
 
     def get_cache_occupancy(self) -> int:
         """
@@ -103,17 +110,15 @@ class ObjectManager(FragmentManager):
 
     def _recalculate_cache_occupancy(self) -> int:
         """A slower way of getting cache occupancy that actually goes through all objects in the cache status table
-        and sums up their size."""
+        and sums up their size (and the space reserved for objects that are being downloaded)."""
         return int(
             self.object_engine.run_sql(
                 SQL(
-                    "SELECT COALESCE(sum(splitgraph_api.get_object_size("
-                    "quote_ident(t.table_name))), 0)"
-                    " FROM information_schema.tables t JOIN {0}.object_cache_status oc"
-                    " ON t.table_name = oc.object_id"
-                    " WHERE oc.ready = 't' AND t.table_schema = %s AND t.table_type = 'FOREIGN'"
+                    "SELECT (SELECT COALESCE(sum(c.size), 0) FROM {0}.object_catalog c "
+                    "JOIN {0}.object_cache_status oc ON c.object_id = oc.object_id "
+                    "WHERE oc.ready = 't') + (SELECT COALESCE(sum(reserved), 0) "
+                    "FROM {0}.object_cache_status WHERE ready = 'f')"
                 ).format(Identifier(SPLITGRAPH_META_SCHEMA)),
-                (SPLITGRAPH_META_SCHEMA,),
                 return_shape=ResultShape.ONE_ONE,
             )
         )
@@ -124,15 +129,7 @@ class ObjectManager(FragmentManager):
         """
         return int(
             self.object_engine.run_sql(
-                SQL(
-                    "SELECT COALESCE(sum(splitgraph_api.get_object_size("
-                    "quote_ident(t.table_name))), 0)"
-                    " FROM information_schema.tables t"
-                    " WHERE t.table_schema = %s AND t.table_name NOT IN ("
-                    + ",".join(itertools.repeat("%s", len(META_TABLES)))
-                    + ")"
-                ).format(Identifier(SPLITGRAPH_META_SCHEMA)),
-                [SPLITGRAPH_META_SCHEMA] + META_TABLES,
+                select("object_catalog", "COALESCE(sum(size), 0)"),
                 return_shape=ResultShape.ONE_ONE,
             )
         )
@@ -197,65 +194,20 @@ class ObjectManager(FragmentManager):
         self._claim_objects(required_objects)
         tracer.log("claim_objects")
 
-        try:
-            to_fetch = self._prepare_fetch_list(required_objects)
-        except SplitGraphError:
-            self.object_engine.rollback()
-            raise
+        to_fetch = self._get_unready_objects(required_objects)
         tracer.log("prepare_fetch_list")
-
-        # Perform the actual download. If the table has no upstream but still has external locations, we download
-        # just the external objects.
         if to_fetch:
-            object_locations = self.get_external_object_locations(to_fetch)
-
-            # If all objects are externally hosted, there's no need to try and get the table's
-            # upstream (there's a corner case where the metadata engine is different from the object
-            # engine and the repo actually has no upstream)
-            if (
-                self.metadata_engine == self.object_engine
-                and table is not None
-                and upstream_manager is None
-            ):
-                upstream_manager = (
-                    table.repository.upstream.objects if table.repository.upstream else None
-                )
-
-            partial_failure: Optional[BaseException] = None
+            # Commit the claims before downloading: objects with a nonzero refcount can't be
+            # evicted, so we don't need to hold any locks on them whilst we're downloading
+            # the ones that are missing.
+            self.object_engine.commit()
             try:
-                successful = self.download_objects(
-                    upstream_manager, objects_to_fetch=to_fetch, object_locations=object_locations
-                )
-                difference = []
-            except IncompleteObjectDownloadError as e:
-                successful = e.successful_objects
-                difference = list(set(to_fetch).difference(successful))
-                if difference:
-                    if e.reason:
-                        partial_failure = e.reason
-                    else:
-                        partial_failure = self._generate_download_error(table, difference)
-            except Exception as e:
-                successful = self.get_downloaded_objects(to_fetch)
-                difference = list(set(to_fetch).difference(successful))
-                partial_failure = self._generate_download_error(table, difference, cause=e)
-
-            # No matter what, claim the space required by the newly downloaded objects.
-            if successful:
-                self._increase_cache_occupancy(successful)
-
-            if partial_failure:
-                # Instead of deleting all objects in this batch, discard the cache data
-                # on the objects that failed, decrease the refcount on the objects that
-                # succeeded and mark them as ready.
-                self._delete_cache_entries(difference)
-                self._set_ready_flags(successful, is_ready=True)
-                self._release_objects(successful)
-                self.object_engine.commit()
-
-                raise partial_failure
-
-            self._set_ready_flags(to_fetch, is_ready=True)
+                self._fetch_missing_objects(table, required_objects, to_fetch, upstream_manager)
+            except BaseException:
+                # The claims have been committed, so they have to be released even if we've
+                # been interrupted.
+                self._abandon_download(required_objects, to_fetch)
+                raise
         tracer.log("fetch_objects")
         logging.debug("Object manager finished.")
 
@@ -358,10 +310,14 @@ class ObjectManager(FragmentManager):
 
         # Insert the objects into the cache status table (marking them as not ready)
         now = dt.utcnow()
+        clock = self._get_cache_clock()
         self.object_engine.run_sql_batch(
-            insert("object_cache_status", ("object_id", "ready", "refcount", "last_used"))
+            insert(
+                "object_cache_status",
+                ("object_id", "ready", "refcount", "last_used", "access_count", "clock"),
+            )
             + SQL("ON CONFLICT (object_id) DO UPDATE SET ready = 'f'"),
-            [(object_id, False, 1, now) for object_id in new_objects],
+            [(object_id, False, 1, now, 1, clock) for object_id in new_objects],
         )
 
         # Grab the objects that we're supposed to be uploading.
@@ -409,68 +365,405 @@ class ObjectManager(FragmentManager):
         if excess > 0:
             self.run_eviction(keep_objects=[], required_space=excess)
 
-    def _prepare_fetch_list(self, required_objects: List[str]) -> List[str]:
+    def _fetch_missing_objects(
+        self,
+        table: Optional["Table"],
+        required_objects: List[str],
+        to_fetch: List[str],
+        upstream_manager: Optional["ObjectManager"],
+    ) -> None:
+        """
+        Download claimed objects that aren't in the cache yet (`to_fetch`).
+
+        Downloads are coordinated between object managers with per-object advisory locks:
+        a manager only downloads objects that nobody else is downloading and waits for
+        the rest, so managers that need different objects download them in parallel.
+        Only reserving space in the cache (and evicting objects to make room) is serialized.
+        """
+        # If all objects are externally hosted, there's no need to try and get the table's
+        # upstream (there's a corner case where the metadata engine is different from the object
+        # engine and the repo actually has no upstream)
+        if (
+            self.metadata_engine == self.object_engine
+            and table is not None
+            and upstream_manager is None
+        ):
+            upstream_manager = (
+                table.repository.upstream.objects if table.repository.upstream else None
+            )
+
+        while to_fetch:
+            self._reserve_cache_space(table, to_fetch, required_objects)
+            downloading = self._lock_objects_for_download(to_fetch)
+            if downloading:
+                self._download_locked_objects(table, downloading, upstream_manager)
+            else:
+                # Other managers are downloading everything that we need (using the space
+                # reserved for the objects): wait for them to finish.
+                self._wait_for_downloads(to_fetch)
+
+            # Check what's still missing: other managers' downloads might have failed.
+            to_fetch = self._get_unready_objects(to_fetch)
+
+    def prefetch(
+        self, table: "Table", quals: Optional[Quals] = None, background: bool = False
+    ) -> List[str]:
         """
-        Calculates the missing objects and ensures there's enough space in the cache
-        to download them.
+        Download objects that a query on a table will need into the cache ahead of time.
+
+        Prefetching has a lower priority than queries: it doesn't evict anything from the cache
+        (objects that don't fit into the free space, including space within the repository's
+        cache quotas, are skipped) and it doesn't hold on to the objects after they've
+        been downloaded. Prefetched objects also don't count as used, so that they're
+        the first to be evicted by frequency-based eviction policies if no query uses them.
+
+        :param table: Table to prefetch the objects for
+        :param quals: Optional list of qualifiers of the query (see `filter_fragments`)
+        :param background: If True, download the objects in a background thread (using a separate
+            connection to the engine) and return straight away. The thread isn't a daemon thread,
+            so the interpreter waits for it to finish (and release the objects and the reserved
+            cache space) before exiting.
+        :return: List of objects that are being prefetched.
+        """
+        objects = self.filter_fragments(table.objects, table, quals)
+        to_fetch = self._reserve_prefetched_objects(table, objects)
+        if not to_fetch:
+            return []
+
+        if background:
+            # The objects have already been claimed and the space reserved: a daemon thread
+            # would get killed at exit, leaving unready cache entries and reserved space behind.
+            thread = threading.Thread(
+                target=self._prefetch_in_background, args=(table, to_fetch), daemon=False
+            )
+            thread.start()
+        else:
+            self._fetch_prefetched_objects(table, to_fetch)
+        return to_fetch
 
-        :param required_objects: Iterable of object IDs that are required to be on the engine.
-        :return: Set of objects to fetch
+    def _reserve_prefetched_objects(self, table: "Table", objects: List[str]) -> List[str]:
         """
-        to_fetch: List[str] = self.object_engine.run_sql(
-            select("object_cache_status", "object_id", "ready = 'f'"),
+        Add cache entries for objects that aren't in the cache and fit into its free space.
+        Claims the objects until they have been downloaded and commits the transaction.
+
+        :return: List of objects to download.
+        """
+        self._lock_cache_accounting()
+        cached = self.object_engine.run_sql(
+            select("object_cache_status", "object_id", "object_id = ANY(%s)"),
+            (objects,),
             return_shape=ResultShape.MANY_ONE,
         )
-        if to_fetch:
-            # If we need to download anything, take out an exclusive lock on the cache since we might
-            # need to run eviction and don't want multiple managers trying to download the same things.
-            # This used to be more granular (allow multiple managers downloading objects) but was resulting
-            # in fun concurrency bugs and deadlocks that I don't have the willpower to investigate further
-            # right now (e.g. two managers trying to download the same objects at the same time after one of them
-            # runs cache eviction and releases some locks -- or two managers trying to free the same amount
-            # of space in the cache for the same set of objects).
-
-            # Since we already hold a row-level lock on some objects in the cache, we have to release it first and
-            # lock the full table then -- but this means someone else might start downloading the objects that
-            # we claimed. So, once we acquire the lock, we recalculate the fetch list again to see what
-            # we're supposed to be fetching.
+        missing = [o for o in objects if o not in cached]
+        # Exclude objects that were created locally as well
+        local = self.get_downloaded_objects(limit_to=missing) if missing else []
+        missing = [o for o in missing if o not in local]
+        if not missing:
             self.object_engine.commit()
-            self.object_engine.lock_table(SPLITGRAPH_META_SCHEMA, "object_cache_status")
+            return []
+
+        free_space = self.cache_size - self.get_cache_occupancy()
+        for _, quota, used_space, _ in self._get_cache_quota_usage(table, missing):
+            free_space = min(free_space, quota - used_space)
+
+        object_sizes = {o.object_id: o.size for o in self.get_object_meta(missing).values()}
+        to_fetch = []
+        for object_id in missing:
+            size = object_sizes.get(object_id)
+            if size is not None and size <= free_space:
+                to_fetch.append(object_id)
+                free_space -= size
+        if len(to_fetch) < len(missing):
+            logging.info(
+                "Not enough free space in the cache to prefetch %s",
+                pluralise("object", len(missing) - len(to_fetch)),
+            )
+
+        if to_fetch:
+            # Skip objects that someone else has started downloading since we checked.
             to_fetch = self.object_engine.run_sql(
-                select("object_cache_status", "object_id", "ready = 'f'"),
+                SQL(
+                    "INSERT INTO {}.object_cache_status "
+                    "(object_id, ready, refcount, last_used, access_count, clock) "
+                    "SELECT object_id, 'f', 1, %s, 0, %s FROM unnest(%s) AS o (object_id) "
+                    "ON CONFLICT (object_id) DO NOTHING RETURNING object_id"
+                ).format(Identifier(SPLITGRAPH_META_SCHEMA)),
+                (dt.utcnow(), self._get_cache_clock(), to_fetch),
                 return_shape=ResultShape.MANY_ONE,
             )
-            # If someone else downloaded all the objects we need, there's no point in holding the lock.
-            # This is tricky to test with a single process.
-            if not to_fetch:  # pragma: no cover
-                self.object_engine.commit()
-                return to_fetch
-            required_space = sum(o.size for o in self.get_object_meta(list(to_fetch)).values())
-            current_occupied = self.get_cache_occupancy()
-            logging.info(
-                "Need to download %s (%s), cache occupancy: %s/%s",
-                pluralise("object", len(required_objects)),
-                pretty_size(required_space),
-                pretty_size(current_occupied),
-                pretty_size(self.cache_size),
-            )
-            # If the total cache size isn't large enough, there's nothing we can do without cooperating with the
-            # caller and seeing if they can use the objects one-by-one.
-            if required_space > self.cache_size:
-                raise ObjectCacheError(
-                    "Not enough space in the cache to download the required objects!"
-                )
-            if required_space > self.cache_size - current_occupied:
-                to_free = required_space + current_occupied - self.cache_size
-                logging.info("Need to free %s", pretty_size(to_free))
-                self.run_eviction(required_objects, to_free)
+            self._reserve_objects(to_fetch)
+        self.object_engine.commit()
+        return cast(List[str], to_fetch)
+
+    def _prefetch_in_background(self, table: "Table", objects: List[str]) -> None:
+        # Downloads commit, put the engine into autocommit mode and close its other connections,
+        # so do them on a separate engine to leave the caller's connection and transaction alone.
+        from splitgraph.engine.postgres.engine import PostgresEngine
+
+        object_engine = PostgresEngine(
+            name=self.object_engine.name, conn_params=self.object_engine.conn_params
+        )
+        metadata_engine = (
+            object_engine if self.metadata_engine == self.object_engine else self.metadata_engine
+        )
+        try:
+            ObjectManager(object_engine, metadata_engine)._fetch_prefetched_objects(table, objects)
+        finally:
+            object_engine.close()
+
+    def _fetch_prefetched_objects(self, table: "Table", objects: List[str]) -> None:
+        upstream_manager = (
+            table.repository.upstream.objects
+            if self.metadata_engine == self.object_engine and table.repository.upstream
+            else None
+        )
+        try:
+            downloading = self._lock_objects_for_download(objects)
+            if downloading:
+                self._download_locked_objects(table, downloading, upstream_manager)
+        except Exception:
+            logging.exception("Error prefetching objects for %s", table.table_name)
+            self._abandon_download(objects, objects)
+        except BaseException:
+            self._abandon_download(objects, objects)
+            raise
+        else:
+            # Release our claims straight away: prefetching doesn't hold on to the objects.
+            self._release_objects(objects)
+            self._delete_cache_entries(objects, only_unready=True)
             self.object_engine.commit()
-            # Finally, after we're done with eviction, relock the objects that we're supposed to be downloading.
-            to_fetch = self.object_engine.run_sql(
-                select("object_cache_status", "object_id", "ready = 'f' FOR UPDATE"),
+
+    def _abandon_download(self, claimed: List[str], to_fetch: List[str]) -> None:
+        """
+        Clean up after a download that failed or got interrupted: release our claims and delete
+        cache entries for objects that weren't downloaded (unless someone else is still waiting
+        for them), giving back the space reserved for them. Commits the transaction.
+
+        :param claimed: Objects that we've claimed
+        :param to_fetch: Objects that we were downloading
+        """
+        # The rollback might have undone catalog changes for object files that stay around.
+        self.object_engine.rollback()
+        self.object_engine.reconcile_object_catalog(to_fetch)
+        self._release_objects(claimed)
+        self._delete_cache_entries(claimed, only_unready=True)
+        self.object_engine.commit()
+
+    def _get_unready_objects(self, objects: List[str]) -> List[str]:
+        return cast(
+            List[str],
+            self.object_engine.run_sql(
+                select("object_cache_status", "object_id", "ready = 'f' AND object_id = ANY(%s)"),
+                (objects,),
                 return_shape=ResultShape.MANY_ONE,
+            ),
+        )
+
+    def _lock_cache_accounting(self) -> None:
+        """Serialize cache space reservations and evictions until the end of the transaction."""
+        self.object_engine.run_sql(
+            "SELECT pg_advisory_xact_lock(%s, 0)", (_CACHE_ACCOUNTING_LOCK_CLASS,)
+        )
+
+    def _reserve_cache_space(
+        self, table: Optional["Table"], objects: List[str], keep_objects: List[str]
+    ) -> None:
+        """
+        Reserve space in the cache for objects that are about to be downloaded, running eviction
+        if there isn't enough of it. Commits the transaction.
+
+        :param table: Table the objects belong to, used to enforce cache quotas
+        :param objects: Objects to reserve the space for
+        :param keep_objects: Objects that can't be evicted
+        """
+        # Make room within the repository's quota first. Check it under the lock so that
+        # concurrent downloads can't take up the same space. Eviction commits, releasing the
+        # lock, so if it had to run, check the quota again.
+        self._lock_cache_accounting()
+        while table is not None and self._enforce_cache_quotas(table, objects, keep_objects):
+            self._lock_cache_accounting()
+
+        current_occupied = self.get_cache_occupancy()
+        # Bump the occupancy before we run eviction, since it commits the transaction (releasing
+        # the lock) after it's done its bookkeeping.
+        required_space = self._reserve_objects(objects)
+        logging.info(
+            "Need to download %s (%s), cache occupancy: %s/%s",
+            pluralise("object", len(objects)),
+            pretty_size(required_space),
+            pretty_size(current_occupied),
+            pretty_size(self.cache_size),
+        )
+        # If the total cache size isn't large enough, there's nothing we can do without cooperating with the
+        # caller and seeing if they can use the objects one-by-one.
+        if required_space > self.cache_size:
+            raise ObjectCacheError(
+                "Not enough space in the cache to download the required objects!"
             )
-        return to_fetch
+        if required_space > self.cache_size - current_occupied:
+            to_free = required_space + current_occupied - self.cache_size
+            logging.info("Need to free %s", pretty_size(to_free))
+            self.run_eviction(keep_objects, to_free)
+        self.object_engine.commit()
+
+    def _enforce_cache_quotas(
+        self, table: "Table", objects: List[str], keep_objects: List[str]
+    ) -> bool:
+        """
+        Evict objects that belong to the table's repository (or namespace) if downloading new
+        objects would make them take up more space than the cache quota allows. Must be called
+        with the cache accounting lock held.
+
+        :param table: Table the objects belong to
+        :param objects: Objects that are about to be downloaded
+        :param keep_objects: Objects that can't be evicted
+        :return: True if eviction had to be run (which commits the transaction).
+        """
+        quotas = self._get_cache_quota_usage(table, objects)
+        if not quotas:
+            return False
+
+        required_space = sum(o.size for o in self.get_object_meta(objects).values())
+        for scope, quota, used_space, quota_objects in quotas:
+            if required_space > quota:
+                raise ObjectCacheError(
+                    "Not enough space in the cache quota for %s (%s) to download the required objects!"
+                    % (scope, pretty_size(quota))
+                )
+
+            if used_space + required_space > quota:
+                to_free = used_space + required_space - quota
+                logging.info(
+                    "Cache quota for %s (%s/%s used) exceeded, need to free %s",
+                    scope,
+                    pretty_size(used_space),
+                    pretty_size(quota),
+                    pretty_size(to_free),
+                )
+                self.run_eviction(keep_objects, to_free, limit_to=quota_objects)
+                return True
+        return False
+
+    def _get_cache_quota_usage(
+        self, table: "Table", exclude: List[str]
+    ) -> List[Tuple[str, int, int, List[str]]]:
+        """
+        Get cache quotas that apply to a table's repository and how much of them is used.
+
+        :param table: Table
+        :param exclude: Objects not to count towards the used space
+        :return: List of (quota scope, quota, used space, cached objects that count
+            towards the quota)
+        """
+        namespace = table.repository.namespace
+        quotas = self.object_engine.run_sql(
+            select(
+                "object_cache_quotas",
+                "repository,quota",
+                "namespace = %s AND repository IN (%s, '')",
+            ),
+            (namespace, table.repository.repository),
+            return_shape=ResultShape.MANY_MANY,
+        )
+        if not quotas:
+            return []
+
+        # Only look at objects that are in the cache rather than resolving all objects
+        # that the repository (or the namespace) requires.
+        cached_objects = self.object_engine.run_sql(
+            select("object_cache_status", "object_id", "object_id != ALL(%s)"),
+            (exclude,),
+            return_shape=ResultShape.MANY_ONE,
+        )
+
+        result = []
+        for repository, quota in quotas:
+            quota_objects: List[Tuple[str, int]] = []
+            if cached_objects:
+                query = SQL(
+                    "SELECT object_id, size FROM {0}.objects WHERE object_id = ANY(%s) "
+                    "AND object_id IN (SELECT unnest(object_ids) FROM {0}.tables "
+                    "WHERE namespace = %s"
+                ).format(Identifier(SPLITGRAPH_META_SCHEMA))
+                args = [cached_objects, namespace]
+                if repository:
+                    query += SQL(" AND repository = %s")
+                    args.append(repository)
+                quota_objects = self.metadata_engine.run_sql(
+                    query + SQL(")"), args, return_shape=ResultShape.MANY_MANY
+                )
+            used_space = sum(size for _, size in quota_objects)
+            scope = namespace + "/" + repository if repository else namespace
+            result.append((scope, quota, used_space, [o for o, _ in quota_objects]))
+        return result
+
+    def _lock_objects_for_download(self, objects: List[str]) -> List[str]:
+        """
+        Lock objects that nobody else is downloading until the end of the transaction.
+
+        :param objects: Objects that need to be downloaded
+        :return: Objects that we've locked and that still need to be downloaded
+        """
+        locked = self.object_engine.run_sql(
+            SQL(
+                "SELECT object_id FROM unnest(%s) AS o (object_id) "
+                "WHERE pg_try_advisory_xact_lock(%s, hashtext(object_id))"
+            ),
+            (objects, _OBJECT_DOWNLOAD_LOCK_CLASS),
+            return_shape=ResultShape.MANY_ONE,
+        )
+        # Someone might have finished downloading some of these objects before we locked them.
+        return self._get_unready_objects(locked) if locked else []
+
+    def _wait_for_downloads(self, objects: List[str]) -> None:
+        # Shared locks don't conflict with each other, so managers waiting
+        # for the same objects don't wait for each other.
+        self.object_engine.run_sql(
+            SQL(
+                "SELECT pg_advisory_xact_lock_shared(%s, hashtext(object_id)) "
+                "FROM unnest(%s) AS o (object_id)"
+            ),
+            (_OBJECT_DOWNLOAD_LOCK_CLASS, objects),
+        )
+        self.object_engine.commit()
+
+    def _download_locked_objects(
+        self,
+        table: Optional["Table"],
+        to_fetch: List[str],
+        upstream_manager: Optional["ObjectManager"],
+    ) -> None:
+        object_locations = self.get_external_object_locations(to_fetch)
+
+        partial_failure: Optional[BaseException] = None
+        try:
+            successful = self.download_objects(
+                upstream_manager, objects_to_fetch=to_fetch, object_locations=object_locations
+            )
+            ready = to_fetch
+        except IncompleteObjectDownloadError as e:
+            successful = e.successful_objects
+            difference = list(set(to_fetch).difference(successful))
+            ready = successful
+            if difference:
+                if e.reason:
+                    partial_failure = e.reason
+                else:
+                    partial_failure = self._generate_download_error(table, difference)
+        except Exception as e:
+            successful = self.get_downloaded_objects(to_fetch)
+            difference = list(set(to_fetch).difference(successful))
+            ready = successful
+            partial_failure = self._generate_download_error(table, difference, cause=e)
+
+        # Mark the objects as ready, which turns the space reserved for them into space that they
+        # occupy. Objects that we failed to download keep their reservation until their cache
+        # entries are deleted. Committing also releases the download locks.
+        self._set_ready_flags(ready, is_ready=True)
+        self.object_engine.commit()
+
+        if partial_failure:
+            raise partial_failure
 
     def _claim_objects(self, objects: List[str]) -> None:
         """Increases refcounts and bumps the last used timestamp to now for cached objects.
@@ -484,14 +777,16 @@ class ObjectManager(FragmentManager):
         # So, we first try to update cache entries to bump their refcount, see which ones we updated,
         # subtract objects that we have locally and insert the remaining entries as new cache entries.
 
+        # Also record the current value of the cache clock for the eviction policy.
+        clock = self._get_cache_clock()
         claimed = self.object_engine.run_sql(
             SQL(
                 "UPDATE {}.object_cache_status SET refcount = refcount + 1, "
-                "last_used = %s WHERE object_id IN ("
+                "last_used = %s, access_count = access_count + 1, clock = %s WHERE object_id IN ("
             ).format(Identifier(SPLITGRAPH_META_SCHEMA))
             + SQL(",".join(itertools.repeat("%s", len(objects))))
             + SQL(") RETURNING object_id"),
-            [now] + objects,  # type: ignore
+            [now, clock] + objects,  # type: ignore
             return_shape=ResultShape.MANY_ONE,
         )
         claimed = claimed or []
@@ -508,18 +803,46 @@ class ObjectManager(FragmentManager):
         # we try to insert them, we'll be blocked until the other engine finishes its download and commits
         # the transaction -- then get an integrity error. So here, we do an update on conflict (again).
         self.object_engine.run_sql_batch(
-            insert("object_cache_status", ("object_id", "ready", "refcount", "last_used"))
+            insert(
+                "object_cache_status",
+                ("object_id", "ready", "refcount", "last_used", "access_count", "clock"),
+            )
             + SQL(
-                "ON CONFLICT (object_id) DO UPDATE SET refcount = EXCLUDED.refcount + 1, last_used = %s"
+                "ON CONFLICT (object_id) DO UPDATE SET "
+                "refcount = object_cache_status.refcount + 1, last_used = %s, "
+                "access_count = object_cache_status.access_count + 1, clock = %s"
             ),
-            [(object_id, False, 1, now, now) for object_id in remaining],
+            [(object_id, False, 1, now, 1, clock, now, clock) for object_id in remaining],
+        )
+
+        if self.access_log:
+            object_sizes = {o.object_id: o.size for o in self.get_object_meta(objects).values()}
+            write_access_log(
+                self.access_log,
+                [
+                    CacheAccess(time=now, object_id=o, size=object_sizes[o])
+                    for o in claimed + remaining
+                    if o in object_sizes
+                ],
+            )
+
+    def _get_cache_clock(self) -> float:
+        return float(
+            self.object_engine.run_sql(
+                SQL("SELECT clock FROM {}.object_cache_occupancy").format(
+                    Identifier(SPLITGRAPH_META_SCHEMA)
+                ),
+                return_shape=ResultShape.ONE_ONE,
+            )
         )
 
     def _set_ready_flags(self, objects: List[str], is_ready: bool = True) -> None:
         if objects:
             self.object_engine.run_sql(
                 SQL(
-                    "UPDATE {0}.object_cache_status SET ready = %s WHERE object_id IN ("
+                    "UPDATE {0}.object_cache_status SET ready = %s"
+                    + (", reserved = 0" if is_ready else "")
+                    + " WHERE object_id IN ("
                     + ",".join(itertools.repeat("%s", len(objects)))
                     + ")"
                 ).format(Identifier(SPLITGRAPH_META_SCHEMA)),
@@ -538,10 +861,10 @@ class ObjectManager(FragmentManager):
                 objects,
             )
 
-    def _increase_cache_occupancy(self, objects: List[str]) -> None:
-        """Increase the cache occupancy by objects' total size."""
+    def _increase_cache_occupancy(self, objects: List[str]) -> int:
+        """Increase the cache occupancy by objects' total size and return that size."""
         if not objects:
-            return
+            return 0
         total_size = sum(o.size for o in self.get_object_meta(objects).values())
         self.object_engine.run_sql(
             SQL("UPDATE {}.object_cache_occupancy SET total_size = total_size + %s").format(
@@ -549,6 +872,41 @@ class ObjectManager(FragmentManager):
             ),
             (total_size,),
         )
+        return total_size
+
+    def _reserve_objects(self, objects: List[str]) -> int:
+        """
+        Record the space reserved in the cache for objects that are about to be downloaded on their
+        cache entries and increase the cache occupancy by it. Must be called with the cache
+        accounting lock held.
+
+        Objects that already have space reserved for them are skipped: the reservation stays on
+        the cache entry until the object is ready or the entry is deleted, so whoever downloads
+        an object reuses it, even if the manager that made it crashed.
+
+        :return: Newly reserved space, in bytes
+        """
+        if not objects:
+            return 0
+        object_sizes = {o.object_id: o.size for o in self.get_object_meta(objects).values()}
+        reserved = self.object_engine.run_sql(
+            SQL(
+                "UPDATE {}.object_cache_status c SET reserved = o.size "
+                "FROM unnest(%s::varchar[], %s::bigint[]) AS o (object_id, size) "
+                "WHERE c.object_id = o.object_id AND c.ready = 'f' AND c.reserved = 0 "
+                "RETURNING o.size"
+            ).format(Identifier(SPLITGRAPH_META_SCHEMA)),
+            (list(object_sizes.keys()), list(object_sizes.values())),
+            return_shape=ResultShape.MANY_ONE,
+        )
+        total_size = sum(reserved or [])
+        self.object_engine.run_sql(
+            SQL("UPDATE {}.object_cache_occupancy SET total_size = total_size + %s").format(
+                Identifier(SPLITGRAPH_META_SCHEMA)
+            ),
+            (total_size,),
+        )
+        return total_size
 
     def _decrease_cache_occupancy(self, size_freed: int) -> None:
         """Decrease the cache occupancy by a given size."""
@@ -559,26 +917,41 @@ class ObjectManager(FragmentManager):
             (size_freed,),
         )
 
-    def run_eviction(self, keep_objects: List[str], required_space: Optional[int] = None) -> None:
+    def run_eviction(
+        self,
+        keep_objects: List[str],
+        required_space: Optional[int] = None,
+        limit_to: Optional[List[str]] = None,
+    ) -> None:
         """
         Delete enough objects with zero reference count (only those, since we guarantee that whilst refcount is >0,
-        the object stays alive) to free at least `required_space` in the cache.
+        the object stays alive) to free at least `required_space` in the cache. Objects belonging to
+        pinned images (see `pin_image`) are never deleted.
 
         :param keep_objects: List of objects (besides those with nonzero refcount) that can't be deleted.
         :param required_space: Space, in bytes, to free. If the routine can't free at least this much space,
             it shall raise an exception. If None, removes all eligible objects.
+        :param limit_to: If specified, only objects from this list can be deleted.
         """
 
         logging.info("Performing eviction...")
+        self._lock_cache_accounting()
+        keep_objects = set(keep_objects).union(self.get_pinned_objects())
+        allowed_objects = set(limit_to) if limit_to is not None else None
         # Find deletion candidates: objects that we have locally, with refcount 0, that aren't in the whitelist.
-
+        # Lock them so that nobody can claim them until we've deleted them (skipping the ones that
+        # are being claimed right now instead of waiting for them).
         candidates = [
             o
             for o in self.object_engine.run_sql(
-                select("object_cache_status", "object_id,last_used", "refcount=0"),
+                select(
+                    "object_cache_status",
+                    "object_id,last_used,access_count,clock",
+                    "refcount=0 FOR UPDATE SKIP LOCKED",
+                ),
                 return_shape=ResultShape.MANY_MANY,
             )
-            if o[0] not in keep_objects
+            if o[0] not in keep_objects and (allowed_objects is None or o[0] in allowed_objects)
         ]
 
         object_meta = self.get_object_meta([o[0] for o in candidates]) if candidates else {}
@@ -586,7 +959,17 @@ class ObjectManager(FragmentManager):
 
         # Also delete objects that don't have a metadata entry at all
         orphaned_objects = [o[0] for o in candidates if o[0] not in object_sizes]
-        orphaned_object_sizes = {o: self.object_engine.get_object_size(o) for o in orphaned_objects}
+        orphaned_object_sizes = (
+            dict(
+                self.object_engine.run_sql(
+                    select("object_catalog", "object_id,size", "object_id = ANY(%s)"),
+                    (orphaned_objects,),
+                    return_shape=ResultShape.MANY_MANY,
+                )
+            )
+            if orphaned_objects
+            else {}
+        )
         if orphaned_objects:
             logging.info(
                 "Found %s, total size %s: %s",
@@ -608,9 +991,15 @@ class ObjectManager(FragmentManager):
             if required_space > sum(object_sizes.values()) + sum(orphaned_object_sizes.values()):
                 raise ObjectCacheError("Not enough space will be reclaimed after eviction!")
 
-            to_delete, freed_space = self._prepare_eviction_candidates(
+            to_delete, freed_space, clock = self._prepare_eviction_candidates(
                 candidates, object_sizes, orphaned_object_sizes, orphaned_objects, required_space
             )
+            self.object_engine.run_sql(
+                SQL("UPDATE {}.object_cache_occupancy SET clock = GREATEST(clock, %s)").format(
+                    Identifier(SPLITGRAPH_META_SCHEMA)
+                ),
+                (clock,),
+            )
 
         if to_delete:
             # NB delete_objects commits as well, releasing the lock. Make sure to do all bookkeeping first so that
@@ -623,19 +1012,6 @@ class ObjectManager(FragmentManager):
                 "Eviction done. Cache occupancy: %s", pretty_size(self.get_cache_occupancy())
             )
 
-    def _eviction_score(self, now, object_size, last_used):
-        # We want to evict objects in order to minimize
-        # P(object is requested again) * (cost of redownloading the object).
-        # To approximate the probability, we use an exponential decay function (1 if last_used = now, dropping down
-        # to 0 as time since the object's last usage time passes).
-        # To approximate the cost, we use the object's size, floored to a constant (so if the object has
-        # size <= floor, we'd use the floor value -- this is to simulate the latency of re-fetching the object,
-        # as opposed to the bandwidth)
-        time_since_used = (now - last_used).total_seconds()
-        time_factor = math.exp(-self.eviction_decay_constant * time_since_used)
-        size_factor = object_size if object_size > self.eviction_floor else self.eviction_floor
-        return time_factor * size_factor
-
     def _prepare_eviction_candidates(
         self, candidates, object_sizes, orphaned_object_sizes, orphaned_objects, required_space
     ):
@@ -647,44 +1023,158 @@ class ObjectManager(FragmentManager):
 
         # Delete all orphaned objects first
         to_delete = orphaned_objects
-        last_useds = [o[1] for o in candidates if o[0] in orphaned_objects]
+        last_useds = {o[0]: o[1] for o in candidates}
         freed_space = sum(orphaned_object_sizes.values())
 
-        # Sort candidates by deletion priority (lowest is smallest expected retrieval cost -- more likely to delete)
-        candidates = sorted(
-            [o for o in candidates if o[0] not in orphaned_objects],
-            key=lambda o: self._eviction_score(now, object_sizes[o[0]], o[1]),
+        # Let the eviction policy choose the rest.
+        evicted, evicted_space, clock = self.eviction_policy.choose_evicted(
+            [
+                CacheEntry(
+                    object_id=object_id,
+                    size=object_sizes[object_id],
+                    last_used=last_used,
+                    access_count=access_count,
+                    clock=clock,
+                )
+                for object_id, last_used, access_count, clock in candidates
+                if object_id not in orphaned_objects
+            ],
+            required_space - freed_space,
+            now,
+            self._get_cache_clock(),
         )
+        to_delete.extend(evicted)
+        freed_space += evicted_space
 
-        # Keep adding deletion candidates until we've freed enough space.
-        for object_id, last_used in candidates:
-            if freed_space >= required_space:
-                break
-            last_useds.append(last_used)
-            to_delete.append(object_id)
-            freed_space += object_sizes[object_id]
-        logging.info(
-            "Will delete %s last used between %s and %s, total size %s: %s",
-            pluralise("object", len(to_delete)),
-            min(last_useds).isoformat(),
-            max(last_useds).isoformat(),
-            pretty_size(freed_space),
-            to_delete,
+        if to_delete:
+            logging.info(
+                "Will delete %s last used between %s and %s, total size %s: %s",
+                pluralise("object", len(to_delete)),
+                min(last_useds[o] for o in to_delete).isoformat(),
+                max(last_useds[o] for o in to_delete).isoformat(),
+                pretty_size(freed_space),
+                to_delete,
+            )
+        return to_delete, freed_space, clock
+
+    def pin_image(self, image: "Image") -> None:
+        """
+        Pin an image in the object cache: objects required by its tables never get evicted.
+        This doesn't download the objects.
+
+        :param image: Image to pin
+        """
+        self.object_engine.run_sql(
+            insert("object_cache_pins", ("namespace", "repository", "image_hash"))
+            + SQL(" ON CONFLICT DO NOTHING"),
+            (image.repository.namespace, image.repository.repository, image.image_hash),
         )
-        return to_delete, freed_space
 
-    def _delete_cache_entries(self, to_delete: List[str]) -> None:
-        if not to_delete:
-            return
+    def unpin_image(self, image: "Image") -> None:
+        """
+        Unpin an image, letting its objects get evicted from the object cache.
+
+        :param image: Image to unpin
+        """
         self.object_engine.run_sql(
             SQL(
-                "DELETE FROM {}.{} WHERE object_id IN ("
-                + ",".join(itertools.repeat("%s", len(to_delete)))
-                + ")"
-            ).format(Identifier(SPLITGRAPH_META_SCHEMA), Identifier("object_cache_status")),
-            to_delete,
+                "DELETE FROM {}.object_cache_pins WHERE namespace = %s "
+                "AND repository = %s AND image_hash = %s"
+            ).format(Identifier(SPLITGRAPH_META_SCHEMA)),
+            (image.repository.namespace, image.repository.repository, image.image_hash),
+        )
+
+    def get_pinned_images(self) -> List[Tuple[str, str, str]]:
+        """
+        :return: List of (namespace, repository, image_hash) of all pinned images.
+        """
+        return cast(
+            List[Tuple[str, str, str]],
+            self.object_engine.run_sql(
+                select("object_cache_pins", "namespace,repository,image_hash")
+                + SQL(" ORDER BY namespace, repository, image_hash"),
+                return_shape=ResultShape.MANY_MANY,
+            ),
+        )
+
+    def get_pinned_objects(self) -> List[str]:
+        """
+        :return: List of objects required by pinned images.
+        """
+        from splitgraph.core.repository import Repository
+
+        return list(
+            {
+                o
+                for namespace, repository, image_hash in self.get_pinned_images()
+                for o in self.get_objects_for_repository(
+                    Repository(namespace, repository), image_hash
+                )
+            }
         )
 
+    def set_cache_quota(self, namespace: str, repository: str, quota: Optional[int]) -> None:
+        """
+        Limit the space that cached objects belonging to a repository can take up. When a download
+        would exceed the quota, objects belonging to the repository get evicted first.
+
+        :param namespace: Namespace
+        :param repository: Repository. If empty, the quota applies to all repositories in the namespace
+            together.
+        :param quota: Quota, in bytes. If None, removes the quota.
+        """
+        if quota is None:
+            self.object_engine.run_sql(
+                SQL(
+                    "DELETE FROM {}.object_cache_quotas WHERE namespace = %s AND repository = %s"
+                ).format(Identifier(SPLITGRAPH_META_SCHEMA)),
+                (namespace, repository),
+            )
+        else:
+            self.object_engine.run_sql(
+                insert("object_cache_quotas", ("namespace", "repository", "quota"))
+                + SQL(" ON CONFLICT (namespace, repository) DO UPDATE SET quota = EXCLUDED.quota"),
+                (namespace, repository, quota),
+            )
+
+    def get_cache_quotas(self) -> List[Tuple[str, str, int]]:
+        """
+        :return: List of (namespace, repository, quota in bytes) of all cache quotas.
+        """
+        return cast(
+            List[Tuple[str, str, int]],
+            self.object_engine.run_sql(
+                select("object_cache_quotas", "namespace,repository,quota")
+                + SQL(" ORDER BY namespace, repository"),
+                return_shape=ResultShape.MANY_MANY,
+            ),
+        )
+
+    def _delete_cache_entries(self, to_delete: List[str], only_unready: bool = False) -> None:
+        """
+        Delete objects' entries from the cache status table.
+
+        :param to_delete: Objects to delete the entries for
+        :param only_unready: Only delete entries for objects that haven't been downloaded
+            and aren't claimed by anyone, giving back the space reserved for them.
+        """
+        if not to_delete:
+            return
+        query = SQL(
+            "DELETE FROM {}.{} WHERE object_id IN ("
+            + ",".join(itertools.repeat("%s", len(to_delete)))
+            + ")"
+        ).format(Identifier(SPLITGRAPH_META_SCHEMA), Identifier("object_cache_status"))
+        if only_unready:
+            freed = self.object_engine.run_sql(
+                query + SQL(" AND ready = 'f' AND refcount = 0 RETURNING reserved"),
+                to_delete,
+                return_shape=ResultShape.MANY_ONE,
+            )
+            self._decrease_cache_occupancy(sum(freed or []))
+        else:
+            self.object_engine.run_sql(query, to_delete)
+
     def download_objects(
         self,
         source: Optional["ObjectManager"],
@@ -778,6 +1268,111 @@ class ObjectManager(FragmentManager):
         with switch_engine(self.object_engine):
             return external_handler.upload_objects(objects_to_push, target.metadata_engine)
 
+    def get_cached_query_plan(
+        self, plan_id: str
+    ) -> Optional[Tuple[List[str], List[str], List[str], int]]:
+        """
+        Get a query plan from the plan cache shared between all sessions on the object engine.
+
+        :param plan_id: ID of the plan (see `splitgraph.core.table.get_query_plan_id`)
+        :return: Tuple of (filtered objects, non-singleton objects, singleton objects,
+            estimated number of rows) or None if the plan isn't cached.
+        """
+        return cast(
+            Optional[Tuple[List[str], List[str], List[str], int]],
+            self.object_engine.run_sql(
+                select(
+                    "query_plan_cache",
+                    "filtered_objects, non_singletons, singletons, estimated_rows",
+                    "plan_id = %s",
+                ),
+                (plan_id,),
+                return_shape=ResultShape.ONE_MANY,
+            ),
+        )
+
+    def cache_query_plan(
+        self,
+        plan_id: str,
+        table: "Table",
+        filtered_objects: List[str],
+        non_singletons: List[str],
+        singletons: List[str],
+        estimated_rows: int,
+    ) -> None:
+        """
+        Store a query plan in the shared plan cache. The plan becomes visible to other sessions
+        when the caller's transaction commits. If another session is already caching the same
+        plan, this does nothing instead of waiting for it.
+
+        Only SG_QUERY_PLAN_CACHE_SIZE most recently cached plans are kept.
+
+        :param plan_id: ID of the plan (see `splitgraph.core.table.get_query_plan_id`)
+        :param table: Table the plan is for
+        :param filtered_objects: Objects that the query needs
+        :param non_singletons: Objects that have to be applied to a staging table
+        :param singletons: Objects that can be queried directly
+        :param estimated_rows: Estimated number of rows in the filtered objects
+        """
+        cache_size = int(get_singleton(CONFIG, "SG_QUERY_PLAN_CACHE_SIZE"))
+        if cache_size <= 0:
+            return
+
+        if not self.object_engine.run_sql(
+            "SELECT pg_try_advisory_xact_lock(%s, hashtext(%s))",
+            (_QUERY_PLAN_LOCK_CLASS, plan_id),
+            return_shape=ResultShape.ONE_ONE,
+        ):
+            return
+
+        self.object_engine.run_sql(
+            insert(
+                "query_plan_cache",
+                [
+                    "plan_id",
+                    "objects",
+                    "filtered_objects",
+                    "non_singletons",
+                    "singletons",
+                    "estimated_rows",
+                    "created",
+                ],
+            )
+            + SQL(" ON CONFLICT (plan_id) DO NOTHING"),
+            (
+                plan_id,
+                table.objects,
+                filtered_objects,
+                non_singletons,
+                singletons,
+                estimated_rows,
+                dt.utcnow(),
+            ),
+        )
+        self.object_engine.run_sql(
+            SQL(
+                "DELETE FROM {0}.query_plan_cache WHERE plan_id IN (SELECT plan_id "
+                "FROM {0}.query_plan_cache ORDER BY created DESC OFFSET %s)"
+            ).format(Identifier(SPLITGRAPH_META_SCHEMA)),
+            (cache_size,),
+        )
+
+    def invalidate_query_plans(self, objects: List[str]) -> None:
+        """
+        Delete all cached query plans for tables that include any of the given objects
+        (e.g. because the objects' indexes have changed).
+
+        :param objects: List of object IDs
+        """
+        if not objects:
+            return
+        self.object_engine.run_sql(
+            SQL("DELETE FROM {}.query_plan_cache WHERE objects && %s::varchar[]").format(
+                Identifier(SPLITGRAPH_META_SCHEMA)
+            ),
+            (objects,),
+        )
+
     def cleanup(self) -> List[str]:
         """
         Deletes all objects in the object_tree not required by any current repository, including their dependencies and
@@ -794,6 +1389,12 @@ class ObjectManager(FragmentManager):
         else:
             self.object_engine.run_sql(query)
 
+        # Cached query plans can refer to tables that don't exist anymore: they're
+        # cheap to recalculate, so drop all of them.
+        self.object_engine.run_sql(
+            SQL("DELETE FROM {}.query_plan_cache").format(Identifier(SPLITGRAPH_META_SCHEMA))
+        )
+
         # Go through the physical objects and delete them as well
         # This is slightly dirty, but since the info about the objects
         # was deleted on rm, we just say that anything in splitgraph_meta
@@ -803,7 +1404,15 @@ class ObjectManager(FragmentManager):
             for c in self.object_engine.get_all_tables(SPLITGRAPH_META_SCHEMA)
             if c not in META_TABLES
         }
-        tables_in_meta.update(self.get_downloaded_objects())
+
+        # List the object storage itself rather than the object catalog: files written by
+        # transactions that got rolled back aren't in the catalog. Bring the catalog up to
+        # date with the storage whilst we're at it.
+        stored_objects = self.object_engine.run_api_call("list_objects")
+        self.object_engine.reconcile_object_catalog(
+            list(set(stored_objects).union(self.get_downloaded_objects()))
+        )
+        tables_in_meta.update(stored_objects)
 
         to_delete = [
             t for t in tables_in_meta if t not in registered_objects or t in deleted_objects
@@ -19,6 +19,22 @@ def pretty_size(size: Union[int, float]) -> str:
     return "%.2f %s" % (size, {0: "", 1: "Ki", 2: "Mi", 3: "Gi", 4: "Ti"}[base] + "B")
 
 
+_size_re = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)(?:i?b)?\s*$", re.IGNORECASE)
+
+
+def parse_size(size: str) -> int:
+    """
+    Converts a string representation of a size into bytes (e.g. 1KB -> 1024, 64MiB -> 67108864).
+    Units are treated as powers of 2.
+    :param size: Size string
+    """
+    match = _size_re.match(size)
+    if not match:
+        raise ValueError("Unknown size format for string %s!" % size)
+    number, unit = match.groups()
+    return int(float(number) * 2 ** (10 * " kmgt".index(unit.lower() or " ")))
+
+
 def pluralise(word: str, number: int) -> str:
     """1 banana, 2 bananas"""
     return "%d %s%s" % (number, word, "" if number == 1 else "s")
@@ -401,6 +401,8 @@ class Repository:
         extra_indexes: Optional[Dict[str, ExtraIndexInfo]] = None,
         in_fragment_order: Optional[Dict[str, List[str]]] = None,
         overwrite: bool = False,
+        workers: int = 1,
+        chunk_bytes: Optional[int] = None,
     ) -> Image:
         """
         Commits all pending changes to a given repository, creating a new image.
@@ -421,8 +423,15 @@ class Repository:
             table.
         :param extra_indexes: Dictionary of {table: index_type: column: index_specific_kwargs}.
         :param in_fragment_order: Dictionary of {table: list of columns}. If specified, will
-        sort the data inside each chunk by this/these key(s) for each table.
+        sort the data inside each chunk by this/these key(s) for each table. By default, the
+        data is sorted by the table's primary key, which adds a sort of every chunk to the
+        commit but lets layered queries return rows in the primary key order without sorting.
         :param overwrite: If an object already exists, will force recreate it.
+        :param workers: Number of connections to use to store chunks of tables that are
+            stored as snapshots in parallel.
+        :param chunk_bytes: If specified, overrides `chunk_size` for every table stored
+            as a snapshot with a number of rows estimated to make each chunk approximately
+            this many bytes large.
 
         :return: The newly created Image object.
         """
@@ -449,6 +458,8 @@ class Repository:
             extra_indexes=extra_indexes,
             in_fragment_order=in_fragment_order,
             overwrite=overwrite,
+            workers=workers,
+            chunk_bytes=chunk_bytes,
         )
 
         set_head(self, image_hash)
@@ -467,6 +478,8 @@ class Repository:
         extra_indexes: Optional[Dict[str, ExtraIndexInfo]] = None,
         in_fragment_order: Optional[Dict[str, List[str]]] = None,
         overwrite: bool = False,
+        workers: int = 1,
+        chunk_bytes: Optional[int] = None,
     ) -> None:
         """
         Reads the recorded pending changes to all tables in a given checked-out image,
@@ -518,6 +531,8 @@ class Repository:
                     extra_indexes=extra_indexes.get(table),
                     in_fragment_order=in_fragment_order.get(table),
                     overwrite=overwrite,
+                    workers=workers,
+                    chunk_bytes=chunk_bytes,
                 )
                 continue
 
@@ -3,6 +3,7 @@ import itertools
 import logging
 import threading
 from contextlib import contextmanager
+from hashlib import sha256
 from math import ceil
 from typing import (
     Any,
@@ -20,22 +21,32 @@ from typing import (
 from psycopg2.sql import SQL, Identifier, Composable
 from tqdm import tqdm
 
-from splitgraph.config import SPLITGRAPH_META_SCHEMA, SPLITGRAPH_API_SCHEMA, SG_CMD_ASCII
-from splitgraph.core.common import Tracer
+from splitgraph.config import (
+    SPLITGRAPH_META_SCHEMA,
+    SPLITGRAPH_API_SCHEMA,
+    SG_CMD_ASCII,
+    CONFIG,
+    get_singleton,
+)
+from splitgraph.core.common import Tracer, CallbackList
 from splitgraph.core.fragment_manager import (
     get_temporary_table_id,
-    get_chunk_groups,
+    get_pk_lookup_keys,
     ExtraIndexInfo,
+    PKIntervalIndex,
 )
-from splitgraph.core.indexing.range import quals_to_sql
+from splitgraph.core.indexing.range import quals_to_sql, _strip_type_mod, SCAN_ORDER_TYPES
+from splitgraph.core.indexing.stats import estimate_selectivity, estimate_row_width
 from splitgraph.core.output import pluralise, truncate_list
 from splitgraph.core.sql import select
 from splitgraph.core.types import TableSchema, Quals
 from splitgraph.engine import ResultShape
+from splitgraph.engine.postgres.engine import get_change_key, SG_UD_FLAG
 from splitgraph.exceptions import ObjectIndexingError
 
 if TYPE_CHECKING:
     from splitgraph.core.image import Image
+    from splitgraph.core.metadata_manager import Object
     from splitgraph.core.repository import Repository
     from splitgraph.engine.postgres.engine import PostgresEngine
 
@@ -66,6 +77,19 @@ def _generate_select_query(
     return cast(bytes, query)
 
 
+def _generate_sorted_subquery(
+    engine: "PostgresEngine", schema: str, table: str, order_by: List[str]
+) -> bytes:
+    cur = engine.connection.cursor()
+    result = cur.mogrify(
+        SQL("(SELECT * FROM {}.{} ORDER BY ").format(Identifier(schema), Identifier(table))
+        + SQL(",").join(Identifier(c) for c in order_by)
+        + SQL(") AS {}").format(Identifier(table))
+    )
+    cur.close()
+    return cast(bytes, result)
+
+
 def _generate_table_names(engine: "PostgresEngine", schema: str, tables: List[str]) -> List[bytes]:
     result = []
     cur = engine.connection.cursor()
@@ -97,6 +121,67 @@ def _delete_temporary_table(engine: "PostgresEngine", schema: str, table: str) -
         conn.close()
 
 
+def _get_pk_lookup_fragments(
+    engine: "PostgresEngine",
+    fragments: List[str],
+    table_pks: List[Tuple[str, str]],
+    keys: List[Tuple],
+) -> Optional[List[str]]:
+    """
+    Find fragments that the newest versions of rows with given PKs are in, so that
+    they can be queried directly instead of being applied to a staging table.
+
+    Fragments later in the list override earlier ones and rows that have been deleted
+    by a fragment (with `sg_ud_flag` set to False) don't need to be queried at all.
+
+    :param engine: Engine the fragments are on
+    :param fragments: List of object IDs in the order they're applied in.
+    :param table_pks: List of tuples (column, type) that form the table's PK.
+    :param keys: PKs to look up
+    :return: List of fragments to query or None if one of the fragments can't be
+        queried directly (since it also has older versions or deletions of some of the
+        requested rows).
+    """
+    pk_cols = SQL(",").join(Identifier(c) for c, _ in table_pks)
+    key_placeholder = SQL("(" + ",".join(itertools.repeat("%s", len(table_pks))) + ")")
+    key_filter = (
+        SQL("(")
+        + pk_cols
+        + SQL(") IN (")
+        + SQL(",").join(itertools.repeat(key_placeholder, len(keys)))
+        + SQL(")")
+    )
+    query = SQL(" UNION ALL ").join(
+        SQL("SELECT ")
+        + pk_cols
+        + SQL(",{}, %s FROM {}.{} WHERE ").format(
+            Identifier(SG_UD_FLAG), Identifier(SPLITGRAPH_META_SCHEMA), Identifier(fragment)
+        )
+        + key_filter
+        for fragment in fragments
+    )
+    key_args = [v for key in keys for v in key]
+    args = [a for i in range(len(fragments)) for a in [i] + key_args]
+
+    # For every PK, find the last fragment that has it and whether it's an upsert or a deletion.
+    newest: Dict[Tuple, Tuple[int, bool]] = {}
+    fragment_rows: Dict[int, List[Tuple]] = {}
+    for row in engine.run_sql(query, args):
+        pk, upserted, fragment_no = tuple(row[:-2]), row[-2], row[-1]
+        fragment_rows.setdefault(fragment_no, []).append(pk)
+        if pk not in newest or newest[pk][0] < fragment_no:
+            newest[pk] = (fragment_no, upserted)
+
+    result = []
+    for fragment_no in sorted(fragment_rows):
+        is_newest = [newest[pk] == (fragment_no, True) for pk in fragment_rows[fragment_no]]
+        if all(is_newest):
+            result.append(fragments[fragment_no])
+        elif any(is_newest):
+            return None
+    return result
+
+
 def _empty_callback(**kwargs) -> None:
     pass
 
@@ -143,18 +228,86 @@ class QueryPlan:
         self.tracer = Tracer()
 
         self.object_manager = table.repository.objects
+        self._non_singleton_groups: Optional[List[List[str]]] = None
 
         self.required_objects = table.objects
         self.tracer.log("resolve_objects")
+
+        # If the query only looks up rows with given PKs, overlapping fragments can be
+        # resolved by finding the newest version of every row instead of applying them.
+        self.table_pks = get_change_key(self.table.table_schema)
+        self.pk_lookup_keys = (
+            get_pk_lookup_keys(quals, self.table_pks)
+            if any(c.is_pk for c in self.table.table_schema)
+            else None
+        )
+
+        # Other sessions on the engine might have already planned this query, in which case
+        # we can skip fragment filtering and grouping (which need several metadata lookups).
+        # PK lookups are cheap to plan and would fill the cache with one plan per key,
+        # so they're not cached.
+        use_plan_cache = (
+            self.pk_lookup_keys is None
+            and int(get_singleton(CONFIG, "SG_QUERY_PLAN_CACHE_SIZE")) > 0
+        )
+        plan_id = get_query_plan_id(table, quals, columns)
+        cached_plan = self.object_manager.get_cached_query_plan(plan_id) if use_plan_cache else None
+        if cached_plan:
+            (
+                self.filtered_objects,
+                self.non_singletons,
+                self.singletons,
+                self.estimated_rows,
+            ) = cached_plan
+            logging.info("Using a cached query plan %s", plan_id)
+            self.tracer.log("filter_objects")
+            self.tracer.log("group_fragments")
+        else:
+            self._plan()
+            if use_plan_cache:
+                self.object_manager.cache_query_plan(
+                    plan_id,
+                    table,
+                    self.filtered_objects,
+                    self.non_singletons,
+                    self.singletons,
+                    self.estimated_rows,
+                )
+
+        self.sql_quals, self.sql_qual_vals = quals_to_sql(
+            quals, column_types={c.name: c.pg_type for c in self.table.table_schema}
+        )
+
+        # Columns to materialize non-singleton fragments with: the requested columns, columns
+        # that the qualifiers refer to (since they get rechecked on the staging table) and
+        # the columns used to find rows that fragments delete or update.
+        projection = set(columns).union(q[0] for or_quals in quals or [] for q in or_quals)
+        projection.update(c for c, _ in get_change_key(self.table.table_schema))
+        self.projected_schema = [c for c in self.table.table_schema if c.name in projection]
+
+        if self.singletons:
+            self.singleton_queries = _generate_table_names(
+                self.object_manager.object_engine, SPLITGRAPH_META_SCHEMA, self.singletons
+            )
+        else:
+            self.singleton_queries = []
+        self.tracer.log("generate_singleton_queries")
+
+    def _plan(self) -> None:
         self.filtered_objects = self.object_manager.filter_fragments(
-            self.required_objects, table, quals
+            self.required_objects, self.table, self.quals
         )
-        # Estimate the number of rows in the filtered objects
-        self.estimated_rows = sum(
-            [
-                o.rows_inserted - o.rows_deleted
-                for o in self.object_manager.get_object_meta(self.filtered_objects).values()
-            ]
+        # Estimate the number of rows in the filtered objects that match the qualifiers
+        object_meta = self.table.get_object_meta()
+        column_types = {c.name: c.pg_type for c in self.table.table_schema}
+        self.estimated_rows = int(
+            round(
+                sum(
+                    (object_meta[o].rows_inserted - object_meta[o].rows_deleted)
+                    * estimate_selectivity(self.quals, object_meta[o].object_index, column_types)
+                    for o in self.filtered_objects
+                )
+            )
         )
         self.tracer.log("filter_objects")
 
@@ -162,15 +315,8 @@ class QueryPlan:
 
         # Special fast case: single-chunk groups can all be batched together
         # and queried directly without having to copy them to a staging table.
-        # We also grab all fragments from multiple-fragment groups and batch them together
-        # for future application.
-        #
-        # Technically, we could do multiple batches of application for these groups
-        # (apply first batch to the staging table, extract the result, clean the table,
-        # apply next batch etc): in the middle of it we could also talk back to the object
-        # manager and release the objects that we don't need so that they can be garbage
-        # collected. The tradeoff is that we perform more calls to apply_fragments (hence
-        # more roundtrips).
+        # We also grab all fragments from multiple-fragment groups for future application
+        # (each group is applied to its own staging table, see query_indirect).
         self.non_singletons, self.singletons = self._extract_singleton_fragments()
 
         logging.info(
@@ -180,40 +326,51 @@ class QueryPlan:
         )
         self.tracer.log("group_fragments")
 
-        self.sql_quals, self.sql_qual_vals = quals_to_sql(
-            quals, column_types={c.name: c.pg_type for c in self.table.table_schema}
-        )
-
-        if self.singletons:
-            self.singleton_queries = _generate_table_names(
-                self.object_manager.object_engine, SPLITGRAPH_META_SCHEMA, self.singletons
-            )
-        else:
-            self.singleton_queries = []
-        self.tracer.log("generate_singleton_queries")
-
     def _extract_singleton_fragments(self) -> Tuple[List[str], List[str]]:
-        # Get fragment boundaries (min-max PKs of every fragment).
-        table_pk = [(t[1], t[2]) for t in self.table.table_schema if t[3]]
-        if not table_pk:
-            table_pk = [(t[1], t[2]) for t in self.table.table_schema]
-        object_pks = self.object_manager.get_min_max_pks(self.filtered_objects, table_pk)
         # Group fragments into non-overlapping groups: those can be applied independently of each other.
-        object_groups = get_chunk_groups(
-            [
-                (object_id, min_max[0], min_max[1])
-                for object_id, min_max in zip(self.filtered_objects, object_pks)
-            ]
-        )
+        object_groups = self.table.get_pk_intervals().group_fragments(self.filtered_objects)
         singletons: List[str] = []
         non_singletons: List[str] = []
+        self._non_singleton_groups = []
         for group in object_groups:
             if len(group) == 1:
                 singletons.append(group[0][0])
             else:
                 non_singletons.extend(object_id for object_id, _, _ in group)
+                self._non_singleton_groups.append([object_id for object_id, _, _ in group])
         return non_singletons, singletons
 
+    def get_estimated_row_width(self) -> int:
+        """
+        Estimate the width of the rows returned by this query from the column statistics
+        in the index of the filtered objects.
+
+        :return: Estimated row width in bytes
+        """
+        object_meta = self.table.get_object_meta()
+        return estimate_row_width(
+            [
+                (object_meta[o].rows_inserted, object_meta[o].object_index)
+                for o in self.filtered_objects
+            ],
+            list(self.columns),
+        )
+
+    def get_non_singleton_groups(self) -> List[List[str]]:
+        """
+        Get groups of non-singleton fragments that overlap each other (but not fragments
+        from any other group). Each group can be applied to a staging table independently.
+
+        :return: List of lists of object IDs
+        """
+        if self._non_singleton_groups is None:
+            # The plan was loaded from the cache: regroup the fragments.
+            self._non_singleton_groups = [
+                [object_id for object_id, _, _ in group]
+                for group in self.table.get_pk_intervals().group_fragments(self.non_singletons)
+            ]
+        return self._non_singleton_groups
+
 
 QueryPlanCacheKey = Tuple[Optional[Tuple[Tuple[Tuple[str, str, Any]]]], Tuple[str]]
 
@@ -231,6 +388,17 @@ def _get_plan_cache_key(quals: Optional[Quals], columns: Sequence[str]) -> Query
     return quals, columns
 
 
+def get_query_plan_id(table: "Table", quals: Optional[Quals], columns: Sequence[str]) -> str:
+    """
+    Get the ID of a query plan in the plan cache shared between sessions. Since the table's
+    objects are a part of the ID, plans for tables that have been relinked to different objects
+    (e.g. compacted) aren't reused. Plans get invalidated when any of their objects is reindexed.
+    """
+    return sha256(
+        repr((table.objects, _get_plan_cache_key(quals, columns))).encode("utf-8")
+    ).hexdigest()
+
+
 def merge_index_data(current_index: Dict[str, Any], new_index: Dict[str, Any]):
     for index_type, index_data in new_index.items():
         for col_name, col_index_data in index_data.items():
@@ -263,10 +431,76 @@ class Table:
         self.objects = objects
 
         self._query_plans: Dict[Tuple[Optional[Quals], Tuple[str]], QueryPlan] = {}
+        self._object_meta: Optional[Dict[str, "Object"]] = None
+        self._pk_intervals: Optional[PKIntervalIndex] = None
 
     def __repr__(self) -> str:
         return "Table %s in %s" % (self.table_name, str(self.image))
 
+    def get_object_meta(self) -> Dict[str, "Object"]:
+        """
+        Get metadata (indexes, sizes and row counts) for all objects in this table. This is
+        loaded in a single query the first time it's needed and then cached on the Table,
+        so that query planning doesn't need separate roundtrips for filtering, row estimates
+        and fragment grouping.
+
+        :return: Dictionary of object_id -> Object
+        """
+        if self._object_meta is None:
+            self._object_meta = self.repository.objects.get_object_meta(self.objects)
+        return self._object_meta
+
+    def get_pk_intervals(self) -> PKIntervalIndex:
+        """
+        Get an index of primary key ranges of all objects in this table that can be used
+        to find objects that might contain given primary keys and to group objects that
+        overlap each other. Like object metadata, this is built once and cached on the Table.
+
+        :return: PKIntervalIndex
+        """
+        if self._pk_intervals is None:
+            table_pk = get_change_key(self.table_schema)
+            self._pk_intervals = PKIntervalIndex(
+                self.objects,
+                self.repository.objects.get_min_max_pks(
+                    self.objects, table_pk, self.get_object_meta()
+                ),
+                table_pk,
+            )
+        return self._pk_intervals
+
+    def get_scan_order(self) -> List[str]:
+        """
+        Get the columns that `query_indirect` can return rows of this table sorted by
+        without having to sort them. This is the longest prefix of the primary key that
+        all of the table's objects are stored sorted by.
+
+        Only columns whose sort order doesn't depend on the collation are supported,
+        since fragments are put in order using the primary key ranges in their indexes.
+
+        :return: List of column names (empty if the rows can't be returned in order)
+        """
+        pk = [c for c in self.table_schema if c.is_pk]
+        scan_order = []
+        for column in pk:
+            if _strip_type_mod(column.pg_type) not in SCAN_ORDER_TYPES:
+                break
+            scan_order.append(column.name)
+
+        # Fragments stored with a custom in-fragment order can still be used
+        # if it starts with (some of) the primary key.
+        object_meta = self.get_object_meta()
+        for object_id in self.objects:
+            fragment_order = object_meta[object_id].object_index.get("order", [])
+            common = 0
+            while (
+                common < min(len(scan_order), len(fragment_order))
+                and scan_order[common] == fragment_order[common]
+            ):
+                common += 1
+            scan_order = scan_order[:common]
+        return scan_order
+
     def get_query_plan(
         self, quals: Optional[Quals], columns: Sequence[str], use_cache: bool = True
     ) -> QueryPlan:
@@ -302,6 +536,7 @@ class Table:
         destination: str,
         destination_schema: Optional[str] = None,
         lq_server: Optional[str] = None,
+        workers: int = 1,
     ) -> None:
         """
         Materializes a Splitgraph table in the target schema as a normal Postgres table, potentially downloading all
@@ -310,6 +545,10 @@ class Table:
         :param destination: Name of the destination table.
         :param destination_schema: Name of the destination schema.
         :param lq_server: If set, sets up a layered querying FDW for the table instead using this foreign server.
+        :param workers: If greater than 1, apply groups of fragments that don't overlap each other
+            in parallel, each on its own engine connection (at most SG_ENGINE_POOL - 1). Note this
+            commits the engine transaction after creating the destination table. If applying the
+            fragments then fails, the destination table is dropped (and the drop committed).
         """
         destination_schema = destination_schema or self.repository.to_schema()
         engine = self.repository.object_engine
@@ -321,32 +560,99 @@ class Table:
             with object_manager.ensure_objects(
                 table=self, objects=self.objects
             ) as required_objects:
+                required_objects = cast(List[str], required_objects)
+
+                # Fragments that don't overlap any other fragment (e.g. chunks of a table
+                # that's been committed as a snapshot) can be inserted into the table directly,
+                # without looking for rows that they replace. In that case, we create the table
+                # without the primary key and only build its index after inserting them.
+                groups: List[List[str]] = []
+                if required_objects and get_change_key(self.table_schema):
+                    groups = [
+                        [o for o, _, _ in g]
+                        for g in self.get_pk_intervals().group_fragments(required_objects)
+                    ]
+                singletons = [g[0] for g in groups if len(g) == 1]
+                table_pk = [c.name for c in self.table_schema if c.is_pk]
+
                 engine.create_table(
                     schema=destination_schema,
                     table=destination,
-                    schema_spec=self.table_schema,
+                    schema_spec=[c._replace(is_pk=False) for c in self.table_schema]
+                    if singletons
+                    else self.table_schema,
                     include_comments=True,
                     unlogged=True,
                 )
-                if required_objects:
-                    logging.debug("Applying %s...", pluralise("fragment", len(required_objects)))
+                if not required_objects:
+                    return
+
+                logging.debug("Applying %s...", pluralise("fragment", len(required_objects)))
 
-                    table_size = self.get_size()
+                table_size = self.get_size()
 
-                    progress_every: Optional[int]
-                    if table_size > _PROGRESS_EVERY:
-                        progress_every = int(
-                            ceil(len(required_objects) * _PROGRESS_EVERY / float(table_size))
+                progress_every: Optional[int]
+                if table_size > _PROGRESS_EVERY:
+                    progress_every = int(
+                        ceil(len(required_objects) * _PROGRESS_EVERY / float(table_size))
+                    )
+                else:
+                    progress_every = None
+
+                committed = False
+
+                def _apply(fragment_groups: List[List[str]], insert_only: bool = False) -> None:
+                    nonlocal committed
+                    if workers > 1 and len(fragment_groups) > 1:
+                        # Other connections have to be able to see the destination table.
+                        engine.commit()
+                        committed = True
+                        engine.apply_fragment_groups(
+                            [[(SPLITGRAPH_META_SCHEMA, o) for o in g] for g in fragment_groups],
+                            destination_schema,
+                            destination,
+                            schema_spec=self.table_schema,
+                            workers=workers,
+                            insert_only=insert_only,
                         )
                     else:
-                        progress_every = None
+                        engine.apply_fragments(
+                            [(SPLITGRAPH_META_SCHEMA, o) for g in fragment_groups for o in g],
+                            destination_schema,
+                            destination,
+                            schema_spec=self.table_schema,
+                            progress_every=progress_every,
+                            insert_only=insert_only,
+                        )
 
-                    engine.apply_fragments(
-                        [(SPLITGRAPH_META_SCHEMA, d) for d in cast(List[str], required_objects)],
-                        destination_schema,
-                        destination,
-                        progress_every=progress_every,
-                    )
+                try:
+                    if not groups:
+                        _apply([required_objects])
+                        return
+
+                    if singletons:
+                        logging.debug(
+                            "Inserting %s", pluralise("non-overlapping fragment", len(singletons))
+                        )
+                        _apply([[s] for s in singletons], insert_only=True)
+                        if table_pk:
+                            engine.run_sql(
+                                SQL("ALTER TABLE {}.{} ADD PRIMARY KEY (").format(
+                                    Identifier(destination_schema), Identifier(destination)
+                                )
+                                + SQL(",").join(Identifier(c) for c in table_pk)
+                                + SQL(")")
+                            )
+
+                    # Apply patches to the groups of fragments that overlap each other.
+                    _apply([g for g in groups if len(g) > 1])
+                except Exception:
+                    if committed:
+                        # Don't leave a partially built table behind.
+                        engine.rollback()
+                        engine.delete_table(destination_schema, destination)
+                        engine.commit()
+                    raise
         else:
             query, args = create_foreign_table(
                 destination_schema, lq_server, self.table_name, self.table_schema
@@ -355,7 +661,11 @@ class Table:
             engine.run_sql(query, args)
 
     def query_indirect(
-        self, columns: List[str], quals: Optional[Quals]
+        self,
+        columns: List[str],
+        quals: Optional[Quals],
+        release_consumed: bool = False,
+        ordered: bool = False,
     ) -> Tuple[Iterator[bytes], Callable, QueryPlan]:
         """
         Run a read-only query against this table without materializing it. Instead of
@@ -367,11 +677,23 @@ class Table:
         Splitgraph objects and only when those are exhausted will it start materializing
         delta-compressed fragments.
 
+        Objects are downloaded lazily as the caller advances the generator, in batches that
+        start with one object and double up to SG_LQ_FETCH_BATCH objects (or all at once if
+        it's 0), so that a caller that stops early (e.g. because of a LIMIT) doesn't
+        download the whole table.
+
         This is an advanced method: you probably want to call table.query().
 
         :param columns: List of columns from this table to fetch
         :param quals: List of qualifiers in conjunctive normal form. See the documentation for
             FragmentManager.filter_fragments for the actual format.
+        :param release_consumed: Delete staging tables as soon as the caller asks for the next
+            query instead of when the callback is called. Only safe if the caller has finished
+            reading from the previous table by then and isn't holding a lock on it (which
+            isn't the case for the FDW).
+        :param ordered: Return tables in such an order that reading them one after another
+            gives rows sorted by the columns returned by `get_scan_order` (which mustn't be empty).
+            Staging tables are then returned as subqueries that sort them by the primary key.
         :return: Generator of queries (bytes), a callback and a query plan object (containing stats
             that are fully populated after the callback has been called to end the query).
         """
@@ -386,24 +708,55 @@ class Table:
             return cast(Iterator[bytes], []), cast(Callable, _empty_callback), plan
 
         object_manager = self.repository.objects
-        if not plan.non_singletons:
+        engine = self.repository.object_engine
+        fetch_batch = int(get_singleton(CONFIG, "SG_LQ_FETCH_BATCH"))
+        release_callback = CallbackList()
+
+        def _ensure_objects(objects: List[str]) -> Callable:
             with object_manager.ensure_objects(
-                self, objects=required_objects, defer_release=True, tracer=plan.tracer
+                self, objects=objects, defer_release=True, tracer=plan.tracer
             ) as eo_result:
-                _, release_callback = cast(Tuple, eo_result)
-                return iter(plan.singleton_queries), cast(Callable, release_callback), plan
-
-        def _generate_nonsingleton_query():
-            # If we have fragments that need applying to a staging area, we don't want to
-            # do it immediately: the caller might be satisfied with the data they got from
-            # the queries to singleton fragments. So here we have a callback that, when called,
-            # actually materializes the chunks into a temporary table and then changes
-            # the table's release callback to also delete that temporary table.
-
-            # There's a slight issue: we can't use temporary tables if we're returning
-            # pointers to tables since the caller might be in a different session.
-            staging_table = self._create_staging_table()
-            engine = self.repository.object_engine
+                _, objects_callback = cast(Tuple, eo_result)
+            release_callback.append(objects_callback)
+            return cast(Callable, objects_callback)
+
+        def _fetch_lazily(groups: List[List[str]]) -> Iterator[List[str]]:
+            # Yield groups of objects, making sure they're downloaded just before the caller
+            # needs them. Batches start small (so that a caller that only wants a few rows gets
+            # them after downloading one object) and grow so that full scans still download
+            # objects in parallel.
+            if not fetch_batch:
+                yield from groups
+                return
+
+            batch_size = 1
+            position = 0
+            batch_callback: Optional[Callable] = None
+            while position < len(groups):
+                if batch_callback and release_consumed:
+                    # The caller has asked for the next table, so it's done with the previous
+                    # batch and the objects can be evicted if needed.
+                    batch_callback()
+                batch = groups[position : position + batch_size]
+                batch_callback = _ensure_objects([o for group in batch for o in group])
+                yield from batch
+                position += batch_size
+                batch_size = min(batch_size * 2, fetch_batch)
+
+        def _generate_singleton_queries():
+            for _, query in zip(
+                _fetch_lazily([[o] for o in plan.singletons]), plan.singleton_queries
+            ):
+                yield query
+
+        if not fetch_batch:
+            _ensure_objects(required_objects)
+
+        if not plan.non_singletons and not ordered:
+            return _generate_singleton_queries(), cast(Callable, release_callback), plan
+
+        def _make_delete_callback(staging_table: str) -> Callable:
+            deleted = False
 
             def _f(from_fdw=False):
                 # This is very horrible but the way we share responsibilities between ourselves
@@ -423,6 +776,10 @@ class Table:
                 # Instead, we pretend that we've successfully cleaned up but actually spawn
                 # a thread whose single job will be running DROP table and waiting until it actually
                 # returns.
+                nonlocal deleted
+                if deleted:
+                    return
+                deleted = True
 
                 if from_fdw:
                     thread = threading.Thread(
@@ -433,39 +790,115 @@ class Table:
                 else:
                     engine.delete_table(SPLITGRAPH_META_SCHEMA, staging_table)
 
-            nonlocal release_callback
-            release_callback.append(_f)
+            return _f
+
+        previous_callback: Optional[Callable] = None
+
+        def _materialize_group(group: List[str]) -> bytes:
+            # There's a slight issue: we can't use temporary tables if we're returning
+            # pointers to tables since the caller might be in a different session.
+            nonlocal previous_callback
+            if previous_callback and release_consumed:
+                # The caller has asked for the next table, so it's done with the previous one.
+                previous_callback()
+
+            staging_table = self._create_staging_table(plan.projected_schema)
+            previous_callback = _make_delete_callback(staging_table)
+            release_callback.append(previous_callback)
 
             # Apply the fragments (just the parts that match the qualifiers) to the staging area
             if quals:
                 engine.apply_fragments(
-                    [(SPLITGRAPH_META_SCHEMA, o) for o in plan.non_singletons],
+                    [(SPLITGRAPH_META_SCHEMA, o) for o in group],
                     SPLITGRAPH_META_SCHEMA,
                     staging_table,
                     extra_quals=plan.sql_quals,
                     extra_qual_args=plan.sql_qual_vals,
                     schema_spec=self.table_schema,
+                    columns=[c.name for c in plan.projected_schema],
                 )
             else:
                 engine.apply_fragments(
-                    [(SPLITGRAPH_META_SCHEMA, o) for o in plan.non_singletons],
+                    [(SPLITGRAPH_META_SCHEMA, o) for o in group],
                     SPLITGRAPH_META_SCHEMA,
                     staging_table,
                     schema_spec=self.table_schema,
+                    columns=[c.name for c in plan.projected_schema],
                 )
+
             engine.commit()
-            table_name = _generate_table_names(engine, SPLITGRAPH_META_SCHEMA, [staging_table])[0]
-            yield table_name
-
-        with object_manager.ensure_objects(
-            self, objects=required_objects, defer_release=True, tracer=plan.tracer
-        ) as eo_result:
-            _, release_callback = cast(Tuple, eo_result)
-            return (
-                itertools.chain(plan.singleton_queries, _generate_nonsingleton_query()),
-                cast(Callable, release_callback),
-                plan,
+            if ordered:
+                # Rows in the staging table are in the order the fragments were applied in,
+                # so read it through a subquery that sorts it by the primary key.
+                return _generate_sorted_subquery(
+                    engine,
+                    SPLITGRAPH_META_SCHEMA,
+                    staging_table,
+                    [c.name for c in self.table_schema if c.is_pk],
+                )
+            return _generate_table_names(engine, SPLITGRAPH_META_SCHEMA, [staging_table])[0]
+
+        def _generate_nonsingleton_queries():
+            # If we have fragments that need applying to a staging area, we don't want to
+            # do it immediately: the caller might be satisfied with the data they got from
+            # the queries to singleton fragments. So here we have a generator that, when
+            # advanced, actually materializes the chunks into a staging table and then changes
+            # the table's release callback to also delete that staging table.
+
+            # Since groups of overlapping fragments are independent of each other, we apply
+            # them one at a time, each to its own staging table: the caller gets the first rows
+            # after only one group has been applied and if it stops early, the remaining
+            # groups don't get applied at all.
+            for group in _fetch_lazily(plan.get_non_singleton_groups()):
+                yield _materialize_group(group)
+
+        def _generate_ordered_queries():
+            # Groups of fragments don't overlap each other and are sorted by their primary
+            # keys, so going through them in order (querying singletons directly and
+            # applying the rest lazily) returns rows in primary key order.
+            groups = [
+                [object_id for object_id, _, _ in group]
+                for group in self.get_pk_intervals().group_fragments(required_objects)
+            ]
+            for group in _fetch_lazily(groups):
+                if len(group) == 1:
+                    yield _generate_table_names(engine, SPLITGRAPH_META_SCHEMA, group)[0]
+                else:
+                    yield _materialize_group(group)
+
+        if ordered:
+            return _generate_ordered_queries(), cast(Callable, release_callback), plan
+
+        if plan.pk_lookup_keys:
+            # Point lookups: see if we can query the fragments with the newest
+            # versions of the rows directly instead of applying them. This needs
+            # all non-singleton fragments to be downloaded first.
+            if fetch_batch:
+                _ensure_objects(plan.non_singletons)
+            lookup_fragments = _get_pk_lookup_fragments(
+                engine, plan.non_singletons, plan.table_pks, plan.pk_lookup_keys
             )
+            plan.tracer.log("pk_lookup")
+            if lookup_fragments is not None:
+                logging.info(
+                    "Using %d fragment(s) with the newest versions of %s",
+                    len(lookup_fragments),
+                    pluralise("row", len(plan.pk_lookup_keys)),
+                )
+                return (
+                    itertools.chain(
+                        _generate_singleton_queries(),
+                        _generate_table_names(engine, SPLITGRAPH_META_SCHEMA, lookup_fragments),
+                    ),
+                    cast(Callable, release_callback),
+                    plan,
+                )
+
+        return (
+            itertools.chain(_generate_singleton_queries(), _generate_nonsingleton_queries()),
+            cast(Callable, release_callback),
+            plan,
+        )
 
     @contextmanager
     def query_lazy(self, columns: List[str], quals: Quals) -> Iterator[Iterator[Dict[str, Any]]]:
@@ -478,7 +911,9 @@ class Table:
         :return: Generator of dictionaries of results.
         """
 
-        table_gen, release_callback, plan = self.query_indirect(columns, quals)
+        table_gen, release_callback, plan = self.query_indirect(
+            columns, quals, release_consumed=True
+        )
         engine = self.repository.object_engine
 
         def _generate_results():
@@ -605,16 +1040,87 @@ class Table:
                 merge_index_data(current_index, index_struct)
 
         object_manager.register_objects(list(valid_objects.values()))
+        # New indexes can filter out more objects: drop plans made with the old ones.
+        object_manager.invalidate_query_plans(list(valid_objects))
+        self._query_plans = {}
+        self._object_meta = None
+        self._pk_intervals = None
         return list(valid_objects)
 
-    def _create_staging_table(self) -> str:
+    def compact(
+        self,
+        chunk_size: Optional[int] = None,
+        extra_indexes: Optional[ExtraIndexInfo] = None,
+        in_fragment_order: Optional[List[str]] = None,
+        workers: int = 1,
+        chunk_bytes: Optional[int] = None,
+    ) -> List[str]:
+        """
+        Rewrite this table as a set of new non-overlapping base fragments and relink
+        the table in its image to them. This speeds up queries to tables that have
+        accumulated long chains of patches, since no fragments have to be applied to
+        each other anymore.
+
+        The old objects aren't deleted, since other images might still be using them. Run
+        `sgr cleanup` to delete them if they're not needed anymore.
+
+        :param chunk_size: Split the table into fragments of this many rows. Default is
+            governed by the SG_COMMIT_CHUNK_SIZE configuration parameter.
+        :param extra_indexes: Dictionary of {index_type: column: index_specific_kwargs}.
+        :param in_fragment_order: Key to sort data inside each chunk by.
+        :param workers: Number of connections to store the new fragments on in parallel.
+        :param chunk_bytes: If specified, overrides `chunk_size` with the approximate size
+            of each new fragment.
+        :return: List of objects the table now consists of.
+        """
+        engine = self.repository.object_engine
+        chunk_size = chunk_size or int(get_singleton(CONFIG, "SG_COMMIT_CHUNK_SIZE"))
+
+        staging_table = get_temporary_table_id()
+        self.materialize(staging_table, SPLITGRAPH_META_SCHEMA)
+        try:
+            if workers > 1:
+                # Parallel workers need to be able to see the staging table.
+                engine.commit()
+
+            self.repository.objects.delete_table_meta(
+                self.repository, self.image.image_hash, self.table_name
+            )
+            objects = self.repository.objects.record_table_as_base(
+                self.repository,
+                self.table_name,
+                self.image.image_hash,
+                chunk_size=chunk_size,
+                source_schema=SPLITGRAPH_META_SCHEMA,
+                source_table=staging_table,
+                extra_indexes=extra_indexes,
+                in_fragment_order=in_fragment_order,
+                workers=workers,
+                chunk_bytes=chunk_bytes,
+            )
+        finally:
+            engine.delete_table(SPLITGRAPH_META_SCHEMA, staging_table)
+
+        logging.info(
+            "Compacted %s from %s into %s",
+            self,
+            pluralise("object", len(self.objects)),
+            pluralise("object", len(objects)),
+        )
+        self.objects = objects
+        self._query_plans = {}
+        self._object_meta = None
+        self._pk_intervals = None
+        return objects
+
+    def _create_staging_table(self, schema_spec: Optional[TableSchema] = None) -> str:
         staging_table = get_temporary_table_id()
 
         logging.debug("Using staging table %s", staging_table)
         self.repository.object_engine.create_table(
             schema=SPLITGRAPH_META_SCHEMA,
             table=staging_table,
-            schema_spec=self.table_schema,
+            schema_spec=schema_spec or self.table_schema,
             unlogged=True,
         )
         return staging_table
@@ -5,6 +5,7 @@ tracking tables for changes and uploading/downloading tables to other remote eng
 By default, Splitgraph is backed by Postgres: see :mod:`splitgraph.engine.postgres` for an example of how to
 implement a different engine.
 """
+import threading
 from abc import ABC
 from contextlib import contextmanager
 from enum import Enum
@@ -83,7 +84,17 @@ class SQLEngine(ABC):
     and loading tables."""
 
     def __init__(self) -> None:
-        self._savepoint_stack: List[str] = []
+        # Engines can hand out a different connection to every thread, so savepoints
+        # have to be tracked per thread as well.
+        self._savepoint_stacks = threading.local()
+
+    @property
+    def _savepoint_stack(self) -> List[str]:
+        try:
+            return cast(List[str], self._savepoint_stacks.stack)
+        except AttributeError:
+            self._savepoint_stacks.stack = []
+            return cast(List[str], self._savepoint_stacks.stack)
 
     @contextmanager
     def savepoint(self, name: str) -> Iterator[None]:
@@ -521,6 +532,28 @@ class ObjectEngine:
         :param object_ids: IDs of objects to delete
         """
 
+    def list_objects(self, limit_to=None):
+        """
+        List objects stored on the engine.
+
+        :param limit_to: If specified, only the objects in this list will be returned.
+        :return: List of object IDs
+        """
+
+    def catalog_objects(self, object_ids):
+        """
+        Record objects that have been written into the engine's storage in the object catalog.
+
+        :param object_ids: IDs of objects
+        """
+
+    def reconcile_object_catalog(self, object_ids):
+        """
+        Make the object catalog entries for given objects match the engine's storage.
+
+        :param object_ids: IDs of objects
+        """
+
     def store_fragment(self, inserted, deleted, schema, table, source_schema, source_table):
         """
         Store a fragment of a changed table in another table
@@ -543,6 +576,8 @@ class ObjectEngine:
         extra_qual_args=None,
         schema_spec=None,
         progress_every: Optional[int] = None,
+        columns: Optional[Sequence[str]] = None,
+        insert_only: bool = False,
     ):
         """
         Apply multiple fragments to a target table as a single-query batch operation.
@@ -557,6 +592,39 @@ class ObjectEngine:
             If not specified, uses the schema of target_table.
         :param progress_every: If set, will report the materialization progress via
             tqdm every `progress_every` objects.
+        :param columns: Optional, only apply these columns from the fragments (the primary key
+            or the replica identity columns are always applied). The target table
+            must have at least these columns.
+        :param insert_only: Don't delete rows from the target table that the fragments
+            overwrite and only insert new rows. Only safe if the fragments don't overlap
+            each other or any rows already in the target table.
+        """
+        raise NotImplementedError()
+
+    def apply_fragment_groups(
+        self,
+        groups,
+        target_schema,
+        target_table,
+        schema_spec=None,
+        workers: int = 1,
+        insert_only: bool = False,
+    ):
+        """
+        Apply groups of fragments that don't overlap each other (e.g. ones produced by
+        `get_chunk_groups`) to a target table in parallel, each batch of groups in a separate
+        transaction on its own connection.
+
+        Since other connections need to see the target table, it has to be committed before
+        this is called. Fragments inside every group are applied in the order they're passed in.
+
+        :param groups: List of lists of tuples `(object_schema, object_table)`.
+        :param target_schema: Schema to apply the fragments to
+        :param target_table: Table to apply the fragments to
+        :param schema_spec: Optional, list of (ordinal, column_name, column_type, is_pk).
+            If not specified, uses the schema of target_table.
+        :param workers: Number of connections to apply the groups on.
+        :param insert_only: Only insert new rows from the fragments (see `apply_fragments`).
         """
         raise NotImplementedError()
 
@@ -619,6 +687,10 @@ _ENGINE: Union[str, "PostgresEngine"] = get_singleton(CONFIG, "SG_ENGINE") or "L
 # Map of engine names -> Engine instances
 _ENGINES: Dict[str, "PostgresEngine"] = {}
 
+# Engines switched to with switch_engine, per thread: a thread that works with a different engine
+# (e.g. downloading objects in the background) doesn't change the engine that other threads use.
+_SWITCHED_ENGINES = threading.local()
+
 
 def get_engine(
     name: Optional[str] = None,
@@ -639,6 +711,9 @@ def get_engine(
     from .postgres.engine import PostgresEngine
 
     if not name:
+        switched_engine = getattr(_SWITCHED_ENGINES, "engine", None)
+        if switched_engine is not None:
+            return cast(PostgresEngine, switched_engine)
         if isinstance(_ENGINE, PostgresEngine):
             return _ENGINE
         name = _ENGINE
@@ -689,15 +764,14 @@ def set_engine(engine: "PostgresEngine") -> None:
 @contextmanager
 def switch_engine(engine: "PostgresEngine") -> Iterator[None]:
     """
-    Switch the global engine to a different one. The engine will
+    Switch the global engine to a different one in the current thread. The engine will
     get switched back on exit from the context manager.
 
     :param engine: Engine
     """
-    global _ENGINE
-    _prev_engine = _ENGINE
+    _prev_engine = getattr(_SWITCHED_ENGINES, "engine", None)
     try:
-        _ENGINE = engine
+        _SWITCHED_ENGINES.engine = engine
         yield
     finally:
-        _ENGINE = _prev_engine
+        _SWITCHED_ENGINES.engine = _prev_engine
@@ -6,10 +6,12 @@ import json
 import logging
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from io import BytesIO
+from io import BytesIO, StringIO
 from io import TextIOWrapper
 from pathlib import PurePosixPath
+from random import getrandbits
 from threading import get_ident
 from typing import (
     Any,
@@ -90,6 +92,9 @@ API_MAX_QUERY_LENGTH = 261000
 # number.
 API_MAX_VARIADIC_ARGS = 1000
 
+# When storing fragments with more upserted/deleted rows than this, stream their
+# primary keys into a temporary table through COPY instead of inlining them into the query.
+STORE_FRAGMENT_COPY_THRESHOLD = 10000
 
 # PG types we can run max/min/comparisons on
 
@@ -554,6 +559,37 @@ class PsycopgEngine(SQLEngine):
                 self.rollback()
                 raise
 
+    def copy_from_stream(
+        self,
+        stream: Any,
+        schema: str,
+        table: str,
+        columns: Optional[List[str]] = None,
+        binary: bool = False,
+    ) -> None:
+        """
+        Load data into a table using COPY FROM STDIN.
+
+        :param stream: File-like object with the data in the Postgres COPY text (or binary) format
+        :param schema: Schema of the table
+        :param table: Table to load the data into
+        :param columns: Columns the data is for (default all columns of the table)
+        :param binary: If True, the data is in the binary COPY format.
+        """
+        query = SQL("COPY {}.{}").format(Identifier(schema), Identifier(table))
+        if columns:
+            query += SQL("(") + SQL(",").join(Identifier(c) for c in columns) + SQL(")")
+        query += SQL(" FROM STDIN")
+        if binary:
+            query += SQL(" WITH (FORMAT 'binary')")
+
+        with self.connection.cursor() as cur:
+            try:
+                cur.copy_expert(query, stream)
+            except DatabaseError:
+                self.rollback()
+                raise
+
     def run_api_call(self, call: str, *args, schema: str = SPLITGRAPH_API_SCHEMA) -> Any:
         # When we're inside of a foreign data wrapper on the engine itself,
         # we get to avoid having to go through PostgreSQL to manage objects in
@@ -845,6 +881,85 @@ class AuditTriggerChangeEngine(PsycopgEngine, ChangeEngine):
             result.extend(_convert_audit_change(action, row_data, changed_fields, ri_cols))
         return result
 
+    def get_pending_changes_by_pk(
+        self, schema: str, table: str, batch_size: int = 10000
+    ) -> Iterator[Tuple[Tuple, bool, Dict[str, Any], Dict[str, Any]]]:
+        """
+        Stream pending changes for a given tracked table without loading the whole audit log
+        into memory. Changes are returned ordered by their primary key and then in the order
+        they were made in, so that all changes to a given primary key are next to each other.
+
+        :param schema: Schema the table belongs to
+        :param table: Table to return changes for
+        :param batch_size: Number of audit log entries to fetch at a time
+        :return: Iterator of (primary_key, upserted, old_row, new_row), in the same format as
+            `get_pending_changes`.
+        """
+        ri_cols, _ = zip(*self.get_change_key(schema, table))
+
+        # Updates that change the primary key get converted into a deletion at the old PK and
+        # an insertion at the new PK, so such entries have to be ordered by both.
+        def _pk_sql(row):
+            return (
+                SQL("jsonb_build_array(")
+                + SQL(",").join(SQL(row + " -> %s") for _ in ri_cols)
+                + SQL(")")
+            )
+
+        old_pk = _pk_sql("row_data")
+        new_pk = _pk_sql("(row_data || coalesce(changed_fields, '{}'::jsonb))")
+        audit_table = SQL("FROM {}.{} WHERE schema_name = %s AND table_name = %s").format(
+            Identifier(_AUDIT_SCHEMA), Identifier("logged_actions")
+        )
+        tmp_table = "sg_tmp_pending_changes"
+
+        self.run_sql(
+            SQL(
+                "CREATE TEMPORARY TABLE {} AS SELECT ROW_NUMBER() OVER (ORDER BY pk, event_id) "
+            ).format(Identifier(tmp_table))
+            + SQL("AS change_id, action, row_data, changed_fields, pk FROM (")
+            + SQL("SELECT event_id, action, row_data, changed_fields, ")
+            + old_pk
+            + SQL(" AS pk ")
+            + audit_table
+            + SQL(" UNION ALL SELECT event_id, action, row_data, changed_fields, ")
+            + new_pk
+            + SQL(" ")
+            + audit_table
+            + SQL(" AND action = 'U' AND ")
+            + new_pk
+            + SQL(" <> ")
+            + old_pk
+            + SQL(") changes"),
+            ri_cols + (schema, table) + ri_cols + (schema, table) + ri_cols + ri_cols,
+        )
+        self.run_sql(
+            SQL("CREATE INDEX {} ON {}(change_id)").format(
+                Identifier("idx_" + tmp_table), Identifier(tmp_table)
+            )
+        )
+
+        try:
+            last_change = 0
+            while True:
+                changes = self.run_sql(
+                    SQL(
+                        "SELECT action, row_data, changed_fields, pk FROM {} "
+                        "WHERE change_id > %s AND change_id <= %s ORDER BY change_id"
+                    ).format(Identifier(tmp_table)),
+                    (last_change, last_change + batch_size),
+                )
+                if not changes:
+                    break
+                last_change += batch_size
+                for action, row_data, changed_fields, pk in changes:
+                    # Only emit the part of a PK-changing update that has this entry's PK.
+                    for change in _convert_audit_change(action, row_data, changed_fields, ri_cols):
+                        if list(change[0]) == pk:
+                            yield change
+        finally:
+            self.delete_table("pg_temp", tmp_table)
+
     def get_changed_tables(self, schema: str) -> List[str]:
         """Get list of tables that have changed content"""
         return cast(
@@ -884,6 +999,68 @@ class PostgresEngine(AuditTriggerChangeEngine, ObjectEngine):
         schema_spec = [s[:4] for s in schema_spec]
         self.run_api_call("set_object_schema", object_id, json.dumps(schema_spec))
 
+    def catalog_objects(self, object_ids: List[str]) -> None:
+        """
+        Record objects whose files have been written into the local object storage
+        in the object catalog, together with their size.
+
+        :param object_ids: IDs of objects
+        """
+        if not object_ids:
+            return
+        self.run_sql_batch(
+            SQL(
+                "INSERT INTO {}.object_catalog (object_id, size) VALUES (%s, %s) "
+                "ON CONFLICT (object_id) DO UPDATE SET size = EXCLUDED.size"
+            ).format(Identifier(SPLITGRAPH_META_SCHEMA)),
+            [(o, self.get_object_size(o)) for o in object_ids],
+        )
+
+    def reconcile_object_catalog(self, object_ids: List[str]) -> None:
+        """
+        Make the object catalog entries for given objects match the object storage. Object files
+        aren't transactional, so this is needed when a transaction that wrote or deleted some
+        object files (and changed their catalog entries) has been rolled back.
+
+        :param object_ids: IDs of objects
+        """
+        if not object_ids:
+            return
+        self.run_sql(
+            SQL(
+                "DELETE FROM {0}.object_catalog WHERE object_id = ANY(%s) "
+                "AND NOT splitgraph_api.object_exists(object_id);"
+                "INSERT INTO {0}.object_catalog (object_id, size) "
+                "SELECT o, splitgraph_api.get_object_size(o) FROM unnest(%s::varchar[]) AS o "
+                "WHERE splitgraph_api.object_exists(o) "
+                "ON CONFLICT (object_id) DO UPDATE SET size = EXCLUDED.size"
+            ).format(Identifier(SPLITGRAPH_META_SCHEMA)),
+            (object_ids, object_ids),
+        )
+
+    def list_objects(self, limit_to: Optional[List[str]] = None) -> List[str]:
+        """
+        List objects in the local object storage using the object catalog.
+
+        :param limit_to: If specified, only the objects in this list will be returned.
+        :return: List of object IDs.
+        """
+        if limit_to is None:
+            return cast(
+                List[str],
+                self.run_sql(
+                    select("object_catalog", "object_id"), return_shape=ResultShape.MANY_ONE
+                ),
+            )
+        return cast(
+            List[str],
+            self.run_sql(
+                select("object_catalog", "object_id", "object_id = ANY(%s)"),
+                (limit_to,),
+                return_shape=ResultShape.MANY_ONE,
+            ),
+        )
+
     def dump_object_creation(
         self,
         object_id: str,
@@ -959,6 +1136,14 @@ class PostgresEngine(AuditTriggerChangeEngine, ObjectEngine):
                     (object_id, json.dumps(schema_spec)),
                 ).decode("utf-8")
             )
+            stream.write(
+                cur.mogrify(
+                    "INSERT INTO splitgraph_meta.object_catalog (object_id, size) "
+                    "VALUES (%s, splitgraph_api.get_object_size(%s)) "
+                    "ON CONFLICT (object_id) DO UPDATE SET size = EXCLUDED.size;\n",
+                    (object_id, object_id),
+                ).decode("utf-8")
+            )
             stream.write("DROP TABLE pg_temp.cstore_tmp_ingestion;\n")
 
     def get_object_size(self, object_id: str) -> int:
@@ -966,6 +1151,12 @@ class PostgresEngine(AuditTriggerChangeEngine, ObjectEngine):
 
     def delete_objects(self, object_ids: List[str]) -> None:
         self.unmount_objects(object_ids)
+        self.run_sql(
+            SQL("DELETE FROM {}.object_catalog WHERE object_id = ANY(%s)").format(
+                Identifier(SPLITGRAPH_META_SCHEMA)
+            ),
+            (list(object_ids),),
+        )
         self.run_api_call_batch("delete_object_files", [(o,) for o in object_ids])
 
     def unmount_objects(self, object_ids: List[str]) -> None:
@@ -980,9 +1171,15 @@ class PostgresEngine(AuditTriggerChangeEngine, ObjectEngine):
 
     def sync_object_mounts(self) -> None:
         """Scan through local object storage and synchronize it with the foreign tables in
-        splitgraph_meta (unmounting non-existing objects and mounting existing ones)."""
+        splitgraph_meta (unmounting non-existing objects and mounting existing ones) and
+        the object catalog."""
         object_ids = self.run_api_call("list_objects")
 
+        self.run_sql(
+            SQL("DELETE FROM {}.object_catalog").format(Identifier(SPLITGRAPH_META_SCHEMA))
+        )
+        self.catalog_objects(object_ids)
+
         mounted_objects = self.run_sql(
             "SELECT table_name FROM information_schema.tables "
             "WHERE table_schema = %s AND table_type = 'FOREIGN'",
@@ -1052,16 +1249,21 @@ class PostgresEngine(AuditTriggerChangeEngine, ObjectEngine):
         #    ON v.pk1 = t.pk1::pk1_type AND v.pk2::pk2_type = t.pk2...
         #    -- the cast is required since the audit trigger gives us strings for values of updated columns
         #    -- and we're intending to join those with the PKs in the original table.
+        # For large changesets, the PKs get loaded into a temporary table through COPY instead and
+        # that table is used in place of VALUES.
         if inserted:
+            keys_table = (
+                self._copy_keys(inserted, ri_cols)
+                if len(inserted) > STORE_FRAGMENT_COPY_THRESHOLD
+                else None
+            )
             if non_ri_cols:
-                query = (
-                    SQL("INSERT INTO {}.{} (").format(Identifier(schema), Identifier(table))
-                    + SQL(",").join(Identifier(c) for c in [SG_UD_FLAG] + all_cols)
-                    + SQL(")")
-                    + SQL("(SELECT %s, ")
-                    + SQL(",").join(SQL("t.") + Identifier(c) for c in all_cols)
-                    + SQL(
-                        " FROM (VALUES "
+                if keys_table:
+                    keys_sql = SQL("pg_temp.{}").format(Identifier(keys_table))
+                    args = [True]
+                else:
+                    keys_sql = SQL(
+                        "(VALUES "
                         + ",".join(
                             itertools.repeat(
                                 "(" + ",".join(itertools.repeat("%s", len(inserted[0]))) + ")",
@@ -1070,6 +1272,16 @@ class PostgresEngine(AuditTriggerChangeEngine, ObjectEngine):
                         )
                         + ")"
                     )
+                    # Flatten the args
+                    args = [True] + [p for pk in inserted for p in pk]
+                query = (
+                    SQL("INSERT INTO {}.{} (").format(Identifier(schema), Identifier(table))
+                    + SQL(",").join(Identifier(c) for c in [SG_UD_FLAG] + all_cols)
+                    + SQL(")")
+                    + SQL("(SELECT %s, ")
+                    + SQL(",").join(SQL("t.") + Identifier(c) for c in all_cols)
+                    + SQL(" FROM ")
+                    + keys_sql
                     + SQL(" AS v (")
                     + SQL(",").join(Identifier(c) for c in ri_cols)
                     + SQL(")")
@@ -1083,8 +1295,10 @@ class PostgresEngine(AuditTriggerChangeEngine, ObjectEngine):
                     )
                     + SQL(")")
                 )
-                # Flatten the args
-                args = [True] + [p for pk in inserted for p in pk]
+            elif keys_table:
+                query, args = self._insert_keys_query(
+                    schema, table, keys_table, True, ri_cols, ri_types
+                )
             else:
                 # If the whole tuple is the PK, there's no point joining on the actual source table
                 query = (
@@ -1103,26 +1317,79 @@ class PostgresEngine(AuditTriggerChangeEngine, ObjectEngine):
                 )
                 args = [p for pk in inserted for p in [True] + list(pk)]
             self.run_sql(query, args)
+            if keys_table:
+                self.delete_table("pg_temp", keys_table)
 
         # Store the deletes
         # we don't actually have the old values here so we put NULLs (which should be compressed out).
         if deleted:
-            query = (
-                SQL("INSERT INTO {}.{} (").format(Identifier(schema), Identifier(table))
-                + SQL(",").join(Identifier(c) for c in [SG_UD_FLAG] + ri_cols)
-                + SQL(")")
-                + SQL(
-                    "VALUES "
-                    + ",".join(
-                        itertools.repeat(
-                            "(" + ",".join(itertools.repeat("%s", len(deleted[0]) + 1)) + ")",
-                            len(deleted),
+            if len(deleted) > STORE_FRAGMENT_COPY_THRESHOLD:
+                keys_table = self._copy_keys(deleted, ri_cols)
+                query, args = self._insert_keys_query(
+                    schema, table, keys_table, False, ri_cols, ri_types
+                )
+                self.run_sql(query, args)
+                self.delete_table("pg_temp", keys_table)
+            else:
+                query = (
+                    SQL("INSERT INTO {}.{} (").format(Identifier(schema), Identifier(table))
+                    + SQL(",").join(Identifier(c) for c in [SG_UD_FLAG] + ri_cols)
+                    + SQL(")")
+                    + SQL(
+                        "VALUES "
+                        + ",".join(
+                            itertools.repeat(
+                                "(" + ",".join(itertools.repeat("%s", len(deleted[0]) + 1)) + ")",
+                                len(deleted),
+                            )
                         )
                     )
                 )
+                args = [p for pk in deleted for p in [False] + list(pk)]
+                self.run_sql(query, args)
+
+    def _copy_keys(self, keys: Any, ri_cols: List[str]) -> str:
+        """
+        Load a list of primary keys into a temporary table with text columns named
+        after the primary key columns.
+
+        :return: Name of the temporary table.
+        """
+        keys_table = "sg_tmp_keys_{:032x}".format(getrandbits(128))
+        self.run_sql(
+            SQL("CREATE TEMPORARY TABLE {} (").format(Identifier(keys_table))
+            + SQL(",").join(Identifier(c) + SQL(" text") for c in ri_cols)
+            + SQL(")")
+        )
+        for batch in chunk(keys, STORE_FRAGMENT_COPY_THRESHOLD):
+            self.copy_from_stream(
+                StringIO("".join("\t".join(map(_to_copy_text, pk)) + "\n" for pk in batch)),
+                "pg_temp",
+                keys_table,
             )
-            args = [p for pk in deleted for p in [False] + list(pk)]
-            self.run_sql(query, args)
+        return keys_table
+
+    @staticmethod
+    def _insert_keys_query(
+        schema: str,
+        table: str,
+        keys_table: str,
+        upserted: bool,
+        ri_cols: List[str],
+        ri_types: List[str],
+    ) -> Tuple[Composed, List[Any]]:
+        # INSERT INTO target_table (sg_ud_flag, pk1, pk2...)
+        #   SELECT true/false, k.pk1::pk1_type, k.pk2::pk2_type FROM keys_table k
+        query = (
+            SQL("INSERT INTO {}.{} (").format(Identifier(schema), Identifier(table))
+            + SQL(",").join(Identifier(c) for c in [SG_UD_FLAG] + ri_cols)
+            + SQL(") SELECT %s, ")
+            + SQL(",").join(
+                SQL("k.{}::%s" % r).format(Identifier(c)) for c, r in zip(ri_cols, ri_types)
+            )
+            + SQL(" FROM pg_temp.{} k").format(Identifier(keys_table))
+        )
+        return query, [upserted]
 
     def store_object(
         self,
@@ -1166,6 +1433,7 @@ class PostgresEngine(AuditTriggerChangeEngine, ObjectEngine):
                 )
             else:
                 logging.info("Object %s already exists, skipping", object_id)
+                self.catalog_objects([object_id])
                 return
 
         # At this point, the foreign table mounting the object exists and we've established
@@ -1180,6 +1448,7 @@ class PostgresEngine(AuditTriggerChangeEngine, ObjectEngine):
 
         # Also store the table schema in a file
         self._set_object_schema(object_id, schema_spec)
+        self.catalog_objects([object_id])
 
     @staticmethod
     def _schema_spec_to_cols(schema_spec: "TableSchema") -> Tuple[List[str], List[str]]:
@@ -1199,24 +1468,29 @@ class PostgresEngine(AuditTriggerChangeEngine, ObjectEngine):
         target_table: str,
         cols: Tuple[List[str], List[str]],
         extra_quals: Optional[Composed] = None,
+        insert_only: bool = False,
     ) -> Composed:
         ri_cols, non_ri_cols = cols
         all_cols = ri_cols + non_ri_cols
 
         # First, delete all PKs from staging that are mentioned in the new fragment. This conveniently
-        # covers both deletes and updates.
+        # covers both deletes and updates. If the caller knows that the fragment doesn't overlap
+        # anything already in the table, we can skip this.
 
         # Also, alias tables so that we don't have to send around long strings of object IDs.
-        query = (
-            SQL("DELETE FROM {0}.{2} t USING {1}.{3} s").format(
-                Identifier(target_schema),
-                Identifier(source_schema),
-                Identifier(target_table),
-                Identifier(source_table),
+        query = SQL("")
+        if not insert_only:
+            query += (
+                SQL("DELETE FROM {0}.{2} t USING {1}.{3} s").format(
+                    Identifier(target_schema),
+                    Identifier(source_schema),
+                    Identifier(target_table),
+                    Identifier(source_table),
+                )
+                + SQL(" WHERE ")
+                + _generate_where_clause("t", ri_cols, "s")
+                + SQL(";")
             )
-            + SQL(" WHERE ")
-            + _generate_where_clause("t", ri_cols, "s")
-        )
 
         # At this point, we can insert all rows directly since we won't have any conflicts.
         # We can also apply extra qualifiers to only insert rows that match a certain query,
@@ -1226,7 +1500,7 @@ class PostgresEngine(AuditTriggerChangeEngine, ObjectEngine):
         #   (SELECT col1, col2, ...
         #    FROM fragment_table WHERE sg_ud_flag = true (AND optional quals))
         query += (
-            SQL(";INSERT INTO {}.{} (").format(Identifier(target_schema), Identifier(target_table))
+            SQL("INSERT INTO {}.{} (").format(Identifier(target_schema), Identifier(target_table))
             + SQL(",").join(Identifier(c) for c in all_cols)
             + SQL(")")
             + SQL("(SELECT ")
@@ -1249,6 +1523,8 @@ class PostgresEngine(AuditTriggerChangeEngine, ObjectEngine):
         extra_qual_args: Optional[Tuple[str]] = None,
         schema_spec: Optional["TableSchema"] = None,
         progress_every: Optional[int] = None,
+        columns: Optional[Sequence[str]] = None,
+        insert_only: bool = False,
     ) -> None:
         if not objects:
             return
@@ -1256,27 +1532,104 @@ class PostgresEngine(AuditTriggerChangeEngine, ObjectEngine):
         # Assume that the target table already has the required schema (including PKs)
         # and use that to generate queries to apply fragments.
         cols = self._schema_spec_to_cols(schema_spec)
+        if columns is not None:
+            # The columns we use to find rows to delete/update always have to be applied.
+            cols = cols[0], [c for c in cols[1] if c in columns]
 
         if progress_every:
             batches = list(chunk(objects, chunk_size=progress_every))
             with tqdm(total=len(objects), unit="obj") as pbar:
                 for batch in batches:
                     self._apply_batch(
-                        batch, target_schema, target_table, extra_quals, cols, extra_qual_args
+                        batch,
+                        target_schema,
+                        target_table,
+                        extra_quals,
+                        cols,
+                        extra_qual_args,
+                        insert_only,
                     )
                     pbar.update(len(batch))
                     pbar.set_postfix({"object": batch[-1][1][:10] + "..."})
         else:
             self._apply_batch(
-                objects, target_schema, target_table, extra_quals, cols, extra_qual_args
+                objects,
+                target_schema,
+                target_table,
+                extra_quals,
+                cols,
+                extra_qual_args,
+                insert_only,
             )
 
+    def apply_fragment_groups(
+        self,
+        groups: List[List[Tuple[str, str]]],
+        target_schema: str,
+        target_table: str,
+        schema_spec: Optional["TableSchema"] = None,
+        workers: int = 1,
+        insert_only: bool = False,
+    ) -> None:
+        if not groups:
+            return
+        schema_spec = schema_spec or self.get_full_table_schema(target_schema, target_table)
+        cols = self._schema_spec_to_cols(schema_spec)
+
+        # Leave one pooled connection for the main thread.
+        workers = max(min(workers, int(self._pool.maxconn) - 1), 1)
+
+        # Apply several small groups in one batch to cut down on roundtrips, but make enough
+        # batches that the workers stay busy even if some groups are larger than others.
+        batch_size = max(1, sum(len(g) for g in groups) // (workers * 4))
+        batches: List[List[Tuple[str, str]]] = []
+        current_batch: List[Tuple[str, str]] = []
+        for group in groups:
+            current_batch.extend(group)
+            if len(current_batch) >= batch_size:
+                batches.append(current_batch)
+                current_batch = []
+        if current_batch:
+            batches.append(current_batch)
+
+        def _apply(batch: List[Tuple[str, str]]) -> int:
+            try:
+                self._apply_batch(batch, target_schema, target_table, None, cols, None, insert_only)
+                self.commit()
+                return len(batch)
+            except Exception:
+                self.rollback()
+                raise
+
+        logging.info(
+            "Applying %d fragment group(s) in %d batch(es) using %d workers",
+            len(groups),
+            len(batches),
+            workers,
+        )
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as tpe:
+                with tqdm(
+                    total=sum(len(b) for b in batches), unit="obj", ascii=SG_CMD_ASCII
+                ) as pbar:
+                    for applied in tpe.map(_apply, batches):
+                        pbar.update(applied)
+        finally:
+            self.close_others()
+
     def _apply_batch(
-        self, objects, target_schema, target_table, extra_quals, cols, extra_qual_args
+        self,
+        objects,
+        target_schema,
+        target_table,
+        extra_quals,
+        cols,
+        extra_qual_args,
+        insert_only=False,
     ):
         query = SQL(";").join(
             self._generate_fragment_application(
-                ss, st, target_schema, target_table, cols, extra_quals
+                ss, st, target_schema, target_table, cols, extra_quals, insert_only
             )
             for ss, st in objects
         )
@@ -1394,6 +1747,7 @@ class PostgresEngine(AuditTriggerChangeEngine, ObjectEngine):
                     with_pk_constraints=False,
                 )
                 self._set_object_schema(object_id, schema_spec=schema_spec)
+                self.catalog_objects([object_id])
                 downloaded_objects.append(object_id)
         if len(downloaded_objects) < len(objects):
             raise IncompleteObjectDownloadError(reason=None, successful_objects=downloaded_objects)
@@ -1535,6 +1889,21 @@ def _convert_vals(vals: Any) -> Any:
     return [Json(v) if isinstance(v, dict) else v for v in vals]
 
 
+def _to_copy_text(value: Any) -> str:
+    """Convert a value into its representation in the text COPY format."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
 def _generate_where_clause(table: str, cols: List[str], table_2: str) -> Composed:
     return SQL(" AND ").join(
         SQL("{}.{} = {}.{}").format(
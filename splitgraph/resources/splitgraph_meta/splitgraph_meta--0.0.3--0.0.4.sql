@@ -0,0 +1,17 @@
+-- Cache of layered query plans (fragments that a query needs and how they're grouped) that's
+-- shared between all sessions on the engine. Plans are keyed by a hash of the table's objects
+-- and the query's qualifiers and columns, so a table that gets relinked to different objects
+-- never reuses an old plan. Since plans are shared between all tables with the same objects,
+-- they're invalidated by object (e.g. when an object gets reindexed).
+CREATE TABLE splitgraph_meta.query_plan_cache (
+    plan_id varchar NOT NULL PRIMARY KEY,
+    objects varchar[] NOT NULL,
+    filtered_objects varchar[] NOT NULL,
+    non_singletons varchar[] NOT NULL,
+    singletons varchar[] NOT NULL,
+    estimated_rows bigint NOT NULL,
+    created timestamp NOT NULL
+);
+
+CREATE INDEX idx_query_plan_cache_objects ON splitgraph_meta.query_plan_cache USING GIN (objects);
+CREATE INDEX idx_query_plan_cache_created ON splitgraph_meta.query_plan_cache (created);
@@ -0,0 +1,16 @@
+-- Statistics used by object cache eviction policies (see splitgraph.core.eviction):
+-- the number of times an object has been used and the value of the cache clock
+-- when it was last used.
+ALTER TABLE splitgraph_meta.object_cache_status
+    ADD COLUMN access_count integer NOT NULL DEFAULT 1,
+    ADD COLUMN clock double precision NOT NULL DEFAULT 0;
+
+-- Space in the cache reserved for an object that's being downloaded (counted in the cache
+-- occupancy until the object is ready or its cache entry is deleted). Lets whoever downloads
+-- the object next reuse the reservation if the manager that made it has crashed.
+ALTER TABLE splitgraph_meta.object_cache_status
+    ADD COLUMN reserved bigint NOT NULL DEFAULT 0;
+
+-- Cache clock: advanced by some eviction policies when objects get evicted.
+ALTER TABLE splitgraph_meta.object_cache_occupancy
+    ADD COLUMN clock double precision NOT NULL DEFAULT 0;
@@ -0,0 +1,17 @@
+-- Images whose objects never get evicted from the object cache (see `sgr cache pin`).
+CREATE TABLE splitgraph_meta.object_cache_pins (
+    namespace varchar NOT NULL,
+    repository varchar NOT NULL,
+    image_hash varchar(64) NOT NULL,
+    PRIMARY KEY (namespace, repository, image_hash)
+);
+
+-- Maximum space (in bytes) that cached objects belonging to a repository can take up
+-- (see `sgr cache quota`). An empty repository means that the quota applies to all
+-- repositories in the namespace.
+CREATE TABLE splitgraph_meta.object_cache_quotas (
+    namespace varchar NOT NULL,
+    repository varchar NOT NULL,
+    quota bigint NOT NULL CHECK (quota >= 0),
+    PRIMARY KEY (namespace, repository)
+);
@@ -0,0 +1,19 @@
+-- Objects whose files are in the engine's local object storage and their on-disk size.
+-- Maintained by the engine whenever it writes or deletes object files so that finding out
+-- which objects are present doesn't require listing the object storage directory.
+CREATE TABLE splitgraph_meta.object_catalog (
+    object_id varchar NOT NULL PRIMARY KEY,
+    size bigint NOT NULL
+);
+
+-- Populate the catalog with objects that are already in the storage (if the engine
+-- manages objects).
+DO $$
+BEGIN
+    IF to_regproc('splitgraph_api.list_objects') IS NOT NULL THEN
+        INSERT INTO splitgraph_meta.object_catalog (object_id, size)
+        SELECT o, splitgraph_api.get_object_size(o)
+        FROM unnest(splitgraph_api.list_objects()) AS o;
+    END IF;
+END
+$$;
@@ -104,3 +104,70 @@ CREATE OR REPLACE FUNCTION splitgraph_api.object_exists (
 $BODY$
 LANGUAGE plpython3u
 VOLATILE;
+
+-- Homomorphic hashing (see splitgraph.core.fragment_manager.Digest) done inside of the engine
+-- so that row digests don't have to be shipped to the client. Each row digest is treated as a
+-- vector of 16 big-endian unsigned shorts: the state keeps the sum of every component as a
+-- bigint and the final function wraps them around and returns a 64-character hex string.
+CREATE OR REPLACE FUNCTION splitgraph_api.lthash_accum (
+    state bigint[],
+    row_digest bytea
+)
+    RETURNS bigint[]
+    AS $$
+BEGIN
+    RETURN ARRAY[
+        state[1] + (get_byte(row_digest, 0) << 8) + get_byte(row_digest, 1),
+        state[2] + (get_byte(row_digest, 2) << 8) + get_byte(row_digest, 3),
+        state[3] + (get_byte(row_digest, 4) << 8) + get_byte(row_digest, 5),
+        state[4] + (get_byte(row_digest, 6) << 8) + get_byte(row_digest, 7),
+        state[5] + (get_byte(row_digest, 8) << 8) + get_byte(row_digest, 9),
+        state[6] + (get_byte(row_digest, 10) << 8) + get_byte(row_digest, 11),
+        state[7] + (get_byte(row_digest, 12) << 8) + get_byte(row_digest, 13),
+        state[8] + (get_byte(row_digest, 14) << 8) + get_byte(row_digest, 15),
+        state[9] + (get_byte(row_digest, 16) << 8) + get_byte(row_digest, 17),
+        state[10] + (get_byte(row_digest, 18) << 8) + get_byte(row_digest, 19),
+        state[11] + (get_byte(row_digest, 20) << 8) + get_byte(row_digest, 21),
+        state[12] + (get_byte(row_digest, 22) << 8) + get_byte(row_digest, 23),
+        state[13] + (get_byte(row_digest, 24) << 8) + get_byte(row_digest, 25),
+        state[14] + (get_byte(row_digest, 26) << 8) + get_byte(row_digest, 27),
+        state[15] + (get_byte(row_digest, 28) << 8) + get_byte(row_digest, 29),
+        state[16] + (get_byte(row_digest, 30) << 8) + get_byte(row_digest, 31)];
+END;
+$$
+LANGUAGE plpgsql
+IMMUTABLE STRICT PARALLEL SAFE;
+
+CREATE OR REPLACE FUNCTION splitgraph_api.lthash_combine (
+    left_state bigint[],
+    right_state bigint[]
+)
+    RETURNS bigint[]
+    AS $$
+    SELECT array_agg(l + r ORDER BY i)
+    FROM unnest(left_state, right_state) WITH ORDINALITY AS t (l, r, i)
+$$
+LANGUAGE sql
+IMMUTABLE STRICT PARALLEL SAFE;
+
+CREATE OR REPLACE FUNCTION splitgraph_api.lthash_final (
+    state bigint[]
+)
+    RETURNS varchar
+    AS $$
+    SELECT string_agg(lpad(to_hex(s & 65535), 4, '0'), '' ORDER BY i)
+    FROM unnest(state) WITH ORDINALITY AS t (s, i)
+$$
+LANGUAGE sql
+IMMUTABLE STRICT PARALLEL SAFE;
+
+DROP AGGREGATE IF EXISTS splitgraph_api.lthash_sum (bytea);
+
+CREATE AGGREGATE splitgraph_api.lthash_sum (bytea) (
+    SFUNC = splitgraph_api.lthash_accum,
+    STYPE = bigint[],
+    COMBINEFUNC = splitgraph_api.lthash_combine,
+    FINALFUNC = splitgraph_api.lthash_final,
+    INITCOND = '{0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0}',
+    PARALLEL = SAFE
+);
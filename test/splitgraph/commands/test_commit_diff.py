@@ -137,6 +137,7 @@ def test_commit_chunking(local_engine_empty):
         # Check object metadata
         min_key = i * 5 + 1
         max_key = min(i * 5 + 5, 11)
+        num_rows = max_key - min_key + 1
 
         _compare_object_meta(
             object_meta[obj],
@@ -156,7 +157,15 @@ def test_commit_chunking(local_engine_empty):
                         "key": [min_key, max_key],
                         "value_1": [chr(ord("z") - max_key + 1), chr(ord("z") - min_key + 1)],
                         "value_2": [(min_key - 1) * 2, (max_key - 1) * 2],
-                    }
+                    },
+                    "stats": {
+                        # Widths are average lengths of the values as text
+                        "key": {"null_frac": 0, "distinct": num_rows, "width": [1, 1, 2][i]},
+                        "value_1": {"null_frac": 0, "distinct": num_rows, "width": 1},
+                        "value_2": {"null_frac": 0, "distinct": num_rows, "width": [1, 2, 2][i]},
+                    },
+                    # Rows are stored sorted by the primary key
+                    "order": ["key"],
                 },
                 # Added 5 (1 in last chunk), removed 0 rows
                 5 if i < 2 else 1,
@@ -231,6 +240,283 @@ def test_commit_chunking_order(local_engine_empty):
         ) == list(range(max_key, min_key - 1, -1))
 
 
+def test_commit_chunking_parallel(local_engine_empty):
+    OUTPUT.init()
+    OUTPUT.run_sql("CREATE TABLE test (key INTEGER PRIMARY KEY, value_1 VARCHAR, value_2 INTEGER)")
+    for i in range(11):
+        OUTPUT.run_sql("INSERT INTO test VALUES (%s, %s, %s)", (i + 1, chr(ord("a") + i), i * 2))
+
+    head = OUTPUT.commit(chunk_size=5)
+    objects = head.get_table("test").objects
+
+    # Storing chunks on multiple connections produces the same objects in the same order.
+    parallel_head = OUTPUT.commit(snap_only=True, chunk_size=5, overwrite=True, workers=3)
+    assert parallel_head.get_table("test").objects == objects
+    assert OUTPUT.objects.get_object_meta(objects).keys() == set(objects)
+
+    # Asking for more workers than there are pooled connections doesn't exhaust the pool.
+    parallel_head = OUTPUT.commit(snap_only=True, chunk_size=5, overwrite=True, workers=100)
+    assert parallel_head.get_table("test").objects == objects
+
+    # Staging tables have been cleaned up
+    assert not [
+        t
+        for t in local_engine_empty.get_all_tables(SPLITGRAPH_META_SCHEMA)
+        if t.startswith("sg_tmp")
+    ]
+
+    parallel_head.checkout()
+    assert OUTPUT.run_sql("SELECT COUNT(*) FROM test", return_shape=ResultShape.ONE_ONE) == 11
+
+
+def test_commit_chunking_bytes(local_engine_empty):
+    OUTPUT.init()
+    OUTPUT.run_sql("CREATE TABLE test (key INTEGER PRIMARY KEY, value_1 VARCHAR, value_2 INTEGER)")
+    for i in range(11):
+        OUTPUT.run_sql("INSERT INTO test VALUES (%s, %s, %s)", (i + 1, chr(ord("a") + i), i * 2))
+    row_size = OUTPUT.run_sql(
+        "SELECT avg(pg_column_size(t.*)) FROM test t", return_shape=ResultShape.ONE_ONE
+    )
+
+    # Row count gets picked so that chunks are about 5 rows large, overriding chunk_size
+    head = OUTPUT.commit(chunk_size=1, chunk_bytes=int(row_size * 5) + 1)
+    assert len(head.get_table("test").objects) == 3
+    # The chosen row count is recorded in the object index
+    for object_meta in OUTPUT.objects.get_object_meta(head.get_table("test").objects).values():
+        assert object_meta.object_index["chunk_size"] == 5
+    assert (
+        head.get_table("test").objects
+        == OUTPUT.commit(snap_only=True, chunk_size=5).get_table("test").objects
+    )
+
+    # Sampling is seeded and gives the same chunk size every time
+    with patch("splitgraph.core.fragment_manager._CHUNK_SIZE_SAMPLE_ROWS", 5):
+        assert (
+            OUTPUT.objects.estimate_chunk_size(OUTPUT.to_schema(), "test", 11, 1000)
+            == OUTPUT.objects.estimate_chunk_size(OUTPUT.to_schema(), "test", 11, 1000)
+            > 0
+        )
+
+
+def test_table_compaction(local_engine_empty):
+    OUTPUT.init()
+    OUTPUT.run_sql("CREATE TABLE test (key INTEGER PRIMARY KEY, value_1 VARCHAR, value_2 INTEGER)")
+    for i in range(11):
+        OUTPUT.run_sql("INSERT INTO test VALUES (%s, %s, %s)", (i + 1, chr(ord("a") + i), i * 2))
+    OUTPUT.commit(chunk_size=5)
+    for i in range(3):
+        OUTPUT.run_sql("UPDATE test SET value_2 = value_2 + 1 WHERE key IN (2, 7, 11)")
+        OUTPUT.run_sql("DELETE FROM test WHERE key = %s", (i + 3,))
+        OUTPUT.commit()
+    expected = OUTPUT.run_sql("SELECT * FROM test ORDER BY key")
+
+    head = OUTPUT.head
+    table = head.get_table("test")
+    old_objects = table.objects
+    assert len(old_objects) == 6
+
+    new_objects = table.compact(chunk_size=4)
+    assert table.objects == new_objects
+    assert head.get_table("test").objects == new_objects
+    assert not set(new_objects).intersection(old_objects)
+
+    # 8 rows left: 2 non-overlapping base fragments without deletions
+    assert len(new_objects) == 2
+    assert all(
+        m.deletion_hash == "0" * 64 for m in OUTPUT.objects.get_object_meta(new_objects).values()
+    )
+    plan = table.get_query_plan(None, ["key", "value_1", "value_2"])
+    assert plan.singletons == new_objects
+    assert not plan.non_singletons
+
+    # Old objects are still used by previous images
+    assert OUTPUT.objects.cleanup() == []
+    assert OUTPUT.objects.get_object_meta(old_objects).keys() == set(old_objects)
+
+    head.checkout(force=True)
+    assert OUTPUT.run_sql("SELECT * FROM test ORDER BY key") == expected
+    assert OUTPUT.run_sql(
+        "SELECT * FROM test WHERE key = 7", return_shape=ResultShape.ONE_MANY
+    ) == (7, "g", 15,)
+
+
+def test_checkout_parallel(local_engine_empty):
+    OUTPUT.init()
+    OUTPUT.run_sql("CREATE TABLE test (key INTEGER PRIMARY KEY, value VARCHAR)")
+    for i in range(10):
+        OUTPUT.run_sql("INSERT INTO test VALUES (%s, %s)", (i + 1, str(i + 1)))
+    OUTPUT.commit(chunk_size=2)
+    OUTPUT.run_sql("UPDATE test SET value = 'UPDATED' WHERE key IN (3, 6, 9)")
+    OUTPUT.run_sql("DELETE FROM test WHERE key = 5")
+    head = OUTPUT.commit(split_changeset=True)
+    expected = OUTPUT.run_sql("SELECT * FROM test ORDER BY key")
+
+    OUTPUT.uncheckout()
+    with mock.patch.object(
+        PostgresEngine, "apply_fragment_groups", wraps=OUTPUT.object_engine.apply_fragment_groups
+    ) as apply_fragment_groups:
+        head.checkout(workers=3)
+        # Five chunks, three of which have been patched: the two unpatched chunks
+        # get inserted directly and the rest get applied as patch chains.
+        assert apply_fragment_groups.call_count == 2
+        (singletons,), singleton_kwargs = apply_fragment_groups.call_args_list[0]
+        assert sorted(len(g) for g in singletons) == [1, 1]
+        assert singleton_kwargs["insert_only"]
+        (chains,), chain_kwargs = apply_fragment_groups.call_args_list[1]
+        assert sorted(len(g) for g in chains) == [2, 2, 2]
+        assert not chain_kwargs["insert_only"]
+
+    assert OUTPUT.run_sql("SELECT * FROM test ORDER BY key") == expected
+
+    # The checked out table still tracks changes
+    OUTPUT.run_sql("INSERT INTO test VALUES (11, '11')")
+    assert OUTPUT.has_pending_changes()
+
+    # If applying the patch chains fails, the partially built table gets dropped even
+    # though the singletons have already been committed.
+    OUTPUT.uncheckout(force=True)
+    with mock.patch.object(
+        PostgresEngine,
+        "_apply_batch",
+        side_effect=[None] * 2 + [ValueError("Failed to apply")] * 3,
+    ):
+        with pytest.raises(ValueError):
+            head.checkout(workers=16)
+    assert not OUTPUT.object_engine.table_exists(OUTPUT.to_schema(), "test")
+
+
+def test_checkout_bulk_load(local_engine_empty):
+    OUTPUT.init()
+    OUTPUT.run_sql("CREATE TABLE test (key INTEGER PRIMARY KEY, value VARCHAR)")
+    for i in range(10):
+        OUTPUT.run_sql("INSERT INTO test VALUES (%s, %s)", (i + 1, str(i + 1)))
+    OUTPUT.commit(chunk_size=2)
+    OUTPUT.run_sql("UPDATE test SET value = 'UPDATED' WHERE key = 3")
+    head = OUTPUT.commit(split_changeset=True)
+    expected = OUTPUT.run_sql("SELECT * FROM test ORDER BY key")
+
+    OUTPUT.uncheckout()
+    with mock.patch.object(
+        PostgresEngine, "apply_fragments", wraps=OUTPUT.object_engine.apply_fragments
+    ) as apply_fragments:
+        head.checkout()
+        assert apply_fragments.call_count == 2
+        # The four chunks that weren't patched get inserted without checking for
+        # existing rows, the chunk with its patch gets applied normally.
+        (singletons, _, _), singleton_kwargs = apply_fragments.call_args_list[0]
+        assert len(singletons) == 4
+        assert singleton_kwargs["insert_only"]
+        (chain, _, _), chain_kwargs = apply_fragments.call_args_list[1]
+        assert len(chain) == 2
+        assert not chain_kwargs["insert_only"]
+
+    assert OUTPUT.run_sql("SELECT * FROM test ORDER BY key") == expected
+    # The primary key gets built after the data has been loaded.
+    assert OUTPUT.object_engine.get_primary_keys(OUTPUT.to_schema(), "test") == [("key", "integer")]
+    OUTPUT.run_sql("INSERT INTO test VALUES (11, '11')")
+    assert OUTPUT.has_pending_changes()
+
+
+def test_fragment_stats_single_pass(local_engine_empty):
+    OUTPUT.init()
+    OUTPUT.run_sql(
+        "CREATE TABLE test (key_1 INTEGER, key_2 VARCHAR, value_1 VARCHAR, value_2 DATE, "
+        "PRIMARY KEY (key_1, key_2))"
+    )
+    for i in range(11):
+        OUTPUT.run_sql(
+            "INSERT INTO test VALUES (%s, %s, %s, %s)",
+            (i // 3, chr(ord("z") - i), chr(ord("a") + i), dt(2020, 1, i + 1)),
+        )
+    extra_indexes = {"bloom": {"value_1": {"size": 16}, "value_2": {"probability": 0.01}}}
+    head = OUTPUT.commit(extra_indexes={"test": extra_indexes})
+    table = head.get_table("test")
+    object_id = table.objects[0]
+
+    # Hashing and indexing the table in one pass gives the same result as
+    # calculating them separately on the stored object.
+    content_hash, rows, index = OUTPUT.objects.calculate_fragment_stats(
+        OUTPUT.to_schema(), "test", table.table_schema, extra_indexes=extra_indexes
+    )
+    assert rows == 11
+    assert content_hash == OUTPUT.objects.calculate_content_hash(OUTPUT.to_schema(), "test")[0]
+    assert index == OUTPUT.objects.generate_object_index(
+        object_id, table.table_schema, extra_indexes=extra_indexes
+    )
+    assert index["range"]["$pk"] == ((0, "x"), (3, "q"))
+
+
+def test_commit_diff_streaming(local_engine_empty):
+    OUTPUT.init()
+    OUTPUT.run_sql("CREATE TABLE test (key INTEGER PRIMARY KEY, value_1 VARCHAR, value_2 INTEGER)")
+    for i in range(11):
+        OUTPUT.run_sql("INSERT INTO test VALUES (%s, %s, %s)", (i + 1, chr(ord("a") + i), i * 2))
+    head = OUTPUT.commit()
+
+    OUTPUT.run_sql("UPDATE test SET value_1 = 'UPDATED' WHERE key IN (2, 7)")
+    OUTPUT.run_sql("DELETE FROM test WHERE key = 5")
+    # PK-changing update: gets turned into a delete + an insert
+    OUTPUT.run_sql("UPDATE test SET key = 20 WHERE key = 10")
+    OUTPUT.run_sql("INSERT INTO test VALUES (12, 'l', 22)")
+    # Changes that cancel each other out
+    OUTPUT.run_sql("INSERT INTO test VALUES (13, 'm', 24)")
+    OUTPUT.run_sql("DELETE FROM test WHERE key = 13")
+    OUTPUT.run_sql("UPDATE test SET value_2 = 100 WHERE key = 3")
+    OUTPUT.run_sql("UPDATE test SET value_2 = 4 WHERE key = 3")
+    expected = OUTPUT.run_sql("SELECT * FROM test ORDER BY key")
+
+    # Store the changes in batches of at most 2 PKs (by PK): 2, 5 | 7, 10 | 12, 20
+    with patch("splitgraph.core.fragment_manager._CHANGESET_BATCH_SIZE", 2):
+        new_head = OUTPUT.commit()
+
+    new_objects = new_head.get_table("test").objects
+    assert new_objects[:1] == head.get_table("test").objects
+    assert len(new_objects) == 4
+    assert OUTPUT.objects.get_object_meta(new_objects[1:]) == {o: mock.ANY for o in new_objects[1:]}
+    assert [
+        (m.rows_inserted, m.rows_deleted)
+        for m in (OUTPUT.objects.get_object_meta([o])[o] for o in new_objects[1:])
+    ] == [(1, 2), (1, 2), (2, 0)]
+    assert not OUTPUT.has_pending_changes()
+
+    head.checkout()
+    new_head.checkout()
+    assert OUTPUT.run_sql("SELECT * FROM test ORDER BY key") == expected
+
+
+def test_commit_diff_copy_keys(local_engine_empty):
+    # Force store_fragment to load the changed PKs through COPY
+    OUTPUT.init()
+    OUTPUT.run_sql("CREATE TABLE test (key INTEGER PRIMARY KEY, value_1 VARCHAR, value_2 INTEGER)")
+    OUTPUT.run_sql("CREATE TABLE test_nopk (key INTEGER, value_1 VARCHAR)")
+    for i in range(5):
+        OUTPUT.run_sql("INSERT INTO test VALUES (%s, %s, %s)", (i + 1, chr(ord("a") + i), i * 2))
+        OUTPUT.run_sql("INSERT INTO test_nopk VALUES (%s, %s)", (i + 1, chr(ord("a") + i)))
+    head = OUTPUT.commit()
+
+    for table in ["test", "test_nopk"]:
+        OUTPUT.run_sql(
+            SQL("UPDATE {} SET value_1 = E'tab\\there' WHERE key IN (2, 3)").format(
+                Identifier(table)
+            )
+        )
+        OUTPUT.run_sql(SQL("DELETE FROM {} WHERE key IN (4, 5)").format(Identifier(table)))
+    OUTPUT.run_sql("INSERT INTO test VALUES (6, NULL, 12)")
+    expected = OUTPUT.run_sql("SELECT * FROM test ORDER BY key")
+    expected_nopk = OUTPUT.run_sql("SELECT * FROM test_nopk ORDER BY key")
+
+    with patch("splitgraph.engine.postgres.engine.STORE_FRAGMENT_COPY_THRESHOLD", 1):
+        new_head = OUTPUT.commit()
+
+    diff = OUTPUT.objects.get_object_meta(new_head.get_table("test").objects[1:])
+    assert [(m.rows_inserted, m.rows_deleted) for m in diff.values()] == [(3, 2)]
+
+    head.checkout()
+    new_head.checkout()
+    assert OUTPUT.run_sql("SELECT * FROM test ORDER BY key") == expected
+    assert OUTPUT.run_sql("SELECT * FROM test_nopk ORDER BY key") == expected_nopk
+
+
 def test_commit_diff_splitting(local_engine_empty):
     # Similar setup to the chunking test
     OUTPUT.init()
@@ -302,7 +588,15 @@ def test_commit_diff_splitting(local_engine_empty):
             "3cfbe8fa6fc546264936e29f402d7263510481c88a8d27190d82b3d5830cbcbf",
             # no deletions in this fragment
             "0000000000000000000000000000000000000000000000000000000000000000",
-            {"range": {"key": [0, 0], "value_1": ["zero", "zero"], "value_2": [-1, -1]}},
+            {
+                "range": {"key": [0, 0], "value_1": ["zero", "zero"], "value_2": [-1, -1]},
+                "stats": {
+                    "key": {"null_frac": 0, "distinct": 1, "width": 1},
+                    "value_1": {"null_frac": 0, "distinct": 1, "width": 4},
+                    "value_2": {"null_frac": 0, "distinct": 1, "width": 2},
+                },
+                "order": ["key"],
+            },
             1,
             0,
         ),
@@ -316,7 +610,16 @@ def test_commit_diff_splitting(local_engine_empty):
             "e3eb6db305d889d3a69e3d8efa0931853c00fca75c0aeddd8f2fa2d6fd2443d6",
             # for value_1 we have old values for k=4,5 ('d', 'e') and new value
             # for k=5 ('UPDATED') included here; same for value_2.
-            {"range": {"key": [4, 5], "value_1": ["UPDATED", "e"], "value_2": [6, 8]}},
+            # Statistics only include the new values.
+            {
+                "range": {"key": [4, 5], "value_1": ["UPDATED", "e"], "value_2": [6, 8]},
+                "stats": {
+                    "key": {"null_frac": 0, "distinct": 1, "width": 1},
+                    "value_1": {"null_frac": 0, "distinct": 1, "width": 7},
+                    "value_2": {"null_frac": 0, "distinct": 1, "width": 1},
+                },
+                "order": ["key"],
+            },
             # 1 row inserted, 2 deleted (deletion and old pre-upsert value counts)
             1,
             2,
@@ -331,7 +634,15 @@ def test_commit_diff_splitting(local_engine_empty):
             "0000000000000000000000000000000000000000000000000000000000000000",
             "d7df15e62c1c8799ef3a3677e3eb7661cedf898d73449a80251b93c501b5bdeb",
             # Turned into one deletion, old values included here
-            {"range": {"key": [6, 6], "value_1": ["f", "f"], "value_2": [10, 10]}},
+            {
+                "range": {"key": [6, 6], "value_1": ["f", "f"], "value_2": [10, 10]},
+                "stats": {
+                    "key": {"null_frac": 0, "distinct": 0, "width": 0},
+                    "value_1": {"null_frac": 0, "distinct": 0, "width": 0},
+                    "value_2": {"null_frac": 0, "distinct": 0, "width": 0},
+                },
+                "order": ["key"],
+            },
             # 0 rows inserted, 1 deleted
             0,
             1,
@@ -344,7 +655,15 @@ def test_commit_diff_splitting(local_engine_empty):
             dt(2019, 1, 1),
             "96f0a7394f3839b048b492b789f7d57cf976345b04938a69d82b3512f72c3e9e",
             "0000000000000000000000000000000000000000000000000000000000000000",
-            {"range": {"key": [12, 12], "value_1": ["l", "l"], "value_2": [22, 22]}},
+            {
+                "range": {"key": [12, 12], "value_1": ["l", "l"], "value_2": [22, 22]},
+                "stats": {
+                    "key": {"null_frac": 0, "distinct": 1, "width": 2},
+                    "value_1": {"null_frac": 0, "distinct": 1, "width": 1},
+                    "value_2": {"null_frac": 0, "distinct": 1, "width": 2},
+                },
+                "order": ["key"],
+            },
             # Single insert
             1,
             0,
@@ -456,7 +775,14 @@ def test_commit_diff_splitting_composite(local_engine_empty):
                     # 'value' spans the old value (was '5'), the inserted value ('4') and the new updated value ('UPD').
                     "key_2": [2, 4],
                     "value": ["4", "UPD"],
-                }
+                },
+                # Statistics only include the new values ('NEW' and 'UPD').
+                "stats": {
+                    "key_1": {"null_frac": 0, "distinct": 2, "width": 19},
+                    "key_2": {"null_frac": 0, "distinct": 2, "width": 1},
+                    "value": {"null_frac": 0, "distinct": 2, "width": 3},
+                },
+                "order": ["key_1", "key_2"],
             },
             2,
             1,
@@ -480,7 +806,13 @@ def test_commit_diff_splitting_composite(local_engine_empty):
                     "key_1": ["2019-01-04 00:00:00", "2019-01-04 00:00:00"],
                     "key_2": [2, 2],
                     "value": ["NEW", "NEW"],
-                }
+                },
+                "stats": {
+                    "key_1": {"null_frac": 0, "distinct": 1, "width": 19},
+                    "key_2": {"null_frac": 0, "distinct": 1, "width": 1},
+                    "value": {"null_frac": 0, "distinct": 1, "width": 3},
+                },
+                "order": ["key_1", "key_2"],
             },
             1,
             0,
@@ -830,7 +1162,23 @@ def test_various_types(local_engine_empty):
             "j": ["0testtesttesttesttesttesttes", "testtesttesttesttesttesttest"],
             "l": ["2013-11-02 17:30:52", "2016-01-01 01:01:05"],
             "m": ["2011-11-11", "2013-02-04"],
-        }
+        },
+        "stats": {
+            # Average lengths of the values as text (char(n) gets its padding stripped)
+            "a": {"null_frac": 0, "distinct": 2, "width": 1},
+            "b": {"null_frac": 0, "distinct": 2, "width": 2},
+            "c": {"null_frac": 0, "distinct": 2, "width": 2},
+            "d": {"null_frac": 0, "distinct": 2, "width": 1},
+            "e": {"null_frac": 0, "distinct": 2, "width": 6},
+            "f": {"null_frac": 0, "distinct": 2, "width": 7},
+            "g": {"null_frac": 0, "distinct": 2, "width": 4},
+            "h": {"null_frac": 0, "distinct": 2, "width": 4},
+            "i": {"null_frac": 0, "distinct": 2, "width": 16},
+            "j": {"null_frac": 0, "distinct": 2, "width": 28},
+            "l": {"null_frac": 0, "distinct": 2, "width": 19},
+            "m": {"null_frac": 0, "distinct": 2, "width": 10},
+        },
+        "order": ["b", "c", "d"],
     }
 
     assert object_index == expected
@@ -887,7 +1235,23 @@ def test_various_types_with_deletion_index(local_engine_empty):
             "l": ["2013-11-02 17:30:52", "2016-02-01 01:01:05.123456"],
             # 2013 (U, old value), 2016 (D), 2012 (I), 2019 (U, new value)
             "m": ["2011-11-11", "2019-01-01"],
-        }
+        },
+        # Statistics only include the inserted row and the new value of the updated row.
+        "stats": {
+            "a": {"null_frac": 0, "distinct": 2, "width": 1},
+            "b": {"null_frac": 0, "distinct": 2, "width": 2},
+            "c": {"null_frac": 0, "distinct": 2, "width": 2},
+            "d": {"null_frac": 0, "distinct": 2, "width": 1},
+            "e": {"null_frac": 0, "distinct": 2, "width": 5},
+            "f": {"null_frac": 0, "distinct": 2, "width": 6},
+            "g": {"null_frac": 0, "distinct": 2, "width": 4},
+            "h": {"null_frac": 0, "distinct": 2, "width": 4},
+            "i": {"null_frac": 0, "distinct": 2, "width": 16},
+            "j": {"null_frac": 0, "distinct": 2, "width": 28},
+            "l": {"null_frac": 0, "distinct": 2, "width": 23},
+            "m": {"null_frac": 0, "distinct": 2, "width": 10},
+        },
+        "order": ["b", "c", "d"],
     }
 
     assert object_index == expected
@@ -10,7 +10,7 @@ from test.splitgraph.conftest import _assert_cache_occupancy, OUTPUT, prepare_lq
 
 from splitgraph.config import SPLITGRAPH_META_SCHEMA, CONFIG
 from splitgraph.core.common import META_TABLES
-from splitgraph.core.fragment_manager import get_chunk_groups
+from splitgraph.core.fragment_manager import get_chunk_groups, PKIntervalIndex, get_pk_lookup_keys
 from splitgraph.core.indexing.range import extract_min_max_pks
 from splitgraph.core.object_manager import ObjectManager
 from splitgraph.core.repository import clone, Repository
@@ -147,22 +147,102 @@ class TestLayeredQuerying:
         table = lq_test_repo.head.get_table("fruits")
 
         quals, expected = ([[("fruit_id", "=", "2")]], [{"name": "guitar", "timestamp": _DT}])
+        range_quals = [[("fruit_id", ">=", "2")], [("fruit_id", "<=", "2")]]
+
+        # Plans are also cached on the engine: drop the ones previous tests made.
+        table.repository.objects.invalidate_query_plans(table.objects)
 
         # Check "query plan" is reused and the table doesn't run qual filtering again
         with mock.patch.object(
             ObjectManager, "filter_fragments", wraps=table.repository.objects.filter_fragments
         ) as fo:
-            table.query(columns=["name", "timestamp"], quals=quals)
+            table.query(columns=["name", "timestamp"], quals=range_quals)
             assert fo.call_count == 1
-            table.query(columns=["name", "timestamp"], quals=quals)
+            table.query(columns=["name", "timestamp"], quals=range_quals)
+            assert fo.call_count == 1
+
+            # A new Table instance (e.g. in a different session) picks the plan up from the engine
+            new_table = lq_test_repo.head.get_table("fruits")
+            assert new_table.get_query_plan(
+                quals=range_quals, columns=["name", "timestamp"]
+            ).filtered_objects == (
+                table.get_query_plan(
+                    quals=range_quals, columns=["name", "timestamp"]
+                ).filtered_objects
+            )
             assert fo.call_count == 1
 
+            # PK lookups don't go into the engine cache
+            table.query(columns=["name", "timestamp"], quals=quals)
+            lq_test_repo.head.get_table("fruits").get_query_plan(
+                quals=quals, columns=["name", "timestamp"]
+            )
+            assert fo.call_count == 3
+
+            # Reindexing any of the table's objects invalidates the plan
+            table.repository.objects.invalidate_query_plans(table.objects[:1])
+            lq_test_repo.head.get_table("fruits").get_query_plan(
+                quals=range_quals, columns=["name", "timestamp"]
+            )
+            assert fo.call_count == 4
+
+            # Plans for the same query on a table with different objects aren't reused
+            relinked_table = lq_test_repo.head.get_table("fruits")
+            relinked_table.objects = relinked_table.objects[:-1]
+            relinked_table.get_query_plan(quals=range_quals, columns=["name", "timestamp"])
+            assert fo.call_count == 5
+
         query_plan = table.get_query_plan(quals=quals, columns=["name", "timestamp"])
-        assert query_plan.estimated_rows == 2
+        # Base fragment has 2 distinct fruit_ids (only one of them matches), the patch
+        # fragment deletes as many rows as it inserts.
+        assert query_plan.estimated_rows == 1
         assert len(query_plan.required_objects) == 4
         assert len(query_plan.filtered_objects) == 2
 
 
+def test_lq_ordered_scan(local_engine_empty):
+    OUTPUT.init()
+    OUTPUT.run_sql("CREATE TABLE test (key INTEGER PRIMARY KEY, value VARCHAR)")
+    # Insert rows in the reverse order: fragments still get stored sorted by the PK.
+    for i in reversed(range(9)):
+        OUTPUT.run_sql("INSERT INTO test VALUES (%s, %s)", (i + 1, str(i + 1)))
+    OUTPUT.commit(chunk_size=3)
+    OUTPUT.run_sql("UPDATE test SET value = 'UPDATED' WHERE key IN (6, 5)")
+    OUTPUT.run_sql("INSERT INTO test VALUES (10, '10')")
+    head = OUTPUT.commit(split_changeset=True)
+    table = head.get_table("test")
+    assert table.get_scan_order() == ["key"]
+    expected = [(i + 1, "UPDATED" if i + 1 in (5, 6) else str(i + 1)) for i in range(10)]
+
+    # Chunk (1, 2, 3), chunk (4, 5, 6) with its patch, chunk (7, 8, 9) and a new fragment (10)
+    tables, callback, _ = table.query_indirect(columns=["key", "value"], quals=None, ordered=True)
+    try:
+        assert [
+            row
+            for t in tables
+            for row in OUTPUT.engine.run_sql(
+                _generate_select_query(OUTPUT.engine, t, ["key", "value"])
+            )
+        ] == expected
+    finally:
+        callback()
+
+    # Fragments stored in a different order can't be scanned in the PK order.
+    OUTPUT.run_sql("UPDATE test SET value = 'UPDATED' WHERE key = 10")
+    new_table = OUTPUT.commit(in_fragment_order={"test": ["value"]}).get_table("test")
+    assert new_table.get_scan_order() == []
+
+    # The FDW lets Postgres skip sorting the results.
+    head.checkout(layered=True)
+    query_plan = "\n".join(r[0] for r in OUTPUT.run_sql("EXPLAIN SELECT * FROM test ORDER BY key"))
+    assert "Sort" not in query_plan
+    assert OUTPUT.run_sql("SELECT * FROM test ORDER BY key") == expected
+    query_plan = "\n".join(
+        r[0] for r in OUTPUT.run_sql("EXPLAIN SELECT * FROM test ORDER BY key DESC")
+    )
+    assert "Sort" in query_plan
+
+
 def test_layered_querying_against_single_fragment(pg_repo_local):
     # Test the case where the query is satisfied by a single fragment.
     prepare_lq_repo(pg_repo_local, snap_only=True, commit_after_every=False, include_pk=True)
@@ -411,7 +491,12 @@ def test_multiengine_flow(
 
     # Test the local engine doesn't actually have any metadata stored on it.
     for table in META_TABLES:
-        if table not in ("object_cache_status", "object_cache_occupancy", "version"):
+        if table not in (
+            "object_cache_status",
+            "object_cache_occupancy",
+            "query_plan_cache",
+            "version",
+        ):
             assert (
                 local_engine_empty.run_sql(
                     "SELECT COUNT(1) FROM splitgraph_meta." + table,
@@ -596,6 +681,7 @@ def test_disjoint_table_lq_two_singletons_one_overwritten(pg_repo_local):
                 extra_qual_args=("3",),
                 extra_quals=mock.ANY,
                 schema_spec=mock.ANY,
+                columns=["fruit_id", "name"],
             )
 
             # Two calls to _generate_select_queries -- one to directly query the pk=3 chunk...
@@ -657,6 +743,53 @@ def test_disjoint_table_lq_two_singletons_one_overwritten(pg_repo_local):
             ]
 
 
+def test_lq_pk_lookup(pg_repo_local):
+    # Same table as in the previous test: PK lookups in overlapping fragments
+    # get resolved to the newest fragment with each row without applying them.
+    prepare_lq_repo(pg_repo_local, commit_after_every=True, include_pk=True)
+    pg_repo_local.run_sql("INSERT INTO fruits VALUES (4, 'fruit_4'), (5, 'fruit_5')")
+    pg_repo_local.commit()
+    pg_repo_local.run_sql("UPDATE fruits SET name = 'fruit_5_updated' WHERE fruit_id = 5")
+    fruits = pg_repo_local.commit().get_table("fruits")
+
+    with mock.patch.object(
+        PostgresEngine, "apply_fragments", wraps=pg_repo_local.engine.apply_fragments
+    ) as apply_fragments:
+        # PK 5 was updated: only query the fragment with the update.
+        tables, callback, plan = fruits.query_indirect(
+            columns=["fruit_id", "name"], quals=[[("fruit_id", "=", "5")]]
+        )
+        assert plan.pk_lookup_keys == [(5,)]
+        assert len(plan.non_singletons) == 2
+        assert list(tables) == [
+            b'"splitgraph_meta".'
+            b'"o15a420721b04e9749761b5368628cb15593cb8cfdcc547107b98eddda5031d"'
+        ]
+        callback()
+
+        assert fruits.query(columns=["fruit_id", "name"], quals=[[("fruit_id", "=", "5")]]) == [
+            {"fruit_id": 5, "name": "fruit_5_updated"}
+        ]
+
+        # PK 1 was deleted and PK 2 was updated
+        assert fruits.query(columns=["fruit_id", "name"], quals=[[("fruit_id", "=", "1")]]) == []
+        assert fruits.query(
+            columns=["fruit_id", "name"], quals=[[("fruit_id", "=", "1"), ("fruit_id", "=", "2")]]
+        ) == [{"fruit_id": 2, "name": "guitar"}]
+        assert apply_fragments.call_count == 0
+
+        # The fragment with PK 4 also has the old version of PK 5, so we have to
+        # fall back to applying the fragments.
+        _assert_dict_list_equal(
+            fruits.query(
+                columns=["fruit_id", "name"],
+                quals=[[("fruit_id", "=", "4"), ("fruit_id", "=", "5")]],
+            ),
+            [{"fruit_id": 4, "name": "fruit_4"}, {"fruit_id": 5, "name": "fruit_5_updated"}],
+        )
+        assert apply_fragments.call_count == 1
+
+
 def test_disjoint_table_lq_two_singletons_one_overwritten_indirect(pg_repo_local):
     # Now test scanning the dataset with two singletons and one non-singleton group
     # by consuming queries one-by-one.
@@ -667,10 +800,11 @@ def test_disjoint_table_lq_two_singletons_one_overwritten_indirect(pg_repo_local
 
     tables, callback, _ = fruits.query_indirect(columns=["fruit_id", "name"], quals=None)
 
-    # At this point, we've "claimed" all objects but haven't done anything with them.
-    # We're not really testing object claiming here since the objects were created locally
-    # (see test_object_cache_deferred in test_object_cache.py for a test for claims/releases)
-    assert len(callback) == 1
+    # At this point, we haven't "claimed" any objects yet: they get claimed in batches as
+    # we consume the queries. We're not really testing object claiming here since the objects
+    # were created locally (see test_object_cache_deferred in test_object_cache.py for a test
+    # for claims/releases)
+    assert len(callback) == 0
 
     # First, we emit cstore tables
     assert (
@@ -684,7 +818,7 @@ def test_disjoint_table_lq_two_singletons_one_overwritten_indirect(pg_repo_local
         next(tables) == b'"splitgraph_meta".'
         b'"oaa6d009e485bfa91aec4ab6b0ed1ebcd67055f6a3420d29f26446b034f41cc"'
     )
-    assert len(callback) == 1
+    assert len(callback) == 2
 
     # We have two fragments left to scan but they overlap each other, so they have to be materialized.
     with mock.patch.object(
@@ -695,8 +829,9 @@ def test_disjoint_table_lq_two_singletons_one_overwritten_indirect(pg_repo_local
         args, _ = apply_fragments.call_args_list[0]
         tmp_table = args[2]
 
-    # Because of this, our callback list now includes deleting the temporary table
-    assert len(callback) == 2
+    # Because of this, our callback list now includes releasing the group's objects
+    # and deleting the temporary table
+    assert len(callback) == 4
 
     # We've now exhausted the list of queries
     with pytest.raises(StopIteration):
@@ -754,6 +889,154 @@ def test_disjoint_table_lq_temp_table_deletion_doesnt_lock_up(pg_repo_local):
         engine.run_sql(query)
 
 
+def test_lq_lazy_object_fetching(local_engine_empty):
+    # Check that LQ only claims objects as the caller consumes the queries, in batches
+    # that double in size.
+    OUTPUT.init()
+    OUTPUT.run_sql("CREATE TABLE test (key INTEGER PRIMARY KEY, value VARCHAR)")
+    for i in range(8):
+        OUTPUT.run_sql("INSERT INTO test VALUES (%s, %s)", (i + 1, str(i + 1)))
+    table = OUTPUT.commit(chunk_size=1).get_table("test")
+    assert len(table.objects) == 8
+
+    with mock.patch.object(
+        ObjectManager, "ensure_objects", wraps=OUTPUT.objects.ensure_objects
+    ) as ensure_objects:
+        tables, callback, _ = table.query_indirect(columns=["key", "value"], quals=None)
+        assert ensure_objects.call_count == 0
+
+        # A caller that only needs the first table (e.g. a query with a LIMIT) only
+        # claims and downloads one object.
+        next(tables)
+        assert ensure_objects.call_count == 1
+        assert ensure_objects.call_args_list[0][1]["objects"] == table.objects[:1]
+
+        assert len(list(tables)) == 7
+        assert [c[1]["objects"] for c in ensure_objects.call_args_list] == [
+            table.objects[:1],
+            table.objects[1:3],
+            table.objects[3:7],
+            table.objects[7:],
+        ]
+        callback()
+
+    # With lazy fetching disabled, all objects are claimed upfront.
+    with mock.patch.dict(CONFIG, {"SG_LQ_FETCH_BATCH": "0"}):
+        with mock.patch.object(
+            ObjectManager, "ensure_objects", wraps=OUTPUT.objects.ensure_objects
+        ) as ensure_objects:
+            tables, callback, _ = table.query_indirect(columns=["key", "value"], quals=None)
+            assert ensure_objects.call_count == 1
+            assert ensure_objects.call_args_list[0][1]["objects"] == table.objects
+            assert len(list(tables)) == 8
+            assert ensure_objects.call_count == 1
+            callback()
+
+
+def test_lq_non_singleton_projection(local_engine_empty):
+    # Check that only the required columns get materialized when applying fragments
+    OUTPUT.init()
+    OUTPUT.run_sql(
+        "CREATE TABLE test (key INTEGER PRIMARY KEY, value_1 VARCHAR, value_2 INTEGER, "
+        "value_3 VARCHAR)"
+    )
+    for i in range(4):
+        OUTPUT.run_sql(
+            "INSERT INTO test VALUES (%s, %s, %s, %s)", (i + 1, chr(ord("a") + i), i * 2, "wide")
+        )
+    OUTPUT.commit()
+    OUTPUT.run_sql("UPDATE test SET value_1 = 'UPDATED' WHERE key = 2")
+    OUTPUT.run_sql("DELETE FROM test WHERE key = 3")
+    table = OUTPUT.commit().get_table("test")
+
+    with mock.patch.object(
+        PostgresEngine, "apply_fragments", wraps=OUTPUT.engine.apply_fragments
+    ) as apply_fragments:
+        tables, callback, plan = table.query_indirect(
+            columns=["value_1"], quals=[[("value_2", ">", "0")]]
+        )
+        staging_table = list(tables)[-1]
+        assert len(plan.non_singletons) == 2
+        assert apply_fragments.call_count == 1
+        args, _ = apply_fragments.call_args_list[0]
+        tmp_table = args[2]
+
+    # The staging table has the PK, the requested column and the column used in the qualifiers
+    assert [c.name for c in plan.projected_schema] == ["key", "value_1", "value_2"]
+    assert [
+        c.name for c in OUTPUT.engine.get_full_table_schema(SPLITGRAPH_META_SCHEMA, tmp_table)
+    ] == ["key", "value_1", "value_2"]
+    assert sorted(
+        OUTPUT.engine.run_sql(
+            _generate_select_query(
+                OUTPUT.engine, staging_table, ["value_1"], plan.sql_quals, plan.sql_qual_vals
+            )
+        )
+    ) == [("UPDATED",), ("d",)]
+
+    callback()
+    assert not OUTPUT.engine.table_exists(SPLITGRAPH_META_SCHEMA, tmp_table)
+
+
+def test_lq_non_singleton_groups_applied_separately(local_engine_empty):
+    OUTPUT.init()
+    OUTPUT.run_sql("CREATE TABLE test (key INTEGER PRIMARY KEY, value VARCHAR)")
+    for i in range(4):
+        OUTPUT.run_sql("INSERT INTO test VALUES (%s, %s)", (i + 1, str(i + 1)))
+    OUTPUT.commit(chunk_size=2)
+    OUTPUT.run_sql("UPDATE test SET value = 'UPDATED' WHERE key IN (1, 4)")
+    table = OUTPUT.commit(split_changeset=True).get_table("test")
+
+    # Chunks (1, 2) and (3, 4) and patches to PKs 1 and 4 make two independent groups
+    base_1, base_2, patch_1, patch_4 = table.objects
+
+    for release_consumed in [False, True]:
+        with mock.patch.object(
+            PostgresEngine, "apply_fragments", wraps=OUTPUT.engine.apply_fragments
+        ) as apply_fragments:
+            tables, callback, plan = table.query_indirect(
+                columns=["key", "value"], quals=None, release_consumed=release_consumed
+            )
+            assert plan.get_non_singleton_groups() == [[base_1, patch_1], [base_2, patch_4]]
+
+            # Each group gets applied to its own staging table only when we ask for it
+            assert apply_fragments.call_count == 0
+            first_table = next(tables)
+            assert apply_fragments.call_count == 1
+            assert apply_fragments.call_args_list[0][0][0] == [
+                (SPLITGRAPH_META_SCHEMA, base_1),
+                (SPLITGRAPH_META_SCHEMA, patch_1),
+            ]
+            first_staging = apply_fragments.call_args_list[0][0][2]
+            assert sorted(
+                OUTPUT.engine.run_sql(
+                    _generate_select_query(OUTPUT.engine, first_table, ["key", "value"])
+                )
+            ) == [(1, "UPDATED"), (2, "2")]
+
+            second_table = next(tables)
+            assert apply_fragments.call_count == 2
+            second_staging = apply_fragments.call_args_list[1][0][2]
+            assert sorted(
+                OUTPUT.engine.run_sql(
+                    _generate_select_query(OUTPUT.engine, second_table, ["key", "value"])
+                )
+            ) == [(3, "3"), (4, "UPDATED")]
+
+            # If asked to, the staging table for the first group is deleted as soon as
+            # we've moved on to the second one.
+            assert (
+                OUTPUT.engine.table_exists(SPLITGRAPH_META_SCHEMA, first_staging)
+                != release_consumed
+            )
+
+            with pytest.raises(StopIteration):
+                next(tables)
+            callback()
+            assert not OUTPUT.engine.table_exists(SPLITGRAPH_META_SCHEMA, first_staging)
+            assert not OUTPUT.engine.table_exists(SPLITGRAPH_META_SCHEMA, second_staging)
+
+
 def test_get_chunk_groups():
     # Two non-overlapping chunks
     assert get_chunk_groups([("chunk_1", 1, 2), ("chunk_2", 3, 4)]) == [
@@ -788,3 +1071,57 @@ def test_get_chunk_groups():
     assert get_chunk_groups([("one", 1, 3), ("two", 6, 8), ("three", 3, 6), ("four", 8, 10)]) == [
         [("one", 1, 3), ("two", 6, 8), ("three", 3, 6), ("four", 8, 10)]
     ]
+
+
+def test_pk_interval_index():
+    chunks = [("one", 1, 3), ("two", 6, 8), ("three", 3, 5), ("four", 8, 10), ("five", 12, 12)]
+    index = PKIntervalIndex([c[0] for c in chunks], [(c[1], c[2]) for c in chunks])
+
+    assert index.group_boundaries == [(1, 5), (6, 10), (12, 12)]
+
+    assert index.get_fragments(0, 0) == []
+    assert index.get_fragments(3, 3) == ["one", "three"]
+    assert index.get_fragments(4, 6) == ["three", "two"]
+    assert index.get_fragments(11, 11) == []
+    assert index.get_fragments(9, 100) == ["four", "five"]
+
+    # Grouping a subset of chunks gives the same result as get_chunk_groups
+    for subset in [
+        ["one", "two", "three", "four", "five"],
+        ["five", "one", "three"],
+        ["two", "four"],
+        ["four"],
+    ]:
+        assert index.group_fragments(subset) == get_chunk_groups(
+            [c for s in subset for c in chunks if c[0] == s]
+        )
+    assert index.group_fragments([]) == []
+
+    # Dropping a chunk from a group can split it
+    index = PKIntervalIndex(["one", "two", "three"], [(1, 3), (3, 6), (6, 8)])
+    assert index.group_boundaries == [(1, 8)]
+    assert index.group_fragments(["three", "one"]) == [[("one", 1, 3)], [("three", 6, 8)]]
+
+
+def test_get_pk_lookup_keys():
+    pks = [("key", "integer")]
+    assert get_pk_lookup_keys([[("key", "=", "1")]], pks) == [(1,)]
+    assert get_pk_lookup_keys([[("key", "=", 1), ("key", "=", "2"), ("key", "=", 1)]], pks) == [
+        (1,),
+        (2,),
+    ]
+    # Other quals don't matter
+    assert get_pk_lookup_keys([[("key", "=", "1")], [("value", ">", 5)]], pks) == [(1,)]
+
+    # Not a PK lookup
+    assert get_pk_lookup_keys(None, pks) is None
+    assert get_pk_lookup_keys([[("key", ">", "1")]], pks) is None
+    assert get_pk_lookup_keys([[("key", "=", "1"), ("value", "=", "1")]], pks) is None
+    assert get_pk_lookup_keys([[("key", "=", "not a number")]], pks) is None
+
+    # Composite PKs
+    pks = [("key_1", "integer"), ("key_2", "text")]
+    assert get_pk_lookup_keys([[("key_1", "=", "1")]], pks) is None
+    assert get_pk_lookup_keys(
+        [[("key_2", "=", "a"), ("key_2", "=", "b")], [("key_1", "=", "1")]], pks
+    ) == [(1, "a"), (1, "b")]
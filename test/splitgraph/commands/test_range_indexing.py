@@ -33,5 +33,14 @@ def test_range_index_ordering_collation(local_engine_empty):
             "key_2": ["ONE", "two"],
             "value_1": ["CUCUMBER", "banana"],
             "value_2": [1, 4],
-        }
+        },
+        "stats": {
+            "key_1": {"null_frac": 0, "distinct": 2, "width": 1},
+            "key_2": {"null_frac": 0, "distinct": 4, "width": 3},
+            # Average of 5, 6, 6 and 8 characters
+            "value_1": {"null_frac": 0, "distinct": 4, "width": 6},
+            "value_2": {"null_frac": 0, "distinct": 4, "width": 1},
+        },
+        # Rows are stored sorted by the primary key
+        "order": ["key_1", "key_2"],
     }
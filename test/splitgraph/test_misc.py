@@ -5,7 +5,7 @@ import pytest
 from psycopg2.errors import CheckViolation
 
 from splitgraph.core.common import Tracer, adapt, coerce_val_to_json
-from splitgraph.core.output import parse_dt
+from splitgraph.core.output import parse_dt, parse_size
 from splitgraph.core.engine import lookup_repository
 from splitgraph.core.metadata_manager import Object
 from splitgraph.core.repository import Repository
@@ -307,3 +307,14 @@ def test_parse_dt():
 
     with pytest.raises(ValueError):
         parse_dt("not a dt")
+
+
+def test_parse_size():
+    assert parse_size("1024") == 1024
+    assert parse_size("64MB") == 64 * 1024 * 1024
+    assert parse_size("64 MiB") == 64 * 1024 * 1024
+    assert parse_size("1.5k") == 1536
+    assert parse_size("2G") == 2 * 1024 ** 3
+
+    with pytest.raises(ValueError):
+        parse_size("64 parsecs")
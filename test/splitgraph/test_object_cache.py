@@ -1,8 +1,12 @@
 import itertools
-from datetime import datetime as dt
+import tempfile
+import threading
+from datetime import datetime as dt, timedelta
 from unittest import mock
 
 import pytest
+from click.testing import CliRunner
+from psycopg2.sql import SQL
 from test.splitgraph.conftest import (
     OUTPUT,
     _cleanup_minio,
@@ -11,11 +15,24 @@ from test.splitgraph.conftest import (
     prepare_lq_repo,
 )
 
-from splitgraph.config import SPLITGRAPH_META_SCHEMA
-from splitgraph.core.indexing.range import _quals_to_clause
+from splitgraph.commandline.cache import simulate_c
+from splitgraph.config import SPLITGRAPH_META_SCHEMA, CONFIG
+from splitgraph.core.eviction import (
+    CacheAccess,
+    DecayEvictionPolicy,
+    GDSFEvictionPolicy,
+    simulate_eviction,
+    write_access_log,
+    read_access_log,
+)
+from splitgraph.core.indexing.range import _quals_to_clause, filter_range_index_meta
+from splitgraph.core.indexing.stats import estimate_selectivity, estimate_row_width
+from splitgraph.core.object_manager import ObjectManager, _OBJECT_DOWNLOAD_LOCK_CLASS
 from splitgraph.core.repository import clone
 from splitgraph.core.sql import select
-from splitgraph.engine import ResultShape
+from splitgraph.core.types import TableColumn
+from splitgraph.engine import ResultShape, _prepare_engine_config
+from splitgraph.engine.postgres.engine import PostgresEngine
 from splitgraph.exceptions import ObjectCacheError
 
 
@@ -107,6 +124,13 @@ def test_object_cache_loading(local_engine_empty, pg_repo_remote, clean_minio):
     assert _get_refcount(object_manager, fruit_diff) == 0
     assert len(object_manager.get_downloaded_objects()) == 2
 
+    # Everything is cached: the claims aren't committed separately since nothing gets downloaded.
+    with mock.patch.object(
+        object_manager.object_engine, "commit", wraps=object_manager.object_engine.commit
+    ) as commit:
+        with object_manager.ensure_objects(fruits_v3):
+            assert commit.call_count == 1
+
 
 def test_object_cache_non_existing_objects(local_engine_empty, pg_repo_remote, clean_minio):
     pg_repo_local = _setup_object_cache_test(pg_repo_remote)
@@ -399,6 +423,358 @@ def test_object_cache_eviction_priority(local_engine_empty, pg_repo_remote, clea
         assert "Not enough space will be reclaimed" in str(e.value)
 
 
+def test_object_cache_pinning(local_engine_empty, pg_repo_remote, clean_minio):
+    pg_repo_local = _setup_object_cache_test(pg_repo_remote)
+
+    object_manager = pg_repo_local.objects
+    latest = pg_repo_local.images["latest"]
+    previous = pg_repo_local.images[latest.parent_id]
+    fruits_v2 = previous.get_table("fruits")
+    fruits_v3 = latest.get_table("fruits")
+    fruit_snap = fruits_v2.objects[0]
+    fruit_diff = fruits_v3.objects[1]
+
+    object_manager.pin_image(previous)
+    assert object_manager.get_pinned_images() == [
+        (pg_repo_local.namespace, pg_repo_local.repository, previous.image_hash)
+    ]
+    assert fruit_snap in object_manager.get_pinned_objects()
+    assert fruit_diff not in object_manager.get_pinned_objects()
+
+    with object_manager.ensure_objects(fruits_v3):
+        pass
+
+    # Objects required by the pinned image don't get evicted, even if eviction is asked
+    # to delete everything.
+    object_manager.run_eviction(keep_objects=[], required_space=None)
+    assert object_manager.get_downloaded_objects() == [fruit_snap]
+    _assert_cache_occupancy(object_manager, 1)
+
+    # Not enough space can be freed without evicting pinned objects
+    object_manager.cache_size = SMALL_OBJECT_SIZE + 100
+    with pytest.raises(ObjectCacheError) as e:
+        with object_manager.ensure_objects(fruits_v3):
+            pass
+    assert "Not enough space will be reclaimed" in str(e.value)
+
+    object_manager.unpin_image(previous)
+    assert object_manager.get_pinned_images() == []
+    object_manager.run_eviction(keep_objects=[], required_space=None)
+    assert object_manager.get_downloaded_objects() == []
+
+
+def test_object_cache_quotas(local_engine_empty, pg_repo_remote, clean_minio):
+    pg_repo_local = _setup_object_cache_test(pg_repo_remote)
+
+    object_manager = pg_repo_local.objects
+    latest = pg_repo_local.images["latest"]
+    fruits_v3 = latest.get_table("fruits")
+    vegetables_v2 = pg_repo_local.images[latest.parent_id].get_table("vegetables")
+    vegetables_snap = vegetables_v2.objects[0]
+
+    # The global cache has space for all objects but the repository can only take up 2 of them.
+    object_manager.set_cache_quota(
+        pg_repo_local.namespace, pg_repo_local.repository, SMALL_OBJECT_SIZE * 2 + 200
+    )
+    assert object_manager.get_cache_quotas() == [
+        (pg_repo_local.namespace, pg_repo_local.repository, SMALL_OBJECT_SIZE * 2 + 200)
+    ]
+
+    with object_manager.ensure_objects(fruits_v3):
+        _assert_cache_occupancy(object_manager, 2)
+
+    # Downloading another object evicts one of the repository's objects. The quota
+    # is checked whilst holding the cache accounting lock.
+    object_manager.eviction_min_fraction = 0
+    calls = []
+    lock, get_usage = object_manager._lock_cache_accounting, object_manager._get_cache_quota_usage
+    with mock.patch.object(
+        object_manager,
+        "_lock_cache_accounting",
+        side_effect=lambda: calls.append("lock") or lock(),
+    ), mock.patch.object(
+        object_manager,
+        "_get_cache_quota_usage",
+        side_effect=lambda *args: calls.append("quota") or get_usage(*args),
+    ):
+        with object_manager.ensure_objects(vegetables_v2):
+            current_objects = object_manager.get_downloaded_objects()
+            assert len(current_objects) == 2
+            assert vegetables_snap in current_objects
+            _assert_cache_occupancy(object_manager, 2)
+    assert calls[:2] == ["lock", "quota"]
+
+    # Namespace-wide quotas apply too.
+    object_manager.set_cache_quota(pg_repo_local.namespace, "", SMALL_OBJECT_SIZE)
+    object_manager.run_eviction(keep_objects=[], required_space=None)
+    with pytest.raises(ObjectCacheError) as e:
+        with object_manager.ensure_objects(fruits_v3):
+            pass
+    assert "Not enough space in the cache quota for %s" % pg_repo_local.namespace in str(e.value)
+
+    object_manager.set_cache_quota(pg_repo_local.namespace, "", None)
+    object_manager.set_cache_quota(pg_repo_local.namespace, pg_repo_local.repository, None)
+    assert object_manager.get_cache_quotas() == []
+    with object_manager.ensure_objects(fruits_v3):
+        _assert_cache_occupancy(object_manager, 2)
+
+
+def test_object_cache_prefetch(local_engine_empty, pg_repo_remote, clean_minio):
+    pg_repo_local = _setup_object_cache_test(pg_repo_remote)
+
+    object_manager = pg_repo_local.objects
+    latest = pg_repo_local.images["latest"]
+    fruits_v3 = latest.get_table("fruits")
+    vegetables_v2 = pg_repo_local.images[latest.parent_id].get_table("vegetables")
+    vegetables_snap = vegetables_v2.objects[0]
+
+    with object_manager.ensure_objects(vegetables_v2):
+        pass
+
+    # Only leave enough space for one more object: prefetching doesn't evict anything
+    # and downloads as many objects as fit into the free space.
+    object_manager.cache_size = object_manager.get_cache_occupancy() + SMALL_OBJECT_SIZE + 150
+    prefetched = object_manager.prefetch(fruits_v3)
+    assert len(prefetched) == 1
+    assert prefetched[0] in fruits_v3.objects
+
+    current_objects = object_manager.get_downloaded_objects()
+    assert vegetables_snap in current_objects
+    assert prefetched[0] in current_objects
+    _assert_cache_occupancy(object_manager, 2)
+
+    # Prefetched objects aren't held on to and don't count as used.
+    assert _get_refcount(object_manager, prefetched[0]) == 0
+    assert (
+        object_manager.object_engine.run_sql(
+            select("object_cache_status", "access_count", "object_id = %s"),
+            (prefetched[0],),
+            return_shape=ResultShape.ONE_ONE,
+        )
+        == 0
+    )
+
+    # Nothing to prefetch if everything's already in the cache.
+    object_manager.cache_size = SMALL_OBJECT_SIZE * 10
+    assert object_manager.prefetch(vegetables_v2) == []
+
+    # The query doesn't need to download the prefetched object.
+    prefetched = prefetched + object_manager.prefetch(fruits_v3)
+    assert sorted(prefetched) == sorted(fruits_v3.objects)
+    with mock.patch.object(object_manager, "download_objects") as download_objects:
+        with object_manager.ensure_objects(fruits_v3):
+            pass
+    download_objects.assert_not_called()
+
+    # Background prefetching uses a non-daemon thread (so that it doesn't get killed at exit
+    # with the objects still claimed) and a separate engine: downloading objects commits and
+    # closes the engine's other connections, which mustn't affect the caller's transaction.
+    object_manager.run_eviction(keep_objects=[], required_space=None)
+    engine = object_manager.object_engine
+    threads = []
+    download_engines = []
+    caller_in_transaction = threading.Event()
+    thread_class = threading.Thread
+    download_locked_objects = ObjectManager._download_locked_objects
+
+    def _make_thread(*args, **kwargs):
+        thread = thread_class(*args, **kwargs)
+        threads.append(thread)
+        return thread
+
+    def _download_locked_objects(manager, *args):
+        caller_in_transaction.wait()
+        download_engines.append(manager.object_engine)
+        return download_locked_objects(manager, *args)
+
+    with mock.patch(
+        "splitgraph.core.object_manager.threading.Thread", side_effect=_make_thread
+    ), mock.patch.object(
+        ObjectManager,
+        "_download_locked_objects",
+        autospec=True,
+        side_effect=_download_locked_objects,
+    ):
+        prefetched = object_manager.prefetch(fruits_v3, background=True)
+        engine.run_sql("CREATE TABLE prefetch_test (key INTEGER)")
+        engine.run_sql("INSERT INTO prefetch_test VALUES (1)")
+        connection = engine.connection
+        caller_in_transaction.set()
+        threads[0].join()
+
+    assert sorted(prefetched) == sorted(fruits_v3.objects)
+    assert threads[0].daemon is False
+    assert len(download_engines) == 1
+    assert download_engines[0] is not engine
+
+    assert not connection.closed
+    assert engine.connection is connection
+    assert engine.autocommit is False
+    assert engine.run_sql("SELECT key FROM prefetch_test", return_shape=ResultShape.MANY_ONE) == [1]
+    engine.rollback()
+
+    assert all(_get_refcount(object_manager, o) == 0 for o in prefetched)
+    assert set(prefetched).issubset(object_manager.get_downloaded_objects())
+    _assert_cache_occupancy(object_manager, 2)
+
+
+def _make_scan_accesses():
+    # Two objects that are used often, then a scan through a few objects that are only
+    # used once, then the two hot objects again. All objects are 1MB and the cache fits 3 of them.
+    start = dt(2020, 1, 1)
+    object_ids = ["hot_1", "hot_2"] * 5 + ["scan_%d" % i for i in range(4)] + ["hot_1", "hot_2"]
+    return [
+        CacheAccess(time=start + timedelta(seconds=i), object_id=o, size=1024 * 1024)
+        for i, o in enumerate(object_ids)
+    ]
+
+
+def test_object_cache_eviction_policy_simulation():
+    accesses = _make_scan_accesses()
+    cache_size = 3 * 1024 * 1024
+
+    # Recency-based eviction lets the scan flush the hot objects out of the cache.
+    result = simulate_eviction(DecayEvictionPolicy(), accesses, cache_size)
+    assert result.accesses == 16
+    assert result.hits == 8
+    assert result.evictions == 5
+
+    # GDSF keeps them since they have been used more often than the scanned objects.
+    result = simulate_eviction(GDSFEvictionPolicy(), accesses, cache_size)
+    assert result.hits == 10
+    assert result.evictions == 3
+    assert result.hit_ratio == result.byte_hit_ratio == 10 / 16
+
+    # Objects that don't fit into the cache are never cached.
+    result = simulate_eviction(GDSFEvictionPolicy(), accesses, 1024 * 1024 - 1)
+    assert result.hits == 0
+    assert result.evictions == 0
+
+
+def test_object_cache_eviction_policy_simulation_commandline():
+    accesses = _make_scan_accesses()
+    runner = CliRunner()
+
+    with tempfile.NamedTemporaryFile("w") as f:
+        write_access_log(f.name, accesses)
+        assert list(read_access_log(f.name)) == accesses
+
+        result = runner.invoke(
+            simulate_c,
+            [
+                f.name,
+                "--cache-size",
+                "3",
+                "-p",
+                "splitgraph.core.eviction.DecayEvictionPolicy",
+                "-p",
+                "splitgraph.core.eviction.GDSFEvictionPolicy",
+            ],
+            catch_exceptions=False,
+        )
+        assert result.exit_code == 0
+        assert "8/16 (50.00%)" in result.stdout
+        assert "10/16 (62.50%)" in result.stdout
+
+        with pytest.raises(ObjectCacheError) as e:
+            runner.invoke(
+                simulate_c, [f.name, "-p", "splitgraph.NoSuchPolicy"], catch_exceptions=False
+            )
+        assert "Error loading eviction policy" in str(e.value)
+
+
+def test_object_cache_concurrent_downloads(local_engine_empty, pg_repo_remote, clean_minio):
+    # Check that the object manager doesn't download objects that another manager is
+    # downloading and instead waits for it to finish (downloading them itself if the
+    # other manager fails).
+    pg_repo_local = _setup_object_cache_test(pg_repo_remote)
+    object_manager = pg_repo_local.objects
+    fruits_v3 = pg_repo_local.images["latest"].get_table("fruits")
+    fruit_diff = fruits_v3.objects[0]
+
+    locked = threading.Event()
+    release = threading.Event()
+
+    def _other_manager():
+        # Pretend to be a manager that's downloading the object and then fails.
+        engine = PostgresEngine(conn_params=_prepare_engine_config(CONFIG), name="test_engine")
+        engine.run_sql(
+            "SELECT pg_advisory_xact_lock(%s, hashtext(%s))",
+            (_OBJECT_DOWNLOAD_LOCK_CLASS, fruit_diff),
+        )
+        locked.set()
+        release.wait()
+        engine.rollback()
+        engine.close()
+
+    thread = threading.Thread(target=_other_manager)
+    thread.start()
+    locked.wait()
+    timer = threading.Timer(1, release.set)
+    timer.start()
+
+    with mock.patch.object(
+        ObjectManager, "download_objects", wraps=object_manager.download_objects
+    ) as download_objects:
+        with object_manager.ensure_objects(fruits_v3):
+            _assert_cache_occupancy(object_manager, 2)
+            assert _get_refcount(object_manager, fruit_diff) == 1
+
+    thread.join()
+    timer.join()
+
+    # First, we download everything but the locked object, then the locked object itself.
+    assert download_objects.call_count == 2
+    assert fruit_diff not in download_objects.call_args_list[0][1]["objects_to_fetch"]
+    assert download_objects.call_args_list[1][1]["objects_to_fetch"] == [fruit_diff]
+    assert len(object_manager.get_downloaded_objects()) == 2
+    assert _get_refcount(object_manager, fruit_diff) == 0
+
+
+def test_object_cache_interrupted_download(local_engine_empty, pg_repo_remote, clean_minio):
+    pg_repo_local = _setup_object_cache_test(pg_repo_remote)
+    object_manager = pg_repo_local.objects
+    fruits_v3 = pg_repo_local.images["latest"].get_table("fruits")
+    fruits_v2 = pg_repo_local.images[pg_repo_local.images["latest"].parent_id].get_table("fruits")
+    fruit_snap = fruits_v2.objects[0]
+    fruit_diff = [o for o in fruits_v3.objects if o != fruit_snap][0]
+
+    with object_manager.ensure_objects(fruits_v2):
+        pass
+    _assert_cache_occupancy(object_manager, 1)
+
+    # Interrupt the download: the claims and the reserved space are given back.
+    with mock.patch.object(object_manager, "download_objects", side_effect=KeyboardInterrupt):
+        with pytest.raises(KeyboardInterrupt):
+            with object_manager.ensure_objects(fruits_v3):
+                pass
+
+    assert _get_refcount(object_manager, fruit_snap) == 0
+    assert _get_refcount(object_manager, fruit_diff) is None
+    assert object_manager.get_downloaded_objects() == [fruit_snap]
+    _assert_cache_occupancy(object_manager, 1)
+
+    # Pretend that the manager crashed without cleaning up: the space reserved for the
+    # object stays on its cache entry and is counted in the occupancy.
+    with mock.patch.object(
+        object_manager,
+        "_abandon_download",
+        side_effect=lambda *args: object_manager.object_engine.rollback(),
+    ):
+        with mock.patch.object(object_manager, "download_objects", side_effect=KeyboardInterrupt):
+            with pytest.raises(KeyboardInterrupt):
+                with object_manager.ensure_objects(fruits_v3):
+                    pass
+    assert _get_refcount(object_manager, fruit_diff) == 1
+    _assert_cache_occupancy(object_manager, 2)
+
+    # The next manager to download the object reuses the reservation instead of counting it twice.
+    with object_manager.ensure_objects(fruits_v3):
+        _assert_cache_occupancy(object_manager, 2)
+    _assert_cache_occupancy(object_manager, 2)
+    assert len(object_manager.get_downloaded_objects()) == 2
+
+
 def test_object_cache_deferred(local_engine_empty, pg_repo_remote, clean_minio):
     # Test object manager with deferred releases (we get given a callback to
     # release objects rather than it being done when we leave the context manager)
@@ -702,6 +1078,114 @@ def test_object_manager_object_filtering(local_engine_empty, include_bloom):
     )
 
 
+def test_range_index_filtering_without_engine():
+    # Same cases as test_object_manager_object_filtering but done without querying the engine
+    indexes = {
+        "obj_1": {
+            "range": {
+                "col1": [1, 5],
+                "col3": ["aaaa", "bbbb"],
+                "col4": ["2016-01-01 00:00:00", "2016-01-02 00:00:00"],
+                "col6": ["1.5", "2.5"],
+            }
+        },
+        "obj_2": {
+            "range": {
+                "col1": [6, 10],
+                "col3": ["abbb", "cccc"],
+                "col4": ["2015-12-30 00:00:00", "2015-12-30 00:00:00"],
+                "col6": [None, None],
+            }
+        },
+        # No index: might match anything
+        "obj_3": {},
+    }
+    column_types = {
+        "col1": "integer",
+        "col3": "character varying(10)",
+        "col4": "timestamp",
+        "col5": "timestamp with time zone",
+        "col6": "numeric(5,2)",
+        "col7": "double precision",
+    }
+    objects = ["obj_1", "obj_2", "obj_3"]
+
+    def _assert_filter_result(quals, expected, incomplete=False):
+        assert filter_range_index_meta(indexes, objects, quals, column_types) == (
+            expected,
+            incomplete,
+        )
+
+    _assert_filter_result(None, objects)
+    _assert_filter_result([[("col1", "=", 3)]], ["obj_1", "obj_3"])
+    _assert_filter_result([[("col1", "=", "3")]], ["obj_1", "obj_3"])
+    # Comparisons aren't truncated to the column's type
+    _assert_filter_result([[("col1", "<", 5.5)]], ["obj_1", "obj_3"])
+    _assert_filter_result([[("col1", ">", 5.5)]], ["obj_2", "obj_3"])
+    _assert_filter_result([[("col1", "<>", 3)]], objects)
+    _assert_filter_result([[("col3", "=", "aaab")]], ["obj_1", "obj_3"])
+    _assert_filter_result([[("col4", ">", dt(2015, 12, 31))]], ["obj_1", "obj_3"])
+    _assert_filter_result([[("col4", "<=", "2016-01-01 00:00:00")]], objects)
+    # Objects with only NULLs in a column can't match comparisons
+    _assert_filter_result([[("col6", ">=", "2")]], ["obj_1", "obj_3"])
+    # Values we can't compare might match anything
+    _assert_filter_result([[("col1", "=", "not a number")]], objects)
+    _assert_filter_result([[("col1", ">", 5), ("col1", "<", 2)]], objects)
+    _assert_filter_result([[("col1", ">", 5)], [("col1", "<", 2)]], ["obj_3"])
+
+    # Types that can't be compared in Python get left to the engine
+    _assert_filter_result([[("col5", ">", "2016-01-01 00:00:00+00")]], objects, incomplete=True)
+    _assert_filter_result([[("col7", ">", 0.1)]], objects, incomplete=True)
+    _assert_filter_result(
+        [[("col5", ">", "2016-01-01 00:00:00+00")], [("col1", "=", 3)]],
+        ["obj_1", "obj_3"],
+        incomplete=True,
+    )
+
+
+def test_column_stats_estimation():
+    index = {
+        "range": {"col1": [1, 100], "col3": ["a", "z"]},
+        "stats": {
+            "col1": {
+                "null_frac": 0.1,
+                "distinct": 90,
+                "width": 2,
+                "histogram": [1, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100],
+            },
+            # Few distinct values: no histogram, the range index gets used instead
+            "col3": {"null_frac": 0, "distinct": 5, "width": 4},
+        },
+    }
+    column_types = {"col1": "integer", "col2": "integer", "col3": "character varying(10)"}
+
+    def _assert_selectivity(quals, expected):
+        assert estimate_selectivity(quals, index, column_types) == pytest.approx(expected)
+
+    _assert_selectivity(None, 1)
+    _assert_selectivity([[("col1", "=", 50)]], 0.01)
+    _assert_selectivity([[("col1", "=", "500")]], 0)
+    _assert_selectivity([[("col1", "<>", 50)]], 0.89)
+    # 5.5 buckets out of 10 are below 55, 10% of values are NULLs.
+    _assert_selectivity([[("col1", "<", 55)]], 0.495)
+    _assert_selectivity([[("col1", ">", 55)]], (1 - 0.55 - 0.01) * 0.9)
+    _assert_selectivity([[("col1", ">=", 1000)]], 0)
+    _assert_selectivity([[("col3", "=", "c")]], 0.2)
+    _assert_selectivity([[("col3", "<", "c")]], 0.5)
+    _assert_selectivity([[("col3", "~~", "c%")]], 0.5)
+    # OR/AND clauses are assumed to be independent
+    _assert_selectivity([[("col3", "=", "c"), ("col3", "=", "d")]], 0.36)
+    _assert_selectivity([[("col1", "=", 50)], [("col3", "=", "c")]], 0.002)
+    # Columns without statistics get the same defaults as in PostgreSQL
+    _assert_selectivity([[("col2", "=", 50)]], 0.005)
+    _assert_selectivity([[("col2", ">", 50)]], 1 / 3)
+    assert estimate_selectivity([[("col1", "=", 50)]], {}, column_types) == pytest.approx(0.005)
+
+    other_index = {"stats": {"col1": {"null_frac": 0, "distinct": 1, "width": 6}}}
+    # col1: (100 * 2 + 300 * 6) / 400 = 5, col2 has no statistics
+    assert estimate_row_width([(100, index), (300, other_index)], ["col1", "col2"]) == 15
+
+
 def test_object_manager_object_filtering_end_to_end(local_engine_empty):
     objects = _prepare_object_filtering_dataset()
     obj_1, obj_2, obj_3, obj_4 = objects
@@ -741,3 +1225,77 @@ def test_sync_object_mounts(pg_repo_local, clean_minio):
     pg_repo_local.engine.sync_object_mounts()
     assert object_id in pg_repo_local.objects.get_downloaded_objects()
     assert object_id in pg_repo_local.engine.get_all_tables(SPLITGRAPH_META_SCHEMA)
+
+
+def test_object_catalog(local_engine_empty, pg_repo_remote, clean_minio):
+    pg_repo_local = _setup_object_cache_test(pg_repo_remote)
+
+    object_manager = pg_repo_local.objects
+    engine = object_manager.object_engine
+    fruits_v3 = pg_repo_local.images["latest"].get_table("fruits")
+
+    def _get_catalog():
+        return dict(
+            engine.run_sql(
+                select("object_catalog", "object_id,size"), return_shape=ResultShape.MANY_MANY
+            )
+        )
+
+    def _list_object_files():
+        return engine.run_sql(
+            "SELECT splitgraph_api.list_objects()", return_shape=ResultShape.ONE_ONE
+        )
+
+    assert _get_catalog() == {}
+
+    # Downloaded objects get added to the catalog with their on-disk sizes
+    with object_manager.ensure_objects(fruits_v3):
+        catalog = _get_catalog()
+        assert sorted(catalog) == sorted(fruits_v3.objects) == sorted(_list_object_files())
+        assert catalog == {o: engine.run_api_call("get_object_size", o) for o in fruits_v3.objects}
+        assert object_manager.get_total_object_size() == sum(catalog.values())
+        assert object_manager.get_downloaded_objects(limit_to=[fruits_v3.objects[0]]) == [
+            fruits_v3.objects[0]
+        ]
+
+    # Deleted objects get removed from it.
+    object_manager.run_eviction(keep_objects=[], required_space=None)
+    assert _get_catalog() == {}
+    assert _list_object_files() == []
+
+    # If the catalog gets out of sync with the object storage, sync_object_mounts rebuilds it.
+    with object_manager.ensure_objects(fruits_v3):
+        pass
+    engine.run_sql("DELETE FROM splitgraph_meta.object_catalog")
+    assert object_manager.get_downloaded_objects() == []
+    engine.sync_object_mounts()
+    assert sorted(object_manager.get_downloaded_objects()) == sorted(fruits_v3.objects)
+    _assert_cache_occupancy(object_manager, 2)
+
+    # Catalog entries for given objects can be reconciled with the storage too.
+    engine.run_sql(
+        "DELETE FROM splitgraph_meta.object_catalog WHERE object_id = %s", (fruits_v3.objects[0],)
+    )
+    engine.run_sql("INSERT INTO splitgraph_meta.object_catalog VALUES ('o_does_not_exist', 42)",)
+    engine.reconcile_object_catalog([fruits_v3.objects[0], "o_does_not_exist"])
+    assert sorted(_get_catalog()) == sorted(fruits_v3.objects)
+
+
+def test_object_cleanup_rolled_back(pg_repo_local):
+    # Object files aren't transactional: if the transaction that created an object gets rolled
+    # back, the files stay behind without a catalog entry. cleanup() still deletes them.
+    engine = pg_repo_local.engine
+    object_manager = pg_repo_local.objects
+    pg_repo_local.commit_engines()
+
+    object_id = "o" + "0" * 62
+    engine.store_object(object_id, SQL("SELECT 1 AS key"), [TableColumn(1, "key", "integer", True)])
+    engine.rollback()
+    assert object_id in engine.run_api_call("list_objects")
+    assert object_id not in object_manager.get_downloaded_objects()
+
+    object_manager.cleanup()
+    assert object_id not in engine.run_api_call("list_objects")
+    assert sorted(engine.run_api_call("list_objects")) == sorted(
+        object_manager.get_downloaded_objects()
+    )
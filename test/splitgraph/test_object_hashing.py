@@ -42,6 +42,19 @@ def test_digest_sum():
     ).hex() == HASH_SUM
 
 
+def test_digest_bulk_sum():
+    assert Digest.from_memoryviews(TEST_ROW_HASHES_BYTES).hex() == HASH_SUM
+    assert Digest.from_memoryviews(map(memoryview, TEST_ROW_HASHES_BYTES)).hex() == HASH_SUM
+    assert Digest.from_memoryviews([]).hex() == Digest.empty().hex()
+
+    # Check the wraparound with more digests than fit in one batch
+    digests = TEST_ROW_HASHES_BYTES * 10000
+    assert (
+        Digest.from_memoryviews(digests).hex()
+        == _sum_digests(map(Digest.from_memoryview, digests)).hex()
+    )
+
+
 def test_digest_subtraction():
     sub_sum = _sum_digests(map(Digest.from_hex, TEST_ROW_HASHES[:5] + TEST_ROW_HASHES[6:]))
     assert (Digest.from_hex(HASH_SUM) - Digest.from_hex(TEST_ROW_HASHES[5])).hex() == sub_sum.hex()